@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Minimal stdio MCP server standing in for task-master-mcp in offline tests.
+
+It answers 'initialize' and paged 'tools/list' requests with the tools of
+DEFAULT_MCP_ALWAYS_ALLOW, ignores notifications and replies to anything else with
+a JSON-RPC "method not found" error. Startup can be delayed and tools left out to
+exercise the installer's MCP probe; every option can also come from the
+environment (FAKE_MCP_*), which is how the fake npx from bench/fake_tools.py
+passes them through when it runs 'npx -y task-master-mcp':
+
+    python bench/fake_mcp_server.py --startup-seconds 0.5 --omit parse_prd
+    python install_taskmaster.py probe --runs 20
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from install_taskmaster import DEFAULT_MCP_ALWAYS_ALLOW
+
+def parse_args(argv=None):
+    env = os.environ.get
+    parser = argparse.ArgumentParser(description="Fake task-master-mcp server speaking MCP over stdio.")
+    parser.add_argument("--startup-seconds", type=float, default=float(env("FAKE_MCP_STARTUP_SECONDS", "0")),
+                        help="Delay before the server reads its first request.")
+    parser.add_argument("--omit", action="append", default=[name for name in env("FAKE_MCP_OMIT", "").split(",") if name],
+                        metavar="TOOL", help="Leave TOOL out of the tool list (repeatable).")
+    parser.add_argument("--page-size", type=int, default=int(env("FAKE_MCP_PAGE_SIZE", "0")),
+                        help="Tools per tools/list page; 0 sends them all at once.")
+    parser.add_argument("--noise", action="store_true", default=bool(env("FAKE_MCP_NOISE")),
+                        help="Print a non-JSON log line to stdout before every answer, like a chatty server.")
+    parser.add_argument("--exit-after", default=env("FAKE_MCP_EXIT_AFTER"), metavar="METHOD",
+                        help="Exit without answering the first METHOD request (e.g. tools/list).")
+    return parser.parse_args(argv)
+
+def tool(name):
+    return {"name": name, "description": f"Fake {name}.", "inputSchema": {"type": "object", "properties": {}}}
+
+def main(argv=None):
+    args = parse_args(argv)
+    time.sleep(args.startup_seconds)
+    tools = [tool(name) for name in DEFAULT_MCP_ALWAYS_ALLOW if name not in args.omit]
+    for line in sys.stdin:
+        try:
+            request = json.loads(line)
+        except ValueError:
+            continue
+        method, request_id = request.get("method"), request.get("id")
+        if request_id is None:
+            continue # Notification
+        if method == args.exit_after:
+            return 1
+        if method == "initialize":
+            reply = {"result": {"protocolVersion": request.get("params", {}).get("protocolVersion", "2024-11-05"),
+                                "capabilities": {"tools": {}},
+                                "serverInfo": {"name": "fake-task-master-mcp", "version": "0.0.0"}}}
+        elif method == "tools/list":
+            start = int(request.get("params", {}).get("cursor") or 0)
+            end = start + args.page_size if args.page_size else len(tools)
+            reply = {"result": {"tools": tools[start:end]}}
+            if end < len(tools):
+                reply["result"]["nextCursor"] = str(end)
+        else:
+            reply = {"error": {"code": -32601, "message": f"Method not found: {method}"}}
+        if args.noise:
+            print(f"[fake-task-master-mcp] handling {method}")
+        print(json.dumps({"jsonrpc": "2.0", "id": request_id, **reply}), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
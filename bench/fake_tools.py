@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Fake npm, npx and task-master executables for running the installer offline.
+
+install_fake_tools(bin_dir) writes them into bin_dir; put it first on PATH.
+They only do what install_taskmaster.py relies on:
+
+* npm install [-g] task-master-ai[@range] writes node_modules/task-master-ai/package.json
+  (under $npm_config_prefix/lib for -g) so the on-disk version probe finds it next time.
+  With --cache DIR it records the package in DIR; with --offline it only installs what is recorded there.
+* task-master init (also via npx) creates tasks/ and scripts/ in the working directory.
+* npx -y task-master-mcp runs bench/fake_mcp_server.py (configured with FAKE_MCP_*).
+
+Delays come from FAKE_NPM_SECONDS and FAKE_INIT_SECONDS; FAKE_TASKMASTER_VERSION sets
+the version npm "installs". Every invocation is appended to $FAKE_TOOLS_LOG if set.
+"""
+import os
+import stat
+import sys
+from pathlib import Path
+
+_COMMON = r'''
+import json, os, sys, time
+from pathlib import Path
+
+def log(tool):
+    if os.environ.get("FAKE_TOOLS_LOG"):
+        with open(os.environ["FAKE_TOOLS_LOG"], "a", encoding="utf-8") as f:
+            f.write(json.dumps({"tool": tool, "argv": sys.argv[1:], "cwd": os.getcwd()}) + "\n")
+
+def task_master(args):
+    log("task-master")
+    if args[:1] != ["init"]:
+        print(f"fake task-master: unsupported command {args}", file=sys.stderr)
+        return 1
+    time.sleep(float(os.environ.get("FAKE_INIT_SECONDS", "0")))
+    for name in ("tasks", "scripts"):
+        Path(name).mkdir(exist_ok=True)
+    print("fake task-master: project initialized")
+    return 0
+'''
+
+_NPM = _COMMON + r'''
+def main(args):
+    log("npm")
+    if args[:1] != ["install"]:
+        print(f"fake npm: unsupported command {args}", file=sys.stderr)
+        return 1
+    time.sleep(float(os.environ.get("FAKE_NPM_SECONDS", "0")))
+    options, specs, rest = {}, [], iter(args[1:])
+    for arg in rest:
+        if arg in ("--cache", "--prefix"):
+            options[arg] = next(rest, "")
+        elif arg.startswith("-"):
+            options[arg] = True
+        else:
+            specs.append(arg)
+    if "-g" in options:
+        prefix = options.get("--prefix") or os.environ.get("npm_config_prefix") or os.environ.get("NPM_CONFIG_PREFIX")
+        if not prefix:
+            print("fake npm: set npm_config_prefix for global installs", file=sys.stderr)
+            return 1
+        root = Path(prefix) / ("node_modules" if os.name == "nt" else "lib/node_modules")
+    else:
+        root = Path("node_modules")
+    cache = Path(options["--cache"]) if "--cache" in options else None
+    lock = {"name": Path.cwd().name, "lockfileVersion": 3, "packages": {"": {}}}
+    for spec in specs:
+        name = spec.rsplit("@", 1)[0] if spec.rfind("@") > 0 else spec
+        version = os.environ.get("FAKE_TASKMASTER_VERSION", "0.10.1")
+        cached = cache / "_cacache" / "fake-index" / f"{name}.json" if cache else None
+        if "--offline" in options:
+            if cached is None or not cached.is_file():
+                print(f"npm ERR! code ENOTCACHED: {name} is not in the cache and --offline is set", file=sys.stderr)
+                return 1
+            version = json.loads(cached.read_text(encoding="utf-8"))["version"]
+        elif cached is not None:
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            cached.write_text(json.dumps({"version": version}), encoding="utf-8")
+            (cached.parent / f"{name}-{version}.tgz").write_bytes(os.urandom(1024))
+        package_dir = root / name
+        package_dir.mkdir(parents=True, exist_ok=True)
+        (package_dir / "package.json").write_text(json.dumps({"name": name, "version": version}), encoding="utf-8")
+        lock["packages"][f"node_modules/{name}"] = {"version": version}
+        print(f"added 1 package: {name}@{version}")
+    if "-g" not in options:
+        Path("package-lock.json").write_text(json.dumps(lock, indent=2), encoding="utf-8")
+    return 0
+
+sys.exit(main(sys.argv[1:]))
+'''
+
+_NPX = _COMMON + r'''
+args = [a for a in sys.argv[1:] if a not in ("-y", "--yes")]
+if args[:1] == ["task-master"]:
+    sys.exit(task_master(args[1:]))
+if args[:1] == ["task-master-mcp"]:
+    log("npx")
+    os.execv(sys.executable, [sys.executable, FAKE_MCP_SERVER] + args[1:])
+log("npx")
+print(f"fake npx: unsupported command {args}", file=sys.stderr)
+sys.exit(1)
+'''
+
+_TASK_MASTER = _COMMON + r'''
+sys.exit(task_master(sys.argv[1:]))
+'''
+
+FAKE_MCP_SERVER = Path(__file__).resolve().parent / "fake_mcp_server.py"
+TOOLS = {"npm": _NPM, "npx": _NPX, "task-master": _TASK_MASTER}
+
+def install_fake_tools(bin_dir, python=sys.executable):
+    """Writes the fake executables into bin_dir (plus .cmd shims on Windows) and returns bin_dir."""
+    bin_dir = Path(bin_dir)
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    for name, source in TOOLS.items():
+        script = bin_dir / (name + ".py" if os.name == "nt" else name)
+        script.write_text(f"#!{python}\nFAKE_MCP_SERVER = {str(FAKE_MCP_SERVER)!r}\n" + source, encoding="utf-8")
+        if os.name == "nt":
+            (bin_dir / f"{name}.cmd").write_text(f'@"{python}" "%~dp0{name}.py" %*\r\n', encoding="utf-8")
+        else:
+            script.chmod(script.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return bin_dir
+
+
+if __name__ == "__main__":
+    target = install_fake_tools(sys.argv[1] if len(sys.argv) > 1 else "fakebin")
+    print(f"Fake npm/npx/task-master written to {target}; prepend it to PATH.")
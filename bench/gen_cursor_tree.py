@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Generates synthetic legacy .cursor trees for migration benchmarks.
+
+The mix resembles real projects: .mdc rule files (including cursor_rules.mdc),
+Markdown and text docs, JSON/JS/Python/YAML sources spread over nested
+directories, and a share of files with no Cursor references at all. Output is
+deterministic for a given seed.
+
+    python bench/gen_cursor_tree.py /tmp/project --files 50000
+"""
+import argparse
+import random
+from pathlib import Path
+
+EXTENSIONS = [(".mdc", 20), (".md", 30), (".txt", 10), (".json", 10), (".js", 10), (".py", 5),
+              (".yaml", 5), (".png", 5), (".bin", 5)] # (extension, weight); the last two are never rewritten
+SNIPPETS = [
+    "See cursor/rules/{name}.mdc for details.\n",
+    "Cursor loads cursor_rules.mdc before anything else.\n",
+    "Made with [Cursor](https://www.cursor.so/).\n",
+    "Use cursor_{name} helpers from the shared module.\n",
+    "Plain line without any editor references, number {n}.\n",
+    "Another neutral line that the migration must leave alone ({n}).\n",
+]
+FILES_PER_DIR = 40
+
+def generate_cursor_tree(project_dir, files, seed=0, plain_share=0.3, max_bytes=4096):
+    """Writes a .cursor tree with `files` files under project_dir and returns its total size in bytes.
+
+    plain_share is the fraction of text files that contain no Cursor references.
+    """
+    rng = random.Random(seed)
+    cursor_dir = Path(project_dir) / ".cursor"
+    (cursor_dir / "rules").mkdir(parents=True, exist_ok=True)
+    extensions = [ext for ext, weight in EXTENSIONS for _ in range(weight)]
+    total = 0
+    for index in range(files):
+        if index == 0:
+            path = cursor_dir / "rules" / "cursor_rules.mdc"
+        else:
+            ext = rng.choice(extensions)
+            if ext == ".mdc":
+                directory = cursor_dir / "rules" / f"group{index // FILES_PER_DIR % 50:02d}"
+            else:
+                directory = cursor_dir / f"area{index // (FILES_PER_DIR * 10):03d}" / f"dir{index // FILES_PER_DIR:05d}"
+            path = directory / f"file{index:06d}{ext}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        size = rng.randint(200, max_bytes)
+        if path.suffix in (".png", ".bin"):
+            data = rng.randbytes(size) if hasattr(rng, "randbytes") else bytes(rng.getrandbits(8) for _ in range(size))
+        else:
+            pool = SNIPPETS[4:] if rng.random() < plain_share else SNIPPETS
+            parts, length = [], 0
+            while length < size:
+                part = rng.choice(pool).format(name=f"rule{index}", n=length)
+                parts.append(part)
+                length += len(part)
+            data = "".join(parts).encode('utf-8')
+        path.write_bytes(data)
+        total += len(data)
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic .cursor tree for migration benchmarks.")
+    parser.add_argument("project_dir", type=Path)
+    parser.add_argument("--files", type=int, default=1000, help="Number of files (e.g. 10 to 50000).")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    total = generate_cursor_tree(args.project_dir, args.files, args.seed)
+    print(f"Wrote {args.files} files ({total / 1_000_000:.1f} MB) to {args.project_dir / '.cursor'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Micro-benchmark of the .cursor migration rewrite: the table-driven RewriteEngine
+against the five sequential re.sub passes it replaced.
+
+Every case is timed as _migrate_file sees it (read, rewrite, write) on a fresh
+copy of the same file, for sizes from a few KB up to multi-MB files that take
+the chunked path, with and without Cursor references. Before timing, the outputs
+of both implementations are compared, the engine's str.replace strategy is
+checked against its combined pattern, and the chunked rewriter against the
+whole-text one at chunk sizes down to one character. Exits 1 on any mismatch.
+
+    python bench/rewrite_bench.py
+    python bench/rewrite_bench.py --sizes 4,1024,32768 --runs 5
+"""
+import argparse
+import hashlib
+import os
+import random
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from gen_cursor_tree import SNIPPETS
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import install_taskmaster
+from install_taskmaster import RewriteEngine, MIGRATION_REWRITE_RULES, _migrate_file
+
+def legacy_rewrite_file(file_path):
+    """The previous _migrate_file body: whole-file read and hash, five re.sub passes, in-place write."""
+    with open(file_path, "rb") as f:
+        raw = f.read()
+    digest = hashlib.sha256(raw).hexdigest()
+    content = raw.decode('utf-8', errors='ignore').replace("\r\n", "\n").replace("\r", "\n")
+    original_content = content
+    content = re.sub(r"\.mdc", ".md", content)
+    content = re.sub(r"cursor/", "roo/", content)
+    content = re.sub(r"Cursor", "Roo Code", content)
+    content = re.sub(r"cursor_", "roo_", content)
+    content = re.sub(r"\[Cursor\]\(https://www.cursor.so/\)", "[Roo Code](https://www.roocode.com/)", content)
+    if content != original_content:
+        data = content.replace("\n", os.linesep).encode('utf-8')
+        with open(file_path, "wb") as f:
+            f.write(data)
+        digest = hashlib.sha256(data).hexdigest()
+    os.stat(file_path)
+    return digest
+
+def engine_rewrite_file(file_path):
+    _migrate_file(str(file_path), None, [])
+
+def make_text(size, plain, rng):
+    """About size bytes of migration-like text; plain=True uses only lines without Cursor references."""
+    pool = SNIPPETS[4:] if plain else SNIPPETS
+    parts, length = [], 0
+    while length < size:
+        part = rng.choice(pool).format(name=f"rule{length}", n=length)
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)
+
+def check_equivalence(rng):
+    """Returns a list of problems: outputs of the engine vs the legacy passes, and chunked vs whole-text."""
+    problems = []
+    engine = RewriteEngine(MIGRATION_REWRITE_RULES)
+    dense = "".join(rng.choice(["Cursor", "cursor/", "cursor_x", ".mdc", "[Cursor](https://www.cursor.so/)",
+                                "cursorcursor/", ".mdcursor_", "x", "\n", "\r\n", "é"]) for _ in range(3000))
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, text in (("dense", dense), ("snippets", make_text(20000, False, rng))):
+            legacy_path, engine_path = Path(tmp) / f"{name}-legacy.md", Path(tmp) / f"{name}-engine.md"
+            for path in (legacy_path, engine_path):
+                path.write_bytes(text.encode('utf-8'))
+            legacy_rewrite_file(legacy_path)
+            engine_rewrite_file(engine_path)
+            if legacy_path.read_bytes() != engine_path.read_bytes():
+                problems.append(f"{name}: engine output differs from the five-pass rewrite")
+    whole, changed = engine.rewrite(dense)
+    engine.sequential = False
+    if engine.rewrite(dense) != (whole, changed):
+        problems.append("str.replace strategy differs from the combined pattern")
+    engine.sequential = True
+    for chunk_size in list(range(1, 9)) + [64, 1000]:
+        chunks = [dense[i:i + chunk_size] for i in range(0, len(dense), chunk_size)]
+        if "".join(engine.rewrite_chunks(chunks)) != whole or engine.changed != changed:
+            problems.append(f"chunk size {chunk_size}: chunked rewrite differs from whole-text rewrite")
+    return problems
+
+def time_case(func, source, work_dir, runs):
+    """Median seconds of func on a fresh copy of source."""
+    samples = []
+    for run in range(runs):
+        target = work_dir / f"run{run}{source.suffix}"
+        shutil.copyfile(source, target)
+        started = time.perf_counter()
+        func(target)
+        samples.append(time.perf_counter() - started)
+        target.unlink()
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the single-pass migration rewrite with the five-pass one.")
+    parser.add_argument("--sizes", default="4,64,1024,16384", help="Comma-separated file sizes in KB.")
+    parser.add_argument("--runs", type=int, default=5, help="Repetitions per case; the median is reported.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    problems = check_equivalence(rng)
+    for problem in problems:
+        print(f"MISMATCH: {problem}")
+    if problems:
+        return 1
+    print(f"Outputs match (chunk size {install_taskmaster.MIGRATION_CHUNK_SIZE // 1024} KB for large files).\n")
+
+    print(f"{'CASE':<22}{'LEGACY ms':>12}{'ENGINE ms':>12}{'SPEEDUP':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        for size_kb in (int(size) for size in args.sizes.split(",")):
+            for plain in (False, True):
+                source = work_dir / f"source-{size_kb}-{plain}.md"
+                source.write_bytes(make_text(size_kb * 1024, plain, rng).encode('utf-8'))
+                legacy = time_case(legacy_rewrite_file, source, work_dir, args.runs)
+                engine = time_case(engine_rewrite_file, source, work_dir, args.runs)
+                label = f"{size_kb} KB, {'no matches' if plain else 'matches'}"
+                print(f"{label:<22}{legacy * 1000:>12.2f}{engine * 1000:>12.2f}{legacy / engine:>9.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""End-to-end benchmark for install_taskmaster.py that runs entirely offline.
+
+Each scenario runs the real installer in a subprocess against local stand-ins:
+bench/stub_server.py instead of raw.githubusercontent.com, the fake npm/npx/
+task-master from bench/fake_tools.py first on PATH, a throwaway HOME (so the MCP
+settings file is private) and synthetic .cursor trees from bench/gen_cursor_tree.py.
+Prompts are answered from seeded stdin. Per-phase timings are the stage spans of
+the installer's --profile trace; the median over --runs is compared with a
+stored baseline and the script exits 1 if a phase regressed past the threshold.
+
+    python bench/run_bench.py                          # compare with bench/baseline.json
+    python bench/run_bench.py --save-baseline          # record a new baseline on this machine
+    python bench/run_bench.py --sizes 10,50000 --runs 1 --latency-ms 120 --error-rate 0.1
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from fake_tools import install_fake_tools
+from gen_cursor_tree import generate_cursor_tree
+from stub_server import StubServer, build_files
+
+BENCH_DIR = Path(__file__).resolve().parent
+INSTALLER = BENCH_DIR.parent / "install_taskmaster.py"
+DEFAULT_BASELINE = BENCH_DIR / "baseline.json"
+SCENARIOS = ("install-cold", "install-warm", "fleet")
+
+# Seeded answers for the interactive prompts, in the order the installer asks them:
+# local install, do not configure MCP, then "no" to anything further.
+INSTALL_ANSWERS = "l\nn\nn\nn\n"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark install_taskmaster.py against local stand-ins.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"Comma-separated subset of: {', '.join(SCENARIOS)}.")
+    parser.add_argument("--sizes", default="10,1000,10000",
+                        help="Comma-separated .cursor tree sizes (files) for the install scenarios.")
+    parser.add_argument("--runs", type=int, default=3, help="Repetitions per scenario; the median is reported.")
+    parser.add_argument("--fleet-projects", type=int, default=8, help="Projects in the fleet scenario.")
+    parser.add_argument("--fleet-files", type=int, default=200, help=".cursor files per fleet project.")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Stub server latency per request.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub server requests that fail with 503.")
+    parser.add_argument("--rule-kb", type=int, default=8, help="Size of each served rule file.")
+    parser.add_argument("--no-bundle", action="store_true",
+                        help="Serve only the manifest and plain files, so the installer downloads them one by one.")
+    parser.add_argument("--npm-seconds", type=float, default=0.5, help="Time the fake 'npm install' takes.")
+    parser.add_argument("--init-seconds", type=float, default=0.2, help="Time the fake 'task-master init' takes.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--installer-args", default="", help="Extra options passed to every installer run.")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Write this run's timings as the new baseline.")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed slowdown per phase as a fraction of the baseline (default: 0.25).")
+    parser.add_argument("--min-delta-ms", type=float, default=50,
+                        help="Ignore slowdowns smaller than this, so tiny phases do not flap (default: 50).")
+    parser.add_argument("--json-out", type=Path, default=None, help="Also write the measured timings here.")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory for inspection.")
+    args = parser.parse_args()
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    args.sizes = [int(size) for size in args.sizes.split(",") if size]
+    return args
+
+class Sandbox:
+    """A scratch HOME, npm prefix, cache and fake-tool PATH for one installer run."""
+
+    def __init__(self, root, args):
+        self.root = Path(root)
+        self.home = self.root / "home"
+        self.cache = self.root / "cache"
+        self.npm_prefix = self.root / "npm-global"
+        for path in (self.home, self.cache, self.npm_prefix):
+            path.mkdir(parents=True, exist_ok=True)
+        self.bin_dir = install_fake_tools(self.root / "bin")
+        self.env = dict(os.environ)
+        self.env.update({
+            "PATH": str(self.bin_dir) + os.pathsep + os.environ.get("PATH", ""),
+            "HOME": str(self.home),
+            "USERPROFILE": str(self.home),
+            "APPDATA": str(self.home / "AppData" / "Roaming"),
+            "npm_config_prefix": str(self.npm_prefix),
+            "npm_config_userconfig": str(self.home / ".npmrc"),
+            "FAKE_NPM_SECONDS": str(args.npm_seconds),
+            "FAKE_INIT_SECONDS": str(args.init_seconds),
+            "PYTHONUNBUFFERED": "1",
+        })
+
+    def run_installer(self, cwd, installer_args, stdin_text, base_url, trace_path, extra_args):
+        """Runs the installer and returns (wall seconds, {phase: seconds}) from its trace."""
+        command = [sys.executable, str(INSTALLER)] + installer_args + [
+            "--rules-source", base_url, "--cache-dir", str(self.cache), "--profile", str(trace_path)] + extra_args
+        started = time.perf_counter()
+        process = subprocess.run(command, cwd=cwd, env=self.env, input=stdin_text, text=True,
+                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        wall = time.perf_counter() - started
+        if process.returncode != 0:
+            tail = "\n".join(process.stdout.splitlines()[-30:])
+            raise RuntimeError(f"Installer exited with {process.returncode} in {cwd}:\n{tail}")
+        return wall, phases_from_trace(trace_path)
+
+def phases_from_trace(trace_path):
+    """Sums stage span durations per stage name (fleet projects are added up)."""
+    with open(trace_path, 'r', encoding='utf-8') as f:
+        events = json.load(f)["traceEvents"]
+    phases = {}
+    for event in events:
+        if event.get("ph") == "X" and event.get("cat") == "stage":
+            phases[event["name"]] = phases.get(event["name"], 0.0) + event["dur"] / 1_000_000
+    return phases
+
+def run_install_scenarios(args, base_url, scratch):
+    """Yields (scenario label, wall seconds, phases) for cold and warm installs of each tree size."""
+    extra_args = args.installer_args.split()
+    for size in args.sizes:
+        for run in range(args.runs):
+            sandbox = Sandbox(scratch / f"install-{size}-{run}", args)
+            project = sandbox.root / "project"
+            project.mkdir()
+            generate_cursor_tree(project, size, seed=args.seed)
+            if "install-cold" in args.scenarios:
+                wall, phases = sandbox.run_installer(project, ["install"], INSTALL_ANSWERS, base_url,
+                                                     sandbox.root / "cold.json", extra_args)
+                yield f"install-cold[files={size}]", wall, phases
+            elif "install-warm" in args.scenarios:
+                sandbox.run_installer(project, ["install"], INSTALL_ANSWERS, base_url, sandbox.root / "cold.json", extra_args)
+            if "install-warm" in args.scenarios:
+                # Same project, cache and npm prefix again, with a fresh .cursor to migrate
+                generate_cursor_tree(project, size, seed=args.seed + 1)
+                wall, phases = sandbox.run_installer(project, ["install"], INSTALL_ANSWERS, base_url,
+                                                     sandbox.root / "warm.json", extra_args)
+                yield f"install-warm[files={size}]", wall, phases
+            if not args.keep:
+                shutil.rmtree(sandbox.root, ignore_errors=True)
+
+def run_fleet_scenario(args, base_url, scratch):
+    """Yields (scenario label, wall seconds, phases) for provisioning a fleet of projects."""
+    extra_args = args.installer_args.split()
+    for run in range(args.runs):
+        sandbox = Sandbox(scratch / f"fleet-{run}", args)
+        projects = []
+        for index in range(args.fleet_projects):
+            project = sandbox.root / f"project{index:03d}"
+            project.mkdir()
+            generate_cursor_tree(project, args.fleet_files, seed=args.seed + index)
+            projects.append(project.name)
+        manifest = sandbox.root / "fleet.json"
+        manifest.write_text(json.dumps({"defaults": {"install": "global", "init": "global", "configure_mcp": True},
+                                        "projects": projects}), encoding='utf-8')
+        wall, phases = sandbox.run_installer(sandbox.root, ["fleet", str(manifest)], "", base_url,
+                                             sandbox.root / "fleet-trace.json", extra_args)
+        yield f"fleet[projects={args.fleet_projects},files={args.fleet_files}]", wall, phases
+        if not args.keep:
+            shutil.rmtree(sandbox.root, ignore_errors=True)
+
+def collect(samples):
+    """Turns (label, wall, phases) samples into {"label/phase": median seconds}."""
+    grouped = {}
+    for label, wall, phases in samples:
+        grouped.setdefault(f"{label}/total", []).append(wall)
+        for phase, seconds in phases.items():
+            grouped.setdefault(f"{label}/{phase}", []).append(seconds)
+    return {key: statistics.median(values) for key, values in grouped.items()}
+
+def compare(results, baseline, threshold, min_delta):
+    """Prints current vs baseline per phase and returns the list of regressed phases."""
+    regressions = []
+    width = max(len("PHASE"), *(len(key) for key in results))
+    print(f"\n{'PHASE':<{width}}  {'BASELINE ms':>12}  {'CURRENT ms':>12}  {'CHANGE':>8}")
+    print("-" * (width + 40))
+    for key, seconds in results.items():
+        base = baseline.get(key)
+        if base is None:
+            print(f"{key:<{width}}  {'-':>12}  {seconds * 1000:>12.1f}  {'new':>8}")
+            continue
+        change = (seconds - base) / base if base else 0.0
+        regressed = seconds > base * (1 + threshold) and (seconds - base) * 1000 > min_delta
+        marker = "  REGRESSED" if regressed else ""
+        print(f"{key:<{width}}  {base * 1000:>12.1f}  {seconds * 1000:>12.1f}  {change:>+8.0%}{marker}")
+        if regressed:
+            regressions.append(key)
+    return regressions
+
+def main():
+    args = parse_args()
+    scratch = Path(tempfile.mkdtemp(prefix="roo-taskmaster-bench-"))
+    started = time.perf_counter()
+    samples = []
+    try:
+        with StubServer(build_files(args.rule_kb, bundle=not args.no_bundle), args.latency_ms, args.error_rate, seed=args.seed) as server:
+            print(f"Stub server at {server.base_url} (latency {args.latency_ms} ms, error rate {args.error_rate:.0%})")
+            if {"install-cold", "install-warm"} & set(args.scenarios):
+                for sample in run_install_scenarios(args, server.base_url, scratch):
+                    print(f"  {sample[0]}: {sample[1]:.2f}s")
+                    samples.append(sample)
+            if "fleet" in args.scenarios:
+                for sample in run_fleet_scenario(args, server.base_url, scratch):
+                    print(f"  {sample[0]}: {sample[1]:.2f}s")
+                    samples.append(sample)
+            print(f"Stub server requests: {server.stats}")
+    except RuntimeError as e:
+        print(f"Benchmark run failed: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if args.keep:
+            print(f"Scratch files kept in {scratch}")
+        else:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    results = collect(samples)
+    report = {"machine": {"python": platform.python_version(), "system": platform.system(), "cpus": os.cpu_count()},
+              "settings": {key: getattr(args, key) for key in ("sizes", "runs", "fleet_projects", "fleet_files",
+                                                              "latency_ms", "error_rate", "rule_kb", "no_bundle",
+                                                              "npm_seconds", "init_seconds", "seed")},
+              "phases": results}
+    if args.json_out:
+        args.json_out.write_text(json.dumps(report, indent=2) + "\n", encoding='utf-8')
+
+    baseline = {}
+    if args.baseline.exists():
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+        baseline = stored.get("phases", {})
+        if stored.get("settings") != report["settings"]:
+            print(f"Note: {args.baseline} was recorded with different settings; only matching phases are compared.")
+    regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+    print(f"\nBenchmark finished in {time.perf_counter() - started:.1f}s.")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n", encoding='utf-8')
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if not baseline:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one.")
+        return 0
+    if regressions:
+        print(f"{len(regressions)} phase(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print(f"No phase regressed by more than {args.threshold:.0%}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Local stand-in for raw.githubusercontent.com serving the published modes and rules.
+
+It serves the rules bundle, its manifest and the plain .roomodes and .roo/rules-*
+files (--no-bundle drops the bundle to exercise the installer's per-file fallback).
+
+Responses can be delayed and made to fail at a seeded rate, and ETag/If-None-Match
+is honoured so the installer's conditional requests get 304s like they would from
+GitHub. Run it directly to point a manual install at it:
+
+    python bench/stub_server.py --port 8765 --latency-ms 80 --error-rate 0.1
+    python install_taskmaster.py --rules-source http://127.0.0.1:8765/
+"""
+import argparse
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from install_taskmaster import RULES_BUNDLE_NAME, RULES_MANIFEST_NAME, build_rules_bundle, build_rules_manifest
+
+MODES = ['tm-architect', 'tm-boomerang', 'tm-code', 'tm-debug', 'tm-docs', 'tm-planner', 'tm-test', 'tm-ux'] # As shipped
+
+def build_files(rule_kb=8, bundle=True):
+    """Returns {url path: bytes}: a .roomodes and an about rule_kb KB rules.md per mode, plus manifest and bundle."""
+    modes = {"customModes": [{"slug": mode, "name": mode.title(), "roleDefinition": f"Synthetic {mode} mode.",
+                              "groups": ["read", "edit"]} for mode in MODES]}
+    rule_files = {".roomodes": json.dumps(modes, indent=2).encode('utf-8')}
+    for mode in MODES:
+        line = f"- Rule for the {mode} mode: keep changes small and explain them.\n"
+        body = f"# {mode} rules\n\n" + line * max(1, rule_kb * 1024 // len(line))
+        rule_files[f".roo/rules-{mode}/rules.md"] = body.encode('utf-8')
+    files = {"/" + path: data for path, data in rule_files.items()}
+    files["/" + RULES_MANIFEST_NAME] = json.dumps(build_rules_manifest(rule_files), indent=2).encode('utf-8')
+    if bundle:
+        files["/" + RULES_BUNDLE_NAME] = build_rules_bundle(rule_files)
+    return files
+
+class StubServer:
+    """Threaded HTTP server with configurable latency and error injection.
+
+    error_rate is the fraction of requests answered with error_status; the random
+    sequence is seeded so a benchmark run sees the same failures every time.
+    """
+
+    def __init__(self, files=None, latency_ms=0, error_rate=0.0, error_status=503, seed=0, host="127.0.0.1", port=0):
+        self.files = files if files is not None else build_files()
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "200": 0, "304": 0, "404": 0, "errors": 0}
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # Keep-alive, like GitHub
+
+            def do_GET(self):
+                with server.lock:
+                    server.stats["requests"] += 1
+                    fail = server.error_rate and server.random.random() < server.error_rate
+                if server.latency_ms:
+                    time.sleep(server.latency_ms / 1000)
+                body = server.files.get(self.path.split("?", 1)[0])
+                if fail:
+                    self._reply(server.error_status, b"injected error\n", "errors")
+                elif body is None:
+                    self._reply(404, b"not found\n", "404")
+                else:
+                    etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+                    if self.headers.get("If-None-Match") == etag:
+                        self._reply(304, b"", "304", etag)
+                    else:
+                        self._reply(200, body, "200", etag)
+
+            def _reply(self, status, body, counter, etag=None):
+                with server.lock:
+                    server.stats[counter] += 1
+                self.send_response(status)
+                if etag:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # Keep benchmark output readable
+
+        return Handler
+
+    def start(self):
+        """Serves in a background thread and returns self."""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="stub-server", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve synthetic Roo modes and rules for install_taskmaster.py.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay added to every response.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with --error-status.")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--rule-kb", type=int, default=8, help="Approximate size of each rule file.")
+    parser.add_argument("--no-bundle", action="store_true", help=f"Do not serve {RULES_BUNDLE_NAME} (per-file fallback).")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    server = StubServer(build_files(args.rule_kb, bundle=not args.no_bundle), args.latency_ms, args.error_rate,
+                        args.error_status, args.seed, args.host, args.port)
+    print(f"Serving {len(server.files)} files at {server.base_url} (Ctrl-C to stop)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"Requests: {server.stats}")
+
+
+if __name__ == "__main__":
+    main()
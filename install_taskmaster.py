@@ -1,15 +1,71 @@
 #!/usr/bin/env python3
+import argparse
+import codecs
+import collections
+import contextlib
+import errno
+import functools
+import hashlib
+import importlib
+import io
+import itertools
 import os
-import shutil
 import re
 import json
 import platform
-import subprocess
 import sys
-import urllib.request
-import urllib.error
+import threading
+import time
 from pathlib import Path
 
+class _LazyModule:
+    """Stands in for a module until one of its attributes is first used.
+
+    A plain module is then imported and replaces this stand-in's global name, so
+    later lookups cost nothing; for a package, only the listed submodule being
+    used is imported. Keeps quick, read-only commands like 'status' from paying
+    for the network and archive modules.
+    """
+
+    def __init__(self, name, *submodules):
+        self._name = name
+        self._submodules = submodules
+
+    def __getattr__(self, attr):
+        if f"{self._name}.{attr}" in self._submodules:
+            return importlib.import_module(f"{self._name}.{attr}")
+        module = importlib.import_module(self._name)
+        globals()[self._name] = module
+        return getattr(module, attr)
+
+concurrent = _LazyModule("concurrent", "concurrent.futures")
+ctypes = _LazyModule("ctypes")
+difflib = _LazyModule("difflib")
+gzip = _LazyModule("gzip")
+http = _LazyModule("http", "http.client")
+multiprocessing = _LazyModule("multiprocessing")
+queue = _LazyModule("queue")
+random = _LazyModule("random")
+select = _LazyModule("select")
+shutil = _LazyModule("shutil")
+signal = _LazyModule("signal")
+struct = _LazyModule("struct")
+subprocess = _LazyModule("subprocess")
+tarfile = _LazyModule("tarfile")
+tempfile = _LazyModule("tempfile")
+urllib = _LazyModule("urllib", "urllib.parse", "urllib.request", "urllib.error")
+zipfile = _LazyModule("zipfile")
+zlib = _LazyModule("zlib")
+
+try:
+    import fcntl # POSIX advisory locks
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt # Windows byte-range locks
+except ImportError:
+    msvcrt = None
+
 # --- Configuration ---
 GITHUB_BASE_URL = "https://raw.githubusercontent.com/neno-is-ooo/roo-taskmaster-patch/main/"
 MCP_SERVER_NAME = "taskmaster-ai"
@@ -33,7 +89,79 @@ DEFAULT_MCP_ALWAYS_ALLOW = [
     "validate_dependencies", "fix_dependencies", "complexity_report",
     "add_dependency", "remove_task", "parse_prd", "initialize_project" # Added missing ones
 ]
-ROO_MODES = ['architect', 'ask', 'boomerang', 'code', 'debug', 'test']
+TASKMASTER_PACKAGE = "task-master-ai"
+MCP_BIN_NAME = "task-master-mcp" # Bin of task-master-ai that starts the MCP server; also published as its own package
+MCP_LAUNCH_MODES = ("npx", "node") # How the MCP entry starts the server: npx -y, or resolved node + script paths
+MCP_COLD_START_TIMEOUT = 30 # Seconds to wait for a server to answer 'initialize' when measuring cold start
+MCP_PROTOCOL_VERSION = "2024-11-05" # Sent in the 'initialize' request
+MCP_INHERITED_ENV_POSIX = ("HOME", "LOGNAME", "PATH", "SHELL", "TERM", "USER") # What Roo passes a stdio server besides its env
+MCP_INHERITED_ENV_WINDOWS = ("APPDATA", "HOMEDRIVE", "HOMEPATH", "LOCALAPPDATA", "PATH", "PROCESSOR_ARCHITECTURE",
+                             "PROGRAMFILES", "SYSTEMDRIVE", "SYSTEMROOT", "TEMP", "USERNAME", "USERPROFILE")
+DEFAULT_TASKMASTER_VERSION = "*" # npm semver range an existing install must satisfy to skip 'npm install'
+RULES_MANIFEST_NAME = "rules-manifest.json" # Lists every rule file with its size and sha256
+RULES_BUNDLE_NAME = "rules-bundle.tar.gz" # .roomodes, .roo/rules-*/ and the manifest in one archive
+RULES_ZIP_BUNDLE_NAME = "rules-bundle.zip" # Same contents, for 'pack --format zip'
+RULES_ARCHIVE_SUFFIXES = (".tar.gz", ".tgz", ".tar", ".zip")
+OFFLINE_BUNDLE_NAME = "taskmaster-offline-bundle.tar.gz" # Default output of the 'bundle' command
+OFFLINE_MANIFEST_NAME = "offline-manifest.json" # First member of an offline bundle: pinned version and sha256 of every file
+OFFLINE_BUNDLE_VERSION = 1
+OFFLINE_RULES_DIR = "rules" # .roomodes and .roo/rules-* inside an offline bundle
+OFFLINE_NPM_CACHE_DIR = "npm-cache" # npm cache holding task-master-ai, its dependencies and their registry metadata
+OFFLINE_BUNDLES_DIR = "offline-bundles" # Unpacked bundles, under the cache directory, keyed by archive sha256
+OFFLINE_VERIFIED_MARKER = ".verified" # Written once every member of an unpacked bundle matched the manifest
+DOWNLOAD_TIMEOUT = 30 # Seconds per request
+DOWNLOAD_WORKERS = 8 # Upper bound on concurrent downloads (and pooled connections per host)
+DOWNLOAD_RETRIES = 3 # Extra attempts after timeouts, connection errors, 429 and 5xx responses
+DOWNLOAD_BACKOFF = 0.5 # Seconds before the first retry; doubles per attempt, with jitter
+DOWNLOAD_BACKOFF_MAX = 8 # Cap on a single backoff (also caps Retry-After)
+HEDGE_MIN_SAMPLES = 5 # Latency samples per host needed before a percentile hedge delay is trusted
+HEDGE_FALLBACK_DELAY = 2.0 # Seconds to wait before hedging when there are not enough samples yet
+CAPTURE_TAIL_LINES = 200 # Lines of each output stream kept in memory per captured command
+SUBPROCESS_KILL_GRACE = 5 # Seconds a timed-out command gets to exit after SIGTERM before it is killed
+FLEET_POLL_INTERVAL = 0.5 # Seconds between checks for crashed fleet workers while waiting for results
+DEFAULT_STAGE_TIMEOUTS = { # Seconds; interactive stages have none because they wait for the user
+    "install_package": 900, "global_install": 900, "install": 900,
+    "download_rules": 300, "stage_rules": 300,
+    "pin_mcp_launch": 900, # May npm-install the server, then starts it twice
+    "probe_mcp": 900, # Starts the server once per --probe-mcp run
+    "migrate_legacy": 1800, "cursor": 1800,
+    "init": 600,
+}
+HTTP_USER_AGENT = 'Mozilla/5.0' # Add a user-agent header to potentially avoid blocking
+CACHE_DIR_ENV_VAR = "ROO_TASKMASTER_CACHE_DIR" # Overrides the default cache location
+COMPACT_RULE_EXTENSIONS = (".md", ".txt") # Rule files --compact-rules rewrites; others are installed as published
+COMPACT_MIN_BLOCK_CHARS = 80 # Shorter blocks (headings, separators) are kept even when repeated
+COMPACT_MODE_FIELDS = ("roleDefinition", "whenToUse", "customInstructions") # .roomodes text sent with each mode
+BYTES_PER_TOKEN = 4 # Rough token estimate for English Markdown
+RULES_CHANGES_SHOWN = 20 # Changed mode/rule files listed after a sync; the rest are counted
+STORE_LINK_METHODS = ("reflink", "hardlink") # How --shared-store places files into projects (both fall back to a copy)
+FICLONE = 0x40049409 # Linux ioctl that clones a file's extents (btrfs, XFS, bcachefs)
+WATCH_DEBOUNCE = 0.1 # Seconds without further changes before 'watch' syncs a burst of edits
+WATCH_DEBOUNCE_MAX = 2.0 # A continuous stream of changes is synced at least this often
+WATCH_POLL_INTERVAL = 0.5 # Seconds between scans when inotify is not available (or with --poll)
+WATCH_REMOTE_INTERVAL = 30 # Seconds between conditional requests to a URL source (git sources are re-read as often)
+AUDIT_HASH_CACHE_NAME = "audit-hashes.json" # sha256 of audited rule files by path, size and mtime, under the cache directory
+AUDIT_WORKERS = 16 # Threads that scan directories and hash rule files during 'audit' (I/O bound)
+AUDIT_MAX_DEPTH = 6 # Directory levels below the root that 'audit' searches for projects
+AUDIT_SKIP_DIRS = ("node_modules", "__pycache__", "venv", "site-packages") # Never searched for projects (nor dot-directories)
+PROJECT_MCP_SETTINGS = ".roo/mcp.json" # Roo Code's project-level MCP servers, used instead of the global settings
+MCP_SETTINGS_LOCK_TIMEOUT = 15 # Seconds to wait for another writer of mcp_settings.json
+DEFAULT_PROFILE_PATH = "taskmaster-profile.json" # Trace written by a bare --profile
+MIGRATION_TEXT_EXTENSIONS = ('.md', '.txt', '.json', '.js', '.py', '.sh', '.yaml', '.yml') # Rewritten during .cursor migration
+MIGRATION_REWRITE_RULES = [ # (literal, replacement) applied to migrated text files in one pass; earlier entries win ties
+    (".mdc", ".md"),
+    ("Cursor", "Roo Code"),
+    ("cursor/", "roo/"),
+    ("cursor_", "roo_"),
+]
+MIGRATION_CHUNK_SIZE = 1 << 20 # Files larger than this are scanned and rewritten in chunks of this many bytes
+MIGRATION_BATCH_SIZE = 64 # Files per worker task during .cursor migration
+MIGRATION_PARALLEL_THRESHOLD = 256 # Below this many files the migration runs in-process
+MIGRATION_MODES = ("move", "copy") # How .cursor is merged into .roo: rename entries in place, or copytree
+MIGRATION_INDEX_NAME = ".migration-index" # Ledger of already-migrated files, kept inside .roo
+INSTALL_STATE_NAME = ".install-state.json" # Completed install stages, kept inside .roo so a failed install can resume
+MIGRATION_INDEX_RACY_NS = 50_000_000 # Entries modified this close to the ledger write are re-hashed
+MIGRATION_INDEX_COARSE_RACY_NS = 2_000_000_000 # Same, on filesystems with whole-second timestamps (FAT, some network mounts)
 
 # --- ANSI Color Codes ---
 COLOR_RESET = "\033[0m"
@@ -46,434 +174,4462 @@ COLOR_BOLD = "\033[1m"
 
 # --- Helper Functions ---
 
+# Serializes terminal output so lines printed from worker threads never tear
+_output_lock = threading.RLock()
+# Thread currently holding the terminal for prompts (see terminal_session); others' output is deferred
+_terminal_owner = None
+_deferred_output = []
+_terminal_session_lock = threading.Lock()
+
+def _emit(text):
+    """Prints text, or defers it while another thread holds the terminal for an interactive prompt."""
+    with _output_lock:
+        if _terminal_owner is not None and _terminal_owner != threading.get_ident():
+            _deferred_output.append(text)
+        else:
+            print(text)
+
+@contextlib.contextmanager
+def terminal_session():
+    """Gives the calling thread exclusive use of the terminal for prompts.
+
+    Output from other threads is buffered meanwhile and flushed when the session ends,
+    so background stages never interleave with questions or interactive commands.
+    """
+    global _terminal_owner
+    with _terminal_session_lock:
+        with _output_lock:
+            _terminal_owner = threading.get_ident()
+        try:
+            yield
+        finally:
+            with _output_lock:
+                _terminal_owner = None
+                pending = list(_deferred_output)
+                _deferred_output.clear()
+                for text in pending:
+                    print(text)
+
+def print_plain(message):
+    """Prints an unformatted line (command output, tables)."""
+    _emit(message)
+
 def print_step(message):
     """Prints a formatted step message with color."""
-    print("\n\n" + "=" * 60) # More spacing
-    print(f"{COLOR_BOLD}{COLOR_CYAN}🚀 STEP: {message}{COLOR_RESET}")
-    print("=" * 60)
+    _emit("\n\n" + "=" * 60 + "\n" # More spacing
+          f"{COLOR_BOLD}{COLOR_CYAN}🚀 STEP: {message}{COLOR_RESET}\n"
+          + "=" * 60)
 
 def print_info(message):
     """Prints an informational message with color."""
-    print(f"{COLOR_GREEN}ℹ️ [INFO] {message}{COLOR_RESET}") # Added color
+    _emit(f"{COLOR_GREEN}ℹ️ [INFO] {message}{COLOR_RESET}") # Added color
+
+def print_warning(message):
+    """Prints a warning message with color."""
+    _emit(f"{COLOR_YELLOW}⚠️ [WARN] {message}{COLOR_RESET}") # Added color
+
+def print_error(message):
+    """Prints an error message with color."""
+    _emit(f"{COLOR_RED}❌ [ERROR] {message}{COLOR_RESET}") # Added color
+
+def print_question(message):
+    """Prints a question prompt with color."""
+    return input(f"{COLOR_BLUE}❓ {message}{COLOR_RESET} ") # Use input directly
+
+def print_code(code_str, language="json"):
+    """Prints a code block."""
+    _emit(f"```{language}\n{code_str}\n```")
+
+# --- Profiling ---
+
+class Profiler:
+    """Collects timed spans and writes them as a Chrome/Perfetto trace (see --profile).
+
+    Timestamps come from the wall clock so spans recorded in worker processes
+    line up with the parent's.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.thread_names = {}
+        self.lock = threading.Lock()
+
+    def add_span(self, name, category, start_ns, end_ns, attrs=None, pid=None, tid=None):
+        """Records a finished span; pid and tid default to the calling thread."""
+        if pid is None:
+            pid, tid = os.getpid(), threading.get_ident()
+            thread_name = threading.current_thread().name
+        else:
+            thread_name = None
+        event = {"name": name, "cat": category, "ph": "X", "ts": start_ns / 1000,
+                 "dur": max(end_ns - start_ns, 0) / 1000, "pid": pid, "tid": tid, "args": dict(attrs or {})}
+        with self.lock:
+            self.events.append(event)
+            if thread_name:
+                self.thread_names.setdefault((pid, tid), thread_name)
+
+    def extend(self, events):
+        """Merges spans recorded by another Profiler (e.g. in a fleet worker process)."""
+        with self.lock:
+            self.events.extend(event for event in events if event["ph"] == "X")
+            for event in events:
+                if event["ph"] == "M" and event["name"] == "thread_name":
+                    self.thread_names.setdefault((event["pid"], event["tid"]), event["args"]["name"])
+
+    def trace_events(self):
+        """Returns the spans plus thread and process name metadata, sorted by start time."""
+        with self.lock:
+            events = sorted(self.events, key=lambda event: event["ts"])
+            metadata = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                        for (pid, tid), name in self.thread_names.items()]
+        for pid in sorted({event["pid"] for event in events}):
+            name = "installer" if pid == os.getpid() else f"worker {pid}"
+            metadata.append({"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": name}})
+        return metadata + events
+
+    def write(self, path):
+        """Writes the trace in Chrome's JSON object format (loadable in Perfetto or chrome://tracing)."""
+        data = {"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}
+        atomic_write_bytes(path, json.dumps(data).encode('utf-8'))
+
+    def print_summary(self):
+        """Prints one row per stage (aggregated across projects in fleet mode) and per-category totals."""
+        with self.lock:
+            events = list(self.events)
+        stages = {}
+        for event in sorted(events, key=lambda event: event["ts"]):
+            if event["cat"] == "stage":
+                row = stages.setdefault(event["name"], {"count": 0, "total": 0.0, "max": 0.0, "failed": 0})
+                row["count"] += 1
+                row["total"] += event["dur"] / 1000
+                row["max"] = max(row["max"], event["dur"] / 1000)
+                row["failed"] += event["args"].get("status") == "failed"
+        name_width = max([len("STAGE")] + [len(name) for name in stages])
+        header = f"{'STAGE':<{name_width}}  {'RUNS':>5}  {'TOTAL ms':>10}  {'MAX ms':>10}  FAILED"
+        print_plain(f"\n{COLOR_BOLD}{header}{COLOR_RESET}")
+        print_plain("-" * len(header))
+        for name, row in stages.items():
+            print_plain(f"{name:<{name_width}}  {row['count']:>5}  {row['total']:>10.1f}  {row['max']:>10.1f}  {row['failed']}")
+
+        def totals(category, attr=None):
+            spans = [event for event in events if event["cat"] == category]
+            extra = sum(event["args"].get(attr) or 0 for event in spans) if attr else 0
+            return len(spans), sum(event["dur"] for event in spans) / 1000, extra
+        count, ms, _ = totals("subprocess")
+        failed = sum(1 for event in events if event["cat"] == "subprocess" and event["args"].get("exit_code") != 0)
+        print_plain(f"\nSubprocesses: {count} ({failed} failed), {ms:.1f} ms")
+        count, ms, fetched = totals("fetch", "bytes")
+        print_plain(f"Fetches: {count}, {fetched} bytes, {ms:.1f} ms (sum; downloads overlap)")
+        count, ms, rewritten = totals("migration", "rewritten")
+        print_plain(f"Migration batches: {count}, {rewritten} files rewritten, {ms:.1f} ms")
+
+_profiler = None # Active Profiler while --profile is in effect
+
+def start_profiling():
+    """Enables span collection for this process and returns the Profiler."""
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+def stop_profiling():
+    """Disables span collection and returns the Profiler that was active, if any."""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+@contextlib.contextmanager
+def profile_span(name, category, **attrs):
+    """Times the enclosed block as a trace span while profiling is enabled.
+
+    Yields a dict of span attributes; callers add results (bytes, exit codes,
+    file counts) to it. Without --profile nothing is recorded.
+    """
+    if _profiler is None:
+        yield attrs
+        return
+    started = time.time_ns()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs.setdefault("error", repr(e))
+        raise
+    finally:
+        if _profiler is not None:
+            _profiler.add_span(name, category, started, time.time_ns(), attrs)
+
+# --- Time Budget ---
+
+class DeadlineExceeded(Exception):
+    """Raised when the install deadline or a stage timeout has run out."""
+
+class Deadline:
+    """A point in time after which work should stop. seconds=None means no limit.
+
+    A deadline never extends past its parent's.
+    """
+
+    def __init__(self, seconds=None, parent=None):
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+        if parent is not None and parent.expires_at is not None:
+            self.expires_at = parent.expires_at if self.expires_at is None else min(self.expires_at, parent.expires_at)
+
+    def remaining(self):
+        """Seconds left (never negative), or None without a limit."""
+        return None if self.expires_at is None else max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def timeout(self, limit=None):
+        """The tighter of limit and the time left; None if neither is set."""
+        remaining = self.remaining()
+        if remaining is None:
+            return limit
+        return remaining if limit is None else min(limit, remaining)
+
+_install_deadline = Deadline() # Overall budget (--deadline); unlimited by default
+_deadline_local = threading.local() # Tighter per-stage deadline of the current thread, if any
+
+def set_install_deadline(seconds):
+    """Starts the overall time budget for this process."""
+    global _install_deadline
+    _install_deadline = Deadline(seconds)
+
+def current_deadline():
+    """The deadline that applies to the calling thread (its stage's, else the install's)."""
+    return getattr(_deadline_local, "deadline", None) or _install_deadline
+
+@contextlib.contextmanager
+def deadline_scope(seconds=None, deadline=None):
+    """Runs the block on this thread under a stage timeout (or an explicit Deadline from another thread)."""
+    previous = getattr(_deadline_local, "deadline", None)
+    _deadline_local.deadline = deadline or Deadline(seconds, parent=previous or _install_deadline)
+    try:
+        yield _deadline_local.deadline
+    finally:
+        _deadline_local.deadline = previous
+
+# Children started by run_command_capture, stopped if the installer is interrupted
+_live_processes = set()
+_live_processes_lock = threading.Lock()
+_process_listener = None # Called with ("start" | "stop", pid); fleet workers report their commands to the parent
+
+def track_process(process):
+    """Registers a command started with _process_group_kwargs() as running."""
+    with _live_processes_lock:
+        _live_processes.add(process)
+    if _process_listener:
+        _process_listener("start", process.pid)
+
+def untrack_process(process):
+    """Unregisters a command once it has exited (or been stopped)."""
+    with _live_processes_lock:
+        _live_processes.discard(process)
+    if _process_listener:
+        _process_listener("stop", process.pid)
+
+def _process_group_kwargs():
+    """Popen arguments that give a child its own process group, so it can be stopped with its descendants."""
+    if platform.system() == "Windows":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+def stop_process_tree(process, grace=SUBPROCESS_KILL_GRACE):
+    """Stops a child started with _process_group_kwargs() and everything it spawned.
+
+    Sends SIGTERM (taskkill on Windows) to the whole group, waits up to grace seconds,
+    then kills whatever is left so no grandchild keeps running or holds our pipes open.
+    """
+    if platform.system() == "Windows":
+        if process.poll() is None:
+            subprocess.run(["taskkill", "/T", "/PID", str(process.pid)], capture_output=True)
+            try:
+                process.wait(timeout=grace)
+            except subprocess.TimeoutExpired:
+                subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)], capture_output=True)
+        process.wait()
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        pass
+    try:
+        process.wait(timeout=grace)
+    except subprocess.TimeoutExpired:
+        pass
+    try:
+        os.killpg(process.pid, signal.SIGKILL) # Stragglers that ignored SIGTERM or outlived the leader
+    except (ProcessLookupError, PermissionError):
+        pass
+    process.wait()
+
+def stop_all_processes():
+    """Stops every command still running (used when the installer is interrupted)."""
+    with _live_processes_lock:
+        processes = list(_live_processes)
+    for process in processes:
+        stop_process_tree(process, grace=1)
+
+# This function runs commands interactively, showing live output (like npm init prompts)
+def run_command_interactive(command_list, check=False, shell=False, cwd=None, timeout=None):
+    """Runs a shell command interactively, showing live output.
+
+    The command is stopped once timeout seconds (or the current stage/install deadline) run out.
+    """
+    command_str = " ".join(command_list) if isinstance(command_list, list) else command_list
+    print_info(f"Running command interactively: {COLOR_BOLD}{command_str}{COLOR_RESET}" + (f" in {cwd}" if cwd else ""))
+    print_info("Output will appear below. The script will wait for this command to finish...")
+    timeout = current_deadline().timeout(timeout)
+    with profile_span(command_str, "subprocess", interactive=True, exit_code=None) as span_attrs:
+        try:
+            # Let the subprocess inherit stdin, stdout, stderr from the script's process
+            # This allows user interaction and shows live output. It stays in our process
+            # group so it keeps the terminal (and receives Ctrl-C with us).
+            process = subprocess.Popen(command_list, shell=shell, cwd=cwd)
+            try:
+                returncode = process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                process.terminate()
+                try:
+                    process.wait(timeout=SUBPROCESS_KILL_GRACE)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+                span_attrs.update(exit_code=process.returncode, timed_out=True)
+                print_error(f"Interactive command timed out after {timeout:.0f}s and was stopped: {command_str}")
+                return False
+            span_attrs["exit_code"] = returncode
+            if check and returncode != 0:
+                print_error(f"Interactive command failed with exit code {returncode}: {command_str}")
+                return False
+            print_info(f"Interactive command '{command_str}' finished with exit code {returncode}.")
+            # Success determination might depend on the command. check=False means we don't raise error on non-zero exit.
+            # We might assume success if no exception occurred, or check returncode if needed.
+            return returncode == 0 # Return True if exit code is 0
+        except FileNotFoundError:
+            span_attrs["error"] = "command not found"
+            print_error(f"Command not found: {command_list[0]}. Is it installed and in PATH?")
+            return False
+        except Exception as e:
+            span_attrs["error"] = str(e)
+            print_error(f"An unexpected error occurred while running interactive command: {e}")
+            return False
+
+_command_log_path = None # --command-log: full output of captured commands is appended here
+
+def set_command_log(path):
+    """Makes run_command_capture append every captured command's full output to path (None to stop)."""
+    global _command_log_path
+    _command_log_path = Path(path) if path else None
+
+def _pump_output(pipe, stream_name, tail, log_file, log_lock, echo):
+    """Reads one of a child's pipes line by line until EOF: keeps the tail, logs and echoes each line."""
+    color = COLOR_GREEN if stream_name == "stdout" else COLOR_YELLOW
+    for line in iter(pipe.readline, ""):
+        line = line.rstrip("\r\n")
+        tail.append(line)
+        if log_file is not None:
+            with log_lock:
+                log_file.write(f"[{stream_name}] {line}\n")
+        if echo:
+            print_plain(f"{color}│{COLOR_RESET} {line}")
+    pipe.close()
+
+# This function runs commands and captures their output (useful for checks)
+def run_command_capture(command_list, check=True, shell=False, cwd=None, stdin=None, timeout=None, echo=True,
+                        tail_lines=CAPTURE_TAIL_LINES, log_path=None):
+    """Runs a shell command verbosely, streaming and capturing its output.
+
+    Both pipes are read concurrently as the command runs; each line is echoed
+    (unless echo=False) and appended to log_path (default: --command-log). Only
+    the last tail_lines lines of each stream are kept, and returned as
+    (ok, stdout, stderr).
+
+    Pass stdin=subprocess.DEVNULL for unattended runs so a prompting command cannot block.
+    The command runs in its own process group; if it outlives timeout (or the current
+    stage/install deadline) it is stopped together with everything it spawned.
+    """
+    command_str = " ".join(command_list) if isinstance(command_list, list) else command_list
+    print_info(f"Running command (capturing output): {COLOR_BOLD}{command_str}{COLOR_RESET}" + (f" in {cwd}" if cwd else ""))
+    timeout = current_deadline().timeout(timeout)
+    log_path = log_path or _command_log_path
+    with profile_span(command_str, "subprocess", cwd=str(cwd) if cwd else None, exit_code=None) as span_attrs:
+        try:
+            process = subprocess.Popen(
+                command_list,
+                shell=shell,
+                text=True,
+                encoding='utf-8',
+                errors='replace', # npm output is not always valid UTF-8 (e.g. on Windows code pages)
+                stdout=subprocess.PIPE, # Capture stdout
+                stderr=subprocess.PIPE, # Capture stderr
+                stdin=stdin,
+                cwd=cwd,
+                **_process_group_kwargs()
+            )
+        except FileNotFoundError:
+            span_attrs["error"] = "command not found"
+            print_error(f"Command not found: {command_list[0]}. Is it installed and in PATH?")
+            return False, "", ""
+        except Exception as e:
+            span_attrs["error"] = str(e)
+            print_error(f"An unexpected error occurred while running command: {e}")
+            return False, "", ""
+
+        track_process(process)
+        log_file = None
+        if log_path:
+            try:
+                log_path.parent.mkdir(parents=True, exist_ok=True)
+                log_file = open(log_path, "a", encoding='utf-8')
+                log_file.write(f"=== {time.strftime('%Y-%m-%d %H:%M:%S')} $ {command_str}" + (f" (in {cwd})" if cwd else "") + "\n")
+            except OSError as e:
+                print_warning(f"Could not open command log {log_path}: {e}")
+                log_file = None
+        log_lock = threading.Lock()
+        stdout_tail, stderr_tail = collections.deque(maxlen=tail_lines), collections.deque(maxlen=tail_lines)
+        # One reader per pipe, so a child filling its stderr pipe can never block on us reading stdout
+        readers = [threading.Thread(target=_pump_output, args=(pipe, name, tail, log_file, log_lock, echo),
+                                    name=f"capture-{name}", daemon=True)
+                   for pipe, name, tail in ((process.stdout, "stdout", stdout_tail), (process.stderr, "stderr", stderr_tail))]
+        for reader in readers:
+            reader.start()
+        try:
+            process.wait(timeout=timeout)
+            timed_out = False
+        except subprocess.TimeoutExpired:
+            stop_process_tree(process)
+            timed_out = True
+        except BaseException:
+            stop_process_tree(process, grace=1) # Interrupted: do not leave npm running in its own group
+            raise
+        finally:
+            untrack_process(process)
+            for reader in readers:
+                # A detached grandchild may still hold the pipe open; do not wait for it forever
+                reader.join(timeout=SUBPROCESS_KILL_GRACE)
+            if log_file is not None:
+                with log_lock:
+                    log_file.write(f"=== exit code {process.returncode}\n")
+                    log_file.close()
+        span_attrs["exit_code"] = process.returncode
+        stdout, stderr = "\n".join(stdout_tail), "\n".join(stderr_tail)
+
+        if timed_out:
+            span_attrs["timed_out"] = True
+            print_error(f"Command timed out after {timeout:.0f}s and was stopped: {command_str}")
+        elif process.returncode == 0 or not check:
+            print_info(f"Command '{command_str}' executed successfully (captured).")
+            return True, stdout, stderr
+        else:
+            print_error(f"Command failed with exit code {process.returncode}: {command_str}")
+        if not echo:
+            if stdout:
+                print_plain(f"{COLOR_RED}[STDOUT]{COLOR_RESET} (last {len(stdout_tail)} lines)\n{stdout}")
+            if stderr:
+                print_plain(f"{COLOR_RED}[STDERR]{COLOR_RESET} (last {len(stderr_tail)} lines)\n{stderr}")
+        if log_file is not None:
+            print_info(f"Full output: {log_path}")
+        return False, stdout, stderr
+
+
+def ask_yes_no(prompt, default=None):
+    """Asks a yes/no question with color."""
+    while True:
+        options = "[y/n]"
+        if default == 'y':
+            options = f"[{COLOR_BOLD}Y{COLOR_RESET}/n]"
+        elif default == 'n':
+            # Corrected logic for default 'n'
+            options = f"[y/{COLOR_BOLD}N{COLOR_RESET}]"
+        # else: options remains "[y/n]"
+
+        # Use print_question for colored input prompt
+        response = print_question(f"{prompt} {options}:").lower().strip() # Pass options here
+
+        if not response and default is not None: # Check default is not None
+            return default == 'y'
+        elif response in ['y', 'yes']:
+            return True
+        elif response in ['n', 'no']:
+            return False
+        else:
+            print_warning("Please answer 'yes' or 'no'.")
+
+def get_mcp_settings_path():
+    """Determines the path to the Roo Code MCP settings file."""
+    system = platform.system()
+    home = Path.home()
+    # Assuming VSCodium paths, adjust if using standard VSCode
+    codium_app_support_name = "VSCodium" # Change to "Code" for standard VSCode if needed
+
+    if system == "Darwin": # macOS
+        path = home / "Library" / "Application Support" / codium_app_support_name / "User" / "globalStorage" / "rooveterinaryinc.roo-cline" / "settings" / "mcp_settings.json"
+    elif system == "Linux":
+        path = home / ".config" / codium_app_support_name / "User" / "globalStorage" / "rooveterinaryinc.roo-cline" / "settings" / "mcp_settings.json"
+    elif system == "Windows":
+        appdata = os.getenv('APPDATA')
+        if not appdata:
+            print_error("Could not determine APPDATA directory on Windows.")
+            return None
+        path = Path(appdata) / codium_app_support_name / "User" / "globalStorage" / "rooveterinaryinc.roo-cline" / "settings" / "mcp_settings.json"
+    else:
+        print_error(f"Unsupported operating system: {system}")
+        return None
+
+    # Don't print path here, print it when actually used/checked later
+    # print_info(f"Detected MCP settings path: {path}")
+    return path
+
+def get_cache_dir():
+    """Determines the per-user cache directory for downloaded modes and rules."""
+    override = os.getenv(CACHE_DIR_ENV_VAR)
+    if override:
+        return Path(override).expanduser()
+    if platform.system() == "Windows":
+        base = os.getenv('LOCALAPPDATA')
+        if base:
+            return Path(base) / "roo-taskmaster" / "cache"
+    elif platform.system() == "Darwin":
+        return Path.home() / "Library" / "Caches" / "roo-taskmaster"
+    xdg_cache = os.getenv('XDG_CACHE_HOME')
+    return (Path(xdg_cache) if xdg_cache else Path.home() / ".cache") / "roo-taskmaster"
+
+def atomic_write_bytes(path, data, durable=False):
+    """Writes bytes to a temp file next to path and renames it into place.
+
+    An existing file's permission bits are kept. With durable=True the temp file
+    and its directory are fsynced so the rename survives a crash.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        try:
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, path)
+        if durable and hasattr(os, "O_DIRECTORY"):
+            dir_fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+@contextlib.contextmanager
+def file_lock(path, timeout=MCP_SETTINGS_LOCK_TIMEOUT):
+    """Holds an exclusive advisory lock on '<path>.lock', waiting at most timeout seconds.
+
+    Uses flock on POSIX and msvcrt.locking on Windows. Raises TimeoutError if another
+    process keeps the lock longer than timeout.
+    """
+    lock_path = Path(path).with_name(Path(path).name + ".lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            try:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                elif msvcrt:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Timed out after {timeout}s waiting for lock {lock_path}")
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            elif msvcrt:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    finally:
+        os.close(fd)
+
+def read_json_file(path):
+    """Reads a JSON file."""
+    if not path or not path.exists():
+        # This is not necessarily a warning, could be expected
+        # print_warning(f"File not found: {path}")
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        print_error(f"Error decoding JSON from file: {path}")
+        return None
+    except IOError as e:
+        print_error(f"Error reading file {path}: {e}")
+        return None
+
+def write_json_file(path, data):
+    """Writes data to a JSON file atomically (temp file, fsync, rename)."""
+    if not path:
+        print_error("Invalid path provided for writing JSON.")
+        return False
+    try:
+        # Readers (and the editor) never see a half-written file
+        atomic_write_bytes(path, (json.dumps(data, indent=2) + "\n").encode('utf-8'), durable=True) # Use indent=2 for readability
+        print_info(f"Successfully wrote JSON data to {path}")
+        return True
+    except IOError as e:
+        print_error(f"Error writing file {path}: {e}")
+        return False
+    except Exception as e:
+        print_error(f"An unexpected error occurred writing JSON to {path}: {e}")
+        return False
+
+def update_mcp_server_entry(path, server_name, entry, replace=True, timeout=MCP_SETTINGS_LOCK_TIMEOUT):
+    """Sets mcpServers[server_name] in an MCP settings file under a lock.
+
+    The file is re-read while the lock is held and only server_name is touched, so
+    servers added concurrently by other installers or the editor are preserved.
+    With replace=False an entry that appeared meanwhile is left alone. entry may
+    also be a function of the current entry (None if there is none) returning the
+    new one. Returns True if the entry is in place afterwards.
+    """
+    if not path:
+        print_error("Invalid path provided for writing JSON.")
+        return False
+    try:
+        with file_lock(path, timeout=timeout):
+            config = {}
+            if path.exists():
+                config = read_json_file(path)
+                if not isinstance(config, dict):
+                    print_error(f"Refusing to overwrite {path}: it is not a readable JSON object.")
+                    return False
+            servers = config.get("mcpServers")
+            if not isinstance(servers, dict):
+                servers = config["mcpServers"] = {}
+            if server_name in servers and not replace:
+                print_info(f"'{server_name}' was configured by another process meanwhile; leaving it unchanged.")
+                return True
+            servers[server_name] = entry(servers.get(server_name)) if callable(entry) else entry
+            return write_json_file(path, config)
+    except TimeoutError as e:
+        print_error(f"{e}. Is another installer or the editor holding it?")
+        return False
+
+class HTTPConnectionPool:
+    """Keeps idle keep-alive connections per (scheme, host, port) so repeated fetches skip TCP/TLS setup."""
+
+    def __init__(self, max_per_host=DOWNLOAD_WORKERS, timeout=DOWNLOAD_TIMEOUT):
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self._idle = {} # (scheme, host, port) -> [connection, ...]
+        self._lock = threading.Lock()
+
+    def _new_connection(self, scheme, host, port):
+        """Opens a connection, tunnelling through the environment's proxy like urllib would."""
+        proxy = urllib.request.getproxies().get(scheme)
+        if proxy and not urllib.request.proxy_bypass(host):
+            proxy_url = urllib.parse.urlsplit(proxy if "://" in proxy else f"http://{proxy}")
+            proxy_port = proxy_url.port or 80
+            if scheme == "https":
+                # CONNECT tunnel through the proxy, then TLS to the real host (same as urllib)
+                conn = http.client.HTTPSConnection(proxy_url.hostname, proxy_port, timeout=self.timeout)
+                conn.set_tunnel(host, port)
+                conn._via_proxy = False
+            else:
+                # Plain http goes to the proxy with an absolute request URL
+                conn = http.client.HTTPConnection(proxy_url.hostname, proxy_port, timeout=self.timeout)
+                conn._via_proxy = True
+            return conn
+        conn_cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        conn = conn_cls(host, port, timeout=self.timeout)
+        conn._via_proxy = False
+        return conn
+
+    def _acquire(self, key):
+        """Returns (connection, reused) for the given host key."""
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        return self._new_connection(*key), False
+
+    def _release(self, key, conn):
+        """Returns a healthy connection to the idle list, closing it if the host is already full."""
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        """Closes every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def request(self, url, headers=None, max_redirects=5, timeout=None):
+        """Performs a GET and returns (status, reason, response_headers, body_bytes).
+
+        Follows redirects and retries once on a fresh connection if a reused
+        keep-alive connection turns out to have been closed by the server.
+        timeout overrides the pool's socket timeout for this request.
+        """
+        timeout = self.timeout if timeout is None else max(timeout, 0.01) # 0 would make the socket non-blocking
+        request_headers = {'User-Agent': HTTP_USER_AGENT, 'Connection': 'keep-alive'}
+        request_headers.update(headers or {})
+        for _ in range(max_redirects + 1):
+            parts = urllib.parse.urlsplit(url)
+            if parts.scheme not in ("http", "https"):
+                raise urllib.error.URLError(f"unsupported URL scheme '{parts.scheme}'")
+            key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+            path = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+            while True:
+                conn, reused = self._acquire(key)
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                else:
+                    conn.timeout = timeout
+                try:
+                    conn.request("GET", url if conn._via_proxy else path, headers=request_headers)
+                    response = conn.getresponse()
+                    body = response.read()
+                except (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionResetError, BrokenPipeError):
+                    conn.close()
+                    if reused:
+                        continue # Stale keep-alive connection; retry on a new one
+                    raise
+                except Exception:
+                    conn.close()
+                    raise
+                break
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(key, conn)
+            location = response.getheader("Location")
+            if response.status in (301, 302, 303, 307, 308) and location:
+                url = urllib.parse.urljoin(url, location)
+                continue
+            return response.status, response.reason, response.headers, body
+        raise urllib.error.URLError(f"too many redirects fetching {url}")
+
+class DownloadCache:
+    """On-disk cache of fetched files keyed by URL.
+
+    Each entry is a body file plus a JSON sidecar holding the ETag/Last-Modified
+    validators and a sha256 of the body, so later runs can revalidate with a
+    conditional request and skip the transfer on a 304.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root) / "downloads"
+
+    def _entry_paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return self.root / f"{key}.body", self.root / f"{key}.json"
+
+    def lookup(self, url):
+        """Returns (metadata, body) for a cached URL, or None if missing or corrupt."""
+        body_path, meta_path = self._entry_paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            body = body_path.read_bytes()
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url or meta.get("sha256") != hashlib.sha256(body).hexdigest():
+            return None
+        return meta, body
+
+    def conditional_headers(self, meta):
+        """Builds If-None-Match / If-Modified-Since headers from cached validators."""
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def store(self, url, response_headers, body):
+        """Saves a 200 response body with its validators."""
+        body_path, meta_path = self._entry_paths(url)
+        meta = {
+            "url": url,
+            "etag": response_headers.get("ETag"),
+            "last_modified": response_headers.get("Last-Modified"),
+            "sha256": hashlib.sha256(body).hexdigest(),
+            "size": len(body),
+            "fetched_at": time.time(),
+        }
+        try:
+            # Body first so a crash never leaves metadata pointing at a missing body
+            atomic_write_bytes(body_path, body)
+            atomic_write_bytes(meta_path, json.dumps(meta, indent=2).encode('utf-8'))
+        except OSError as e:
+            print_warning(f"Could not update download cache for {url}: {e}")
+
+    def refresh(self, url, meta, response_headers):
+        """Records a successful revalidation (304), picking up any rotated validators."""
+        _, meta_path = self._entry_paths(url)
+        meta = dict(meta)
+        meta["etag"] = response_headers.get("ETag") or meta.get("etag")
+        meta["last_modified"] = response_headers.get("Last-Modified") or meta.get("last_modified")
+        meta["validated_at"] = time.time()
+        try:
+            atomic_write_bytes(meta_path, json.dumps(meta, indent=2).encode('utf-8'))
+        except OSError as e:
+            print_warning(f"Could not update download cache for {url}: {e}")
+
+class ContentStore:
+    """Machine-wide store of mode and rule files keyed by sha256, shared by projects.
+
+    Objects live read-only at <root>/cas/<2 hex digits>/<rest of the digest>.
+    link() puts an object into a project as a reflink on filesystems that clone
+    extents (btrfs, XFS), so identical files in many checkouts share one copy
+    on disk while each stays the project's own file; elsewhere it copies.
+
+    With link="hardlink", projects share the object's inode instead (and its
+    page cache). That is not safe against in-place writers: the 0o444 mode does
+    not stop root, and editors that save in place (VS Code, Roo) or other tools
+    writing into .roo change the file in the store and in every linked project
+    at once. Only the installer's own writes break links first (break_link).
+    Such edits are caught on the next sync instead: put() re-hashes every
+    object before reusing it and replaces one that no longer matches, and
+    materialize() leaves a project's in-place edit in that project as its own
+    file.
+    """
+
+    def __init__(self, root, link="reflink"):
+        self.root = Path(root) / "cas"
+        self.link_method = link
+        self.counts = collections.Counter()
+
+    def object_path(self, digest):
+        return self.root / digest[:2] / digest[2:]
+
+    def put(self, data):
+        """Adds data to the store unless an intact copy is there; returns the object path.
+
+        An existing object is always re-hashed first, whatever its mode: it may
+        have been written through a hardlink. One that no longer matches is
+        replaced by a new file, so the projects still linked to the edited one
+        keep it and no longer share it with the store.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        try:
+            intact = _sha256_file(path) == digest
+        except FileNotFoundError:
+            intact = None
+        if intact:
+            if path.stat().st_mode & 0o222:
+                os.chmod(path, 0o444)
+            return path
+        if intact is False:
+            self.counts["repaired"] += 1
+            os.chmod(path, 0o644) # Windows cannot replace a read-only file
+        atomic_write_bytes(path, data)
+        os.chmod(path, 0o444)
+        return path
+
+    def edited_in_place(self, target, current):
+        """True if target, whose content is current, is a store hardlink that was written through.
+
+        A read-only file with several links is taken to be linked from the store;
+        if it is not the object its content hashes to, that content was written
+        into it after it was linked.
+        """
+        try:
+            stat = os.stat(target)
+        except FileNotFoundError:
+            return False
+        if stat.st_nlink < 2 or stat.st_mode & 0o222:
+            return False # The project's own file (a copy, a reflink, or already replaced)
+        try:
+            return not os.path.samefile(target, self.object_path(hashlib.sha256(current).hexdigest()))
+        except FileNotFoundError:
+            return True
+
+    def link(self, source, target):
+        """Replaces target with the object at source.
+
+        Returns "unchanged" if target already is that object, else "linked",
+        "reflinked" or "copied".
+        """
+        target = Path(target)
+        try:
+            if os.path.samefile(source, target):
+                self.counts["unchanged"] += 1
+                return "unchanged"
+        except OSError:
+            pass
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(f".{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            method = self._place(source, tmp_path)
+            os.replace(tmp_path, target) # Never writes through an existing link
+        finally:
+            if os.path.lexists(tmp_path):
+                os.remove(tmp_path)
+        self.counts[method] += 1
+        return method
+
+    def _place(self, source, tmp_path):
+        if self.link_method == "hardlink":
+            try:
+                os.link(source, tmp_path)
+                return "linked"
+            except OSError:
+                pass # Another filesystem (EXDEV), no hardlink support, or the link count limit
+        with open(source, "rb") as src, open(tmp_path, "wb") as dst:
+            if fcntl and sys.platform.startswith("linux"):
+                try:
+                    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                    return "reflinked"
+                except OSError:
+                    pass # Not a CoW filesystem, or another filesystem
+            shutil.copyfileobj(src, dst)
+        return "copied"
+
+    def materialize(self, data, target, current=None):
+        """Stores data and links it to target; returns how (see link()).
+
+        current is target's content, if already read. When target was edited in
+        place through a store hardlink (see edited_in_place), the edit stays in
+        the project as its own file and "kept" is returned; the store still
+        gets an intact copy of data.
+        """
+        edited = current is not None and self.edited_in_place(target, current)
+        path = self.put(data)
+        if edited:
+            break_link(target)
+            atomic_write_bytes(target, current)
+            self.counts["kept"] += 1
+            return "kept"
+        return self.link(path, target)
+
+    def summary(self):
+        """Counts of the placements so far, e.g. '12 linked, 2 unchanged'."""
+        return ", ".join(f"{count} {method}" for method, count in sorted(self.counts.items()))
+
+def warn_kept_edits(counts):
+    """Warns about files install_rule_files() found edited in place through a store hardlink."""
+    if counts["kept"]:
+        print_warning(f"{counts['kept']} mode/rule files had been edited in place through a shared-store hardlink, "
+                      "which changed them in every project linked to them. They were kept here as this project's "
+                      "own files, and the store was repaired; other projects get the published files back on "
+                      "their next sync. Use --store-link reflink, or an editor that saves by replacing files.")
+
+def break_link(path):
+    """Removes path if it is one of several hardlinks, so a following write cannot reach the others.
+
+    A file linked from a ContentStore is shared with the store and other projects.
+    """
+    try:
+        if os.stat(path).st_nlink > 1:
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def percentile(values, pct):
+    """The pct-th percentile (nearest rank) of values, or None if there are none."""
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+class LatencyTracker:
+    """Recent successful request latencies per host, used to pick hedge delays."""
+
+    def __init__(self, max_samples=64):
+        self.max_samples = max_samples
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def record(self, host, seconds):
+        with self.lock:
+            samples = self.samples.setdefault(host, [])
+            samples.append(seconds)
+            del samples[:-self.max_samples]
+
+    def percentile(self, host, pct):
+        """The pct-th percentile latency for host, or None with fewer than HEDGE_MIN_SAMPLES samples."""
+        with self.lock:
+            samples = list(self.samples.get(host, []))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return percentile(samples, pct)
+
+class RetryPolicy:
+    """Retry and hedging settings for HTTP fetches (--retries, --hedge).
+
+    hedge is None (off), ("after", seconds) or ("percentile", pct): a request still
+    unanswered after that long gets a second, identical request and the first
+    response wins.
+    """
+
+    TRANSIENT_STATUSES = (408, 425, 429, 500, 502, 503, 504)
+
+    def __init__(self, retries=DOWNLOAD_RETRIES, backoff=DOWNLOAD_BACKOFF, hedge=None):
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge = hedge
+        self.latencies = LatencyTracker()
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Seconds to wait before retry number attempt (0-based): exponential with full jitter."""
+        if retry_after and retry_after.strip().isdigit():
+            return min(float(retry_after), DOWNLOAD_BACKOFF_MAX)
+        return random.uniform(0, min(self.backoff * (2 ** attempt), DOWNLOAD_BACKOFF_MAX))
+
+    def hedge_delay(self, host):
+        """Seconds to wait before sending a hedged request to host, or None when hedging is off."""
+        if self.hedge is None:
+            return None
+        kind, value = self.hedge
+        if kind == "after":
+            return value
+        delay = self.latencies.percentile(host, value)
+        return HEDGE_FALLBACK_DELAY if delay is None else delay
+
+_retry_policy = RetryPolicy()
+
+def set_retry_policy(policy):
+    """Installs the retry/hedging settings used by every fetch in this process."""
+    global _retry_policy
+    _retry_policy = policy
+
+def _request_hedged(pool, url, headers, timeout, hedge_delay):
+    """pool.request(), plus a second identical request if the first is slower than hedge_delay.
+
+    Returns the first successful response; raises the last error if both attempts fail.
+    """
+    if hedge_delay is None:
+        return pool.request(url, headers=headers, timeout=timeout)
+    outcomes = queue.Queue()
+
+    def attempt():
+        try:
+            outcomes.put((True, pool.request(url, headers=headers, timeout=timeout)))
+        except Exception as e:
+            outcomes.put((False, e))
+
+    threading.Thread(target=attempt, name="fetch-primary", daemon=True).start()
+    try:
+        ok, value = outcomes.get(timeout=hedge_delay)
+        in_flight = 0
+    except queue.Empty:
+        print_info(f"No response from {url} after {hedge_delay:.2f}s; sending a hedged request.")
+        threading.Thread(target=attempt, name="fetch-hedge", daemon=True).start()
+        ok, value = outcomes.get()
+        in_flight = 1
+    if not ok and in_flight:
+        ok, value = outcomes.get() # The other attempt may still succeed
+    if not ok:
+        raise value
+    return value
+
+def fetch_url(url, pool=None, cache=None, offline=False):
+    """Fetches a URL and returns (body, status).
+
+    body is None on failure; status is the HTTP status (None when no response arrived).
+    Pass a shared HTTPConnectionPool to reuse keep-alive connections across calls.
+    With a DownloadCache the request is made conditional and a 304 is served from
+    the cache; offline=True serves straight from the cache without any network access.
+    Timeouts, connection errors, 429 and 5xx are retried with exponential backoff
+    (see RetryPolicy) within the current deadline.
+    """
+    span_name = "/".join(urllib.parse.urlsplit(url).path.strip("/").split("/")[-2:])
+    with profile_span(span_name, "fetch", url=url, bytes=0) as span_attrs:
+        body, status = _fetch_url(url, pool, cache, offline, span_attrs)
+        span_attrs["ok"] = body is not None
+        return body, status
+
+def _fetch_url(url, pool, cache, offline, span_attrs):
+    """Does the work of fetch_url(), recording status, source and size in span_attrs."""
+    cached = cache.lookup(url) if cache else None
+
+    if offline:
+        if cached is None:
+            print_error(f"Offline mode: {url} is not in the download cache.")
+            return None, None
+        print_info(f"Offline mode: using cached copy of {url}")
+        span_attrs["source"] = "cache"
+        return cached[1], None
+
+    own_pool = pool is None
+    if own_pool:
+        pool = HTTPConnectionPool(max_per_host=1)
+    request_headers = cache.conditional_headers(cached[0]) if cached else {}
+    policy, deadline = _retry_policy, current_deadline()
+    host = urllib.parse.urlsplit(url).netloc
+    attempt = 0
+    try:
+        while True:
+            response_headers, retry_after = None, None
+            if deadline.expired():
+                status, error = None, f"Deadline exceeded before fetching {url}"
+                break
+            started = time.monotonic()
+            try:
+                print_info(f"Fetching {url}..." if attempt == 0 else f"Fetching {url} (attempt {attempt + 1})...")
+                status, reason, response_headers, body = _request_hedged(
+                    pool, url, request_headers, deadline.timeout(pool.timeout), policy.hedge_delay(host))
+                error = None
+            except urllib.error.URLError as e:
+                status, error = None, f"URL Error fetching {url}: {e.reason}"
+            except (http.client.HTTPException, OSError) as e:
+                # Connection refused, DNS failures, timeouts and protocol errors
+                status, error = None, f"URL Error fetching {url}: {e}"
+            except Exception as e:
+                status, error = None, f"An unexpected error occurred while processing {url}: {e}"
+                break
+            if status in (200, 304):
+                policy.latencies.record(host, time.monotonic() - started)
+            transient = status is None or status in RetryPolicy.TRANSIENT_STATUSES
+            if not transient or attempt >= policy.retries:
+                break
+            if response_headers is not None:
+                retry_after = response_headers.get("Retry-After")
+            delay = policy.backoff_delay(attempt, retry_after)
+            remaining = deadline.remaining()
+            if remaining is not None and remaining <= delay:
+                break
+            print_warning(f"{error or f'HTTP {status} from {url}'}; retrying in {delay:.1f}s.")
+            time.sleep(delay)
+            attempt += 1
+    finally:
+        if own_pool:
+            pool.close()
+    span_attrs["attempts"] = attempt + 1
+
+    span_attrs["http_status"] = status
+    if status == 304 and cached:
+        print_info(f"Not modified upstream, using cached copy of {url}")
+        cache.refresh(url, cached[0], response_headers)
+        span_attrs["source"] = "not-modified"
+        return cached[1], status
+    if status == 200:
+        if cache:
+            cache.store(url, response_headers, body)
+        span_attrs["source"] = "network"
+        span_attrs["bytes"] = len(body)
+        return body, status
+    if error is None:
+        if status >= 400:
+            error = f"HTTP Error fetching {url}: {status} {reason}"
+        else:
+            error = f"Error fetching {url}: HTTP status code {status}"
+    if cached and (status is None or status == 429 or status >= 500):
+        # Upstream unreachable, slow or rate-limiting: fall back to the last good copy
+        print_warning(f"{error}. Falling back to cached copy.")
+        span_attrs["source"] = "cache"
+        return cached[1], status
+    print_error(error)
+    return None, status
+
+def fetch_and_write(url, local_path, pool=None, cache=None, offline=False):
+    """Fetches content from a URL and writes it to a local file (see fetch_url for pool, cache and offline)."""
+    local_path = Path(local_path)
+    body, _ = fetch_url(url, pool=pool, cache=cache, offline=offline)
+    if body is None:
+        return False
+    try:
+        content = body.decode('utf-8')
+        print_info(f"Writing content to {local_path}...")
+        local_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(local_path, "w", encoding='utf-8') as f:
+            f.write(content)
+        print_info(f"Successfully wrote {local_path}")
+        return True
+    except IOError as e:
+        print_error(f"Error writing to {local_path}: {e}")
+        return False
+    except Exception as e:
+        print_error(f"An unexpected error occurred while processing {url}: {e}")
+        return False
+
+def download_files(jobs, max_workers=DOWNLOAD_WORKERS, cache=None, offline=False):
+    """Fetches (url, local_path) jobs concurrently over pooled keep-alive connections.
+
+    Prints per-file and total latency and returns a list of (url, local_path, success, seconds)
+    tuples in job order. cache and offline are passed through to fetch_and_write().
+    """
+    if not jobs:
+        return []
+    workers = max(1, min(max_workers, len(jobs)))
+    pool = HTTPConnectionPool(max_per_host=workers)
+    deadline = current_deadline() # Worker threads inherit the caller's stage timeout
+
+    def fetch_one(job):
+        url, local_path = job
+        started = time.perf_counter()
+        with deadline_scope(deadline=deadline):
+            success = fetch_and_write(url, local_path, pool=pool, cache=cache, offline=offline)
+        return url, Path(local_path), success, time.perf_counter() - started
+
+    started = time.perf_counter()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="download") as executor:
+            results = list(executor.map(fetch_one, jobs))
+    finally:
+        pool.close()
+    elapsed = time.perf_counter() - started
+
+    with _output_lock:
+        print_info(f"Download latency ({workers} workers):")
+        for url, local_path, success, seconds in results:
+            marker = f"{COLOR_GREEN}{'ok':<6}{COLOR_RESET}" if success else f"{COLOR_RED}{'failed':<6}{COLOR_RESET}"
+            print_plain(f"    {seconds * 1000:8.1f} ms  {marker} {local_path}")
+        serial_total = sum(seconds for _, _, _, seconds in results)
+        print_info(f"Downloaded {sum(1 for r in results if r[2])}/{len(results)} files in {elapsed * 1000:.1f} ms "
+                   f"(sum of per-file latencies: {serial_total * 1000:.1f} ms).")
+    return results
+
+def load_migration_index(roo_dir):
+    """Loads the migration ledger: {relative path: [size, mtime_ns, sha256]}, plus its write time."""
+    data = read_json_file(Path(roo_dir) / MIGRATION_INDEX_NAME)
+    if not isinstance(data, dict) or data.get("version") != 1 or not isinstance(data.get("files"), dict):
+        return {}, 0
+    return data["files"], data.get("written_at_ns", 0)
+
+def save_migration_index(roo_dir, files):
+    """Atomically writes the migration ledger."""
+    data = {"version": 1, "written_at_ns": time.time_ns(), "files": files}
+    try:
+        atomic_write_bytes(Path(roo_dir) / MIGRATION_INDEX_NAME, json.dumps(data, separators=(",", ":")).encode('utf-8'))
+    except OSError as e:
+        print_warning(f"Could not write migration index in {roo_dir}: {e}")
+
+def _scan_migration_batches(roo_dir, index=None, index_written_ns=0, seen=None, batch_size=MIGRATION_BATCH_SIZE):
+    """Walks roo_dir with os.scandir and yields batches of (path, relative path, known sha256) to migrate.
+
+    Rule directories (.roo/rules-*) come from the rules source and are never descended into.
+    A directory containing .mdc files is always yielded as one batch in listing order,
+    because renaming x.mdc can replace a sibling x.md; keeping those files together
+    makes the parallel run produce exactly the same result as a serial one.
+
+    Files whose size and mtime still match their ledger entry in index are skipped
+    without being opened; every relative path found is added to seen.
+    """
+    index = index or {}
+    stack = [(str(roo_dir), "", True)]
+    while stack:
+        directory, rel_dir, is_top = stack.pop()
+        files, subdirs, mdc_targets = [], [], set()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        # Skip files that should have been fetched from GitHub
+                        if not (is_top and entry.name.startswith("rules-")):
+                            subdirs.append((entry.path, f"{rel_dir}{entry.name}/"))
+                    elif entry.name == ".roomodes": # This should be fetched to root, not in .roo
+                        continue
+                    elif entry.name.endswith(".mdc") or entry.name.endswith(MIGRATION_TEXT_EXTENSIONS):
+                        files.append(entry)
+                        if entry.name.endswith(".mdc"):
+                            mdc_targets.add(entry.name[:-4] + ".md")
+                            if entry.name == "cursor_rules.mdc":
+                                mdc_targets.add("roo_rules.md")
+        except OSError as e:
+            print_error(f"Error scanning {directory}: {e}")
+            continue
+
+        batch = []
+        for entry in files:
+            rel_path = rel_dir + entry.name
+            if seen is not None:
+                seen.add(rel_path)
+            known = index.get(rel_path)
+            known_hash = None
+            # A file a sibling .mdc will be renamed onto must go through the normal ordered pass
+            if known and entry.name not in mdc_targets:
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    stat = None
+                # Like git's racy-clean check: a write in the same timestamp tick as the ledger can hide a change
+                racy_window = MIGRATION_INDEX_COARSE_RACY_NS if stat and stat.st_mtime_ns % 1_000_000_000 == 0 else MIGRATION_INDEX_RACY_NS
+                racy = stat is not None and stat.st_mtime_ns >= index_written_ns - racy_window
+                if stat is not None and [stat.st_size, stat.st_mtime_ns] == known[:2] and not racy:
+                    continue # Unchanged since it was last migrated
+                known_hash = known[2]
+            batch.append((entry.path, rel_path, known_hash))
+        if mdc_targets:
+            if batch:
+                yield batch
+        else:
+            for i in range(0, len(batch), batch_size):
+                yield batch[i:i + batch_size]
+        stack.extend((path, rel, False) for path, rel in reversed(subdirs))
+
+class RewriteEngine:
+    """Applies a table of literal (old, new) replacements as one leftmost, non-overlapping pass.
+
+    Replacement text is never rescanned, and where two literals match at the same
+    position the earlier rule wins. When no rule can interfere with another,
+    substituting each literal in table order gives exactly that result and is
+    faster in CPython than matching an alternation (which loses re's literal
+    search), so the combined pattern is only used for tables that need it.
+    Literals cannot contain line breaks, so rewrite_chunks() cuts at line ends.
+    """
+
+    def __init__(self, rules):
+        rules = list(rules)
+        if any(not old or "\n" in old or "\r" in old for old, _ in rules):
+            raise ValueError("Rewrite literals must be non-empty and cannot contain line breaks")
+        self.rules = rules
+        self.replacements = {}
+        for old, new in rules:
+            self.replacements.setdefault(old, new) # Earlier rules win
+        self.pattern = re.compile("|".join(re.escape(old) for old, _ in rules))
+        self.byte_literals = [old.encode('utf-8') for old, _ in rules]
+        self.overlap = max(len(old) for old in self.byte_literals) - 1
+        self.sequential = self._order_free(rules)
+        # One literal pattern per rule: re's literal search beats both the alternation and str.replace
+        self.steps = [(re.compile(re.escape(old)), new.replace("\\", "\\\\")) for old, new in rules]
+        self.changed = False
+
+    @staticmethod
+    def _order_free(rules):
+        """True if replacing each literal in table order gives the same text as one leftmost pass.
+
+        That holds unless a later literal can start inside an earlier one, or an
+        earlier replacement can complete or contain a later literal.
+        """
+        def joins(left, right): # A proper suffix of left is a prefix of right
+            return any(right.startswith(left[i:]) for i in range(1, len(left)))
+        for i, (old, new) in enumerate(rules):
+            for later, _ in rules[i + 1:]:
+                if (later in old or old in later or joins(later, old)
+                        or later in new or new in later or joins(new, later) or joins(later, new)):
+                    return False
+        return True
+
+    def may_match(self, raw):
+        """False when undecoded bytes certainly contain no match (they are ASCII and no literal occurs).
+
+        Non-ASCII input always may match: dropping invalid UTF-8 while decoding can join a literal.
+        """
+        return not raw.isascii() or any(old in raw for old in self.byte_literals)
+
+    def _replace(self, match):
+        return self.replacements[match.group()]
+
+    def rewrite(self, text):
+        """Returns (rewritten text, whether anything was replaced)."""
+        if not self.sequential:
+            text, count = self.pattern.subn(self._replace, text)
+            return text, count > 0
+        changed = False
+        for pattern, new in self.steps:
+            text, count = pattern.subn(new, text)
+            changed = changed or count > 0
+        return text, changed
+
+    def rewrite_chunks(self, chunks):
+        """Yields the rewritten text of an iterable of text chunks; .changed tells whether anything was replaced.
+
+        Each chunk is rewritten up to its last newline and the rest is carried into
+        the next one, so no match is split across chunks.
+        """
+        self.changed = False
+        pending = ""
+        for chunk in chunks:
+            text = pending + chunk
+            cut = text.rfind("\n") + 1
+            pending = text[cut:]
+            if cut:
+                rewritten, changed = self.rewrite(text[:cut])
+                self.changed |= changed
+                yield rewritten
+        rewritten, changed = self.rewrite(pending)
+        self.changed |= changed
+        yield rewritten
+
+_migration_rewriter = RewriteEngine(MIGRATION_REWRITE_RULES)
+
+def _read_text_chunks(path, chunk_size=MIGRATION_CHUNK_SIZE):
+    """Yields a file's text in chunks, decoded and newline-normalized like reading it in text mode.
+
+    Invalid UTF-8 is dropped, as with errors='ignore'.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    held_cr = "" # A chunk ending in \r may be the first half of \r\n
+    with open(path, "rb") as f:
+        while True:
+            raw = f.read(chunk_size)
+            text = held_cr + decoder.decode(raw, final=not raw)
+            held_cr = ""
+            if raw and text.endswith("\r"):
+                text, held_cr = text[:-1], "\r"
+            yield text.replace("\r\n", "\n").replace("\r", "\n")
+            if not raw:
+                return
+
+def _rewrite_large_file(file_path, known_hash):
+    """Chunked counterpart of the in-memory rewrite in _migrate_file.
+
+    A first pass hashes the raw bytes and checks them for possible matches; only
+    then is the file streamed through the rewriter into a temp file, which
+    replaces it if anything changed. Returns (rewritten, sha256 of the content).
+    """
+    digest = hashlib.sha256()
+    may_match = False
+    tail = b""
+    with open(file_path, "rb") as f:
+        for raw in iter(lambda: f.read(MIGRATION_CHUNK_SIZE), b""):
+            digest.update(raw)
+            if not may_match:
+                # The end of the previous chunk catches a literal across the boundary
+                may_match = _migration_rewriter.may_match(tail + raw)
+                tail = raw[len(raw) - _migration_rewriter.overlap:]
+    if not may_match or digest.hexdigest() == known_hash:
+        return False, digest.hexdigest()
+    out_digest = hashlib.sha256()
+    tmp_path = f"{file_path}.{os.getpid()}.migrate.tmp"
+    try:
+        with open(tmp_path, "wb") as out:
+            for text in _migration_rewriter.rewrite_chunks(_read_text_chunks(file_path)):
+                data = text.replace("\n", os.linesep).encode('utf-8')
+                out_digest.update(data)
+                out.write(data)
+        if not _migration_rewriter.changed:
+            return False, digest.hexdigest()
+        os.chmod(tmp_path, os.stat(file_path).st_mode & 0o7777)
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return True, out_digest.hexdigest()
+
+def _migrate_file(file_path, known_hash, messages):
+    """Rewrites Cursor references in one file and renames .mdc files.
+
+    Returns (rewritten, renamed, bytes_read, ledger_entry); log lines are appended to
+    messages. ledger_entry is [size, mtime_ns, sha256] of the migrated file, or None
+    when the file was renamed or could not be processed. A file whose content still
+    hashes to known_hash is left untouched.
+    """
+    rewritten = renamed = False
+    bytes_read = 0
+    entry = None
+    root_path, file = os.path.split(file_path)
+    try:
+        # Read only if it's a text file (basic check)
+        if file.endswith(MIGRATION_TEXT_EXTENSIONS):
+            with open(file_path, "rb") as f:
+                bytes_read = os.fstat(f.fileno()).st_size
+                raw = f.read() if bytes_read <= MIGRATION_CHUNK_SIZE else None
+            if raw is None:
+                rewritten, digest = _rewrite_large_file(file_path, known_hash)
+            else:
+                digest = hashlib.sha256(raw).hexdigest()
+                # Most files have nothing to rewrite; tell from the raw bytes without decoding them
+                if digest != known_hash and _migration_rewriter.may_match(raw):
+                    # Same decoding and newline handling as reading in text mode
+                    content = raw.decode('utf-8', errors='ignore').replace("\r\n", "\n").replace("\r", "\n")
+                    content, changed = _migration_rewriter.rewrite(content)
+                    if changed:
+                        # Same bytes a text-mode write would produce, hashed without re-reading
+                        data = content.replace("\n", os.linesep).encode('utf-8')
+                        with open(file_path, "wb") as f:
+                            f.write(data)
+                        rewritten = True
+                        digest = hashlib.sha256(data).hexdigest()
+            stat = os.stat(file_path)
+            entry = [stat.st_size, stat.st_mtime_ns, digest]
+
+        # Handle .mdc files and cursor_rules.mdc specifically
+        if file.endswith(".mdc"):
+            new_path = os.path.join(root_path, file[:-4] + ".md")
+            messages.append(("info", f"Renaming {file_path} to {new_path}"))
+            os.rename(file_path, new_path)
+            renamed = True
+            if file == "cursor_rules.mdc":
+                roo_rules_path = os.path.join(root_path, "roo_rules.md")
+                messages.append(("info", f"Renaming {new_path} to {roo_rules_path}"))
+                os.rename(new_path, roo_rules_path) # Rename again
+    except Exception as file_e:
+        messages.append(("error", f"Error processing file {file_path}: {file_e}"))
+        entry = None
+    return rewritten, renamed, bytes_read, entry
+
+def _migrate_batch(batch):
+    """Migrates a batch of files; runs in a worker process.
+
+    Returns (rewritten_count, renamed_count, bytes_read, messages, ledger_updates, timing)
+    where ledger_updates maps relative paths to new entries (None to drop) and timing
+    is (pid, thread id, start_ns, end_ns) for the trace written by --profile.
+    """
+    started = time.time_ns()
+    messages = []
+    updates = {}
+    totals = [0, 0, 0]
+    for file_path, rel_path, known_hash in batch:
+        rewritten, renamed, bytes_read, entry = _migrate_file(file_path, known_hash, messages)
+        totals[0] += rewritten
+        totals[1] += renamed
+        totals[2] += bytes_read
+        updates[rel_path] = entry
+    timing = (os.getpid(), threading.get_ident(), started, time.time_ns())
+    return totals[0], totals[1], totals[2], messages, updates, timing
+
+def rewrite_migrated_files(roo_dir, workers=None, use_index=True):
+    """Rewrites and renames migrated files under roo_dir, fanning out across processes.
+
+    Small trees are handled in-process; once more than MIGRATION_PARALLEL_THRESHOLD
+    files need work, batches stream from the scandir producer to a process pool.
+    With use_index, files recorded in .roo/.migration-index and unchanged since are
+    skipped, and the ledger is refreshed afterwards (use_index=False rebuilds it).
+    Prints throughput and returns (files_processed, files_renamed).
+    """
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    index, index_written_ns = load_migration_index(roo_dir) if use_index else ({}, 0)
+    seen = set()
+    new_index = {}
+    batches = _scan_migration_batches(roo_dir, index, index_written_ns, seen)
+    totals = [0, 0, 0, 0] # rewritten, renamed, bytes read, files examined
+
+    def collect(batch_size, result):
+        rewritten, renamed, bytes_read, messages, updates, (pid, tid, start_ns, end_ns) = result
+        if _profiler is not None:
+            _profiler.add_span("migrate_batch", "migration", start_ns, end_ns, pid=pid, tid=tid,
+                               attrs={"files": batch_size, "rewritten": rewritten, "renamed": renamed, "bytes": bytes_read})
+        totals[0] += rewritten
+        totals[1] += renamed
+        totals[2] += bytes_read
+        totals[3] += batch_size
+        for level, message in messages:
+            (print_error if level == "error" else print_info)(message)
+        new_index.update(updates)
+
+    # Buffer batches until we know whether the tree is big enough to pay for a pool
+    buffered, buffered_files = [], 0
+    for batch in batches:
+        buffered.append(batch)
+        buffered_files += len(batch)
+        if buffered_files > MIGRATION_PARALLEL_THRESHOLD:
+            break
+
+    if workers <= 1 or buffered_files <= MIGRATION_PARALLEL_THRESHOLD:
+        for batch in itertools.chain(buffered, batches):
+            collect(len(batch), _migrate_batch(batch))
+        mode = "in-process"
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            in_flight = []
+            for batch in itertools.chain(buffered, batches):
+                in_flight.append((len(batch), executor.submit(_migrate_batch, batch)))
+                # Bound queued work so huge trees do not hold every path in memory at once
+                while len(in_flight) > workers * 4:
+                    size, future = in_flight.pop(0)
+                    collect(size, future.result())
+            for size, future in in_flight:
+                collect(size, future.result())
+        mode = f"{workers} processes"
+
+    # Unchanged entries carry over; files that disappeared or were renamed drop out
+    merged = {rel: entry for rel, entry in index.items() if rel in seen and rel not in new_index}
+    merged.update((rel, entry) for rel, entry in new_index.items() if entry is not None)
+    save_migration_index(roo_dir, merged)
+
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    skipped = len(seen) - totals[3]
+    print_info(f"Migration throughput ({mode}): {totals[3]} files in {elapsed:.2f}s, "
+               f"{totals[3] / elapsed:.0f} files/s, {totals[2] / elapsed / 1_000_000:.1f} MB/s"
+               + (f"; {skipped} unchanged files skipped via {MIGRATION_INDEX_NAME}" if skipped else ""))
+    return totals[0], totals[1]
+
+def merge_cursor_by_move(cursor_dir, roo_dir):
+    """Merges cursor_dir into roo_dir by renaming entries instead of copying them.
+
+    Directories missing from roo_dir are moved wholesale with a single rename; files
+    replace their .roo counterpart with os.replace. Only entries on another
+    filesystem (EXDEV) and symlinks (which copytree follows) are copied. Returns
+    counts of moved directories, moved files, replaced .roo files and copied entries.
+    """
+    stats = {"moved_dirs": 0, "moved_files": 0, "replaced": 0, "copied": 0}
+    stack = [(str(cursor_dir), str(roo_dir))]
+    while stack:
+        src_dir, dst_dir = stack.pop()
+        with os.scandir(src_dir) as entries:
+            entries = list(entries)
+        for entry in entries:
+            target = os.path.join(dst_dir, entry.name)
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not os.path.lexists(target):
+                        try:
+                            os.rename(entry.path, target)
+                            stats["moved_dirs"] += 1
+                        except OSError as e:
+                            if e.errno != errno.EXDEV:
+                                raise
+                            shutil.copytree(entry.path, target) # Left for the rmtree of .cursor
+                            stats["copied"] += 1
+                    elif os.path.isdir(target):
+                        stack.append((entry.path, target))
+                    else:
+                        raise IsADirectoryError(f"{target} exists and is not a directory")
+                elif entry.is_symlink():
+                    shutil.copy2(entry.path, target) # Keep copytree's follow-the-link semantics
+                    stats["copied"] += 1
+                else:
+                    existed = os.path.lexists(target)
+                    try:
+                        os.replace(entry.path, target)
+                        stats["moved_files"] += 1
+                    except OSError as e:
+                        if e.errno != errno.EXDEV:
+                            raise
+                        shutil.copy2(entry.path, target)
+                        stats["copied"] += 1
+                    stats["replaced"] += existed
+            except OSError as e:
+                print_error(f"Error moving {entry.path} into {dst_dir}: {e}")
+    return stats
+
+def process_cursor_files(roo_dir_path, workers=None, use_index=True, mode="move"):
+    """Merges .cursor contents into .roo, modifies files, and removes .cursor.
+
+    The .cursor directory is looked up next to roo_dir_path, so passing
+    <project>/.roo works for projects other than the current directory.
+    mode="move" renames entries into .roo (see merge_cursor_by_move); "copy" uses
+    the original copytree merge. workers bounds the process pool used to rewrite
+    files (default: CPU count); use_index=False ignores the .roo/.migration-index
+    ledger and rebuilds it.
+    """
+    print_step("Processing legacy .cursor directory (if exists)  legacy files 🧹")
+    roo_dir = roo_dir_path # Already a Path object
+    cursor_dir = roo_dir.parent / ".cursor"
+
+    if cursor_dir.exists() and cursor_dir.is_dir():
+        if mode == "move":
+            print_info(f"Found {cursor_dir}. Moving contents into {roo_dir}...")
+            try:
+                roo_dir.mkdir(parents=True, exist_ok=True)
+                with profile_span("merge_cursor", "merge", mode=mode) as span_attrs:
+                    stats = merge_cursor_by_move(cursor_dir, roo_dir)
+                    span_attrs.update(stats)
+                print_info(f"Merged {cursor_dir} into {roo_dir}: moved {stats['moved_dirs']} directories and "
+                           f"{stats['moved_files']} files ({stats['replaced']} replacing existing files), "
+                           f"copied {stats['copied']} entries.")
+            except Exception as e:
+                print_error(f"Error merging {cursor_dir} into {roo_dir}: {e}")
+                # Don't return here, try to continue with modification/deletion
+        else:
+            print_info(f"Found {cursor_dir}. Merging contents into {roo_dir}...")
+            # --- FIX: Use copytree with dirs_exist_ok=True to merge ---
+            try:
+                # Ensure the target directory exists
+                roo_dir.mkdir(parents=True, exist_ok=True)
+                # Copy contents, merging with existing directory (Requires Python 3.8+)
+                with profile_span("merge_cursor", "merge", mode=mode):
+                    shutil.copytree(cursor_dir, roo_dir, dirs_exist_ok=True)
+                print_info(f"Merged contents of {cursor_dir} into {roo_dir}.")
+            except TypeError:
+                # Fallback for Python < 3.8 which doesn't support dirs_exist_ok
+                print_warning("Python version < 3.8 detected. Using manual file copy for merging.")
+                try:
+                    for item in os.listdir(cursor_dir):
+                        s = cursor_dir / item
+                        d = roo_dir / item
+                        if s.is_dir():
+                            # For directories, try copytree again for sub-merging if possible
+                            # This might still fail on very old Python, but covers more cases
+                            try:
+                                shutil.copytree(s, d, dirs_exist_ok=True)
+                            except TypeError: # Inner copytree failed
+                                 print_warning(f"Manual recursive copy needed for {s}. Skipping complex merge for older Python.")
+                                 # Implement a full recursive manual copy if absolutely needed,
+                                 # but for now, we'll just warn and skip deep merge for simplicity.
+                        elif s.is_file(): # Only copy if it's a file
+                            shutil.copy2(s, d) # copy2 preserves metadata
+                    print_info(f"Manually merged contents of {cursor_dir} into {roo_dir}.")
+                except Exception as e_fallback:
+                     print_error(f"Error during manual merge of {cursor_dir} into {roo_dir}: {e_fallback}")
+                     # Don't return here, try to continue with modification/deletion
+            except Exception as e:
+                print_error(f"Error merging {cursor_dir} into {roo_dir}: {e}")
+                # Don't return here, try to continue with modification/deletion
+
+        # --- Modification Step (Runs even if merge had issues, on whatever is in .roo) ---
+        print_info(f"Modifying files within {roo_dir} (if merge occurred)...")
+        if roo_dir.exists(): # Check if target dir exists before walking
+            files_processed, files_renamed = rewrite_migrated_files(roo_dir, workers=workers, use_index=use_index)
+            print_info(f"Finished modifying files. Processed: {files_processed}, Renamed: {files_renamed}")
+        else:
+             print_warning(f"{roo_dir} does not exist, skipping modification step.")
+
+
+        # --- Deletion Step ---
+        print_info(f"Removing original {cursor_dir} directory...")
+        try:
+            shutil.rmtree(cursor_dir)
+            print_info(f"Successfully removed {cursor_dir}.")
+        except OSError as e:
+            print_error(f"Error removing {cursor_dir}: {e}")
+
+    else:
+        print_info(f"{cursor_dir} directory not found. Skipping merge, modification, and deletion of .cursor.")
+        # Ensure .roo directory exists anyway for fetched rules later
+        roo_dir.mkdir(parents=True, exist_ok=True)
+
+def remove_windsurf_rules(project_dir=Path(".")):
+    """Removes the project's .windsurfrules file if it exists."""
+    windsurf_file = Path(project_dir) / ".windsurfrules"
+    if windsurf_file.exists():
+        print_step("Removing legacy .windsurfrules file 🧹")
+        print_info(f"Found {windsurf_file}. Removing...")
+        try:
+            os.remove(windsurf_file)
+            print_info(f"Successfully removed {windsurf_file}.")
+        except OSError as e:
+            print_error(f"Error removing {windsurf_file}: {e}")
+    else:
+        print_info(".windsurfrules file not found, skipping removal.")
+
+def legacy_leftovers(project_dir):
+    """The legacy entries of a project that process_cursor_files() and remove_windsurf_rules() would handle."""
+    project_dir = Path(project_dir)
+    return ([".cursor"] if (project_dir / ".cursor").is_dir() else []) + \
+           ([".windsurfrules"] if (project_dir / ".windsurfrules").exists() else [])
+
+
+# --- Helper function to mask keys ---
+def mask_sensitive_mcp_data(mcp_entry):
+    """Creates a copy of an MCP server entry with sensitive env vars masked."""
+    if not isinstance(mcp_entry, dict):
+        return mcp_entry # Return as-is if not a dict
+
+    # Deep copy to avoid modifying the original config object in memory
+    masked_entry = json.loads(json.dumps(mcp_entry))
+
+    if "env" in masked_entry and isinstance(masked_entry["env"], dict):
+        for key in masked_entry["env"]:
+            # Mask keys commonly used for secrets
+            if "KEY" in key.upper() or "TOKEN" in key.upper() or "SECRET" in key.upper():
+                 value = masked_entry["env"].get(key) # Use .get for safety
+                 # Show first/last few chars for identification if key is long enough string
+                 if isinstance(value, str) and len(value) > 8:
+                     masked_entry["env"][key] = f"{value[:4]}****{value[-4:]} [MASKED]"
+                 elif isinstance(value, str) and value: # Mask non-empty short strings
+                     masked_entry["env"][key] = "[MASKED]"
+                 # Leave empty strings or non-strings alone, or mask them too? Masking seems safer.
+                 elif value: # Mask other non-empty values
+                     masked_entry["env"][key] = "[MASKED]"
+                 # else: leave empty/None as is
+    return masked_entry
+
+# --- Installed Package Probe ---
+
+def parse_version(text):
+    """Parses '1.2.3', 'v1.2' or '1.2.3-beta.1' into ((major, minor, patch), prerelease, given_parts)."""
+    match = re.match(r"^\s*[v=]?\s*(\d+|[xX*])(?:\.(\d+|[xX*]))?(?:\.(\d+|[xX*]))?(?:-([0-9A-Za-z.-]+))?(?:\+\S*)?\s*$", text or "")
+    if not match:
+        return None
+    parts = [p for p in match.groups()[:3] if p is not None and p not in ("x", "X", "*")]
+    numbers = tuple(int(p) for p in parts) + (0,) * (3 - len(parts))
+    return numbers, match.group(4) or "", len(parts)
+
+def _comparator_ranges(comparator):
+    """Expands one npm comparator (e.g. '^1.2', '~0.3.1', '>=1', '1.x') into (operator, version) pairs."""
+    match = re.match(r"^(\^|~|>=|<=|>|<|=)?(.*)$", comparator)
+    operator, version_text = match.group(1) or "", match.group(2)
+    parsed = parse_version(version_text)
+    if parsed is None:
+        raise ValueError(f"Invalid version in constraint: {comparator!r}")
+    (major, minor, patch), _, given = parsed
+    if given == 0:
+        return [] # '*' / 'x' matches anything
+    if operator == "^":
+        if major > 0 or given == 1:
+            upper = (major + 1, 0, 0)
+        elif minor > 0 or given == 2:
+            upper = (0, minor + 1, 0)
+        else:
+            upper = (0, 0, patch + 1)
+        return [(">=", (major, minor, patch)), ("<", upper)]
+    if operator == "~":
+        upper = (major + 1, 0, 0) if given == 1 else (major, minor + 1, 0)
+        return [(">=", (major, minor, patch)), ("<", upper)]
+    if operator in ("", "=") and given < 3:
+        # Partial versions are ranges: '1.2' means >=1.2.0 <1.3.0
+        upper = (major + 1, 0, 0) if given == 1 else (major, minor + 1, 0)
+        return [(">=", (major, minor, patch)), ("<", upper)]
+    if operator in (">", "<=") and given < 3:
+        # '>1.2' means >=1.3.0 and '<=1.2' means <1.3.0
+        upper = (major + 1, 0, 0) if given == 1 else (major, minor + 1, 0)
+        return [(">=" if operator == ">" else "<", upper)]
+    return [(operator or "=", (major, minor, patch))]
+
+def version_satisfies(version, constraint):
+    """Checks a version string against an npm-style range ('*', '^0.10', '>=0.9 <2', '1.x || 2.x')."""
+    parsed = parse_version(version)
+    if parsed is None:
+        return False
+    numbers, prerelease, _ = parsed
+    constraint = (constraint or "*").strip()
+    if constraint in ("", "*", "latest"):
+        return not prerelease
+    checks = {
+        ">=": lambda a, b: a >= b, ">": lambda a, b: a > b,
+        "<=": lambda a, b: a <= b, "<": lambda a, b: a < b, "=": lambda a, b: a == b,
+    }
+    for alternative in constraint.split("||"):
+        # Allow '>= 1.2' as well as '>=1.2'
+        comparators = re.sub(r"(>=|<=|>|<|=|\^|~)\s+", r"\1", alternative).split()
+        if not comparators:
+            comparators = ["*"]
+        ranges = [r for comparator in comparators for r in _comparator_ranges(comparator)]
+        if prerelease and not any(op in ("=", ">=", ">") and bound == numbers for op, bound in ranges):
+            continue # Like npm, prereleases only match ranges that name that exact version
+        if all(checks[op](numbers, bound) for op, bound in ranges):
+            return True
+    return False
+
+def _read_npmrc_prefix(npmrc_path):
+    """Returns the 'prefix' setting from an npmrc file, or None."""
+    try:
+        with open(npmrc_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                key, sep, value = line.partition("=")
+                if sep and key.strip() == "prefix":
+                    value = value.strip().strip('"\'')
+                    value = re.sub(r"\$\{([^}]+)\}", lambda m: os.getenv(m.group(1), ""), value)
+                    return os.path.expanduser(value) or None
+    except OSError:
+        pass
+    return None
+
+@functools.lru_cache(maxsize=None)
+def get_npm_global_prefix():
+    """Resolves npm's global prefix from the environment, ~/.npmrc and the node location.
+
+    Mirrors npm's own lookup without spawning npm. Resolved once per process.
+    """
+    for env_var in ("npm_config_prefix", "NPM_CONFIG_PREFIX"):
+        if os.getenv(env_var):
+            return Path(os.getenv(env_var)).expanduser()
+    user_npmrc = os.getenv("npm_config_userconfig") or os.getenv("NPM_CONFIG_USERCONFIG") or Path.home() / ".npmrc"
+    prefix = _read_npmrc_prefix(user_npmrc)
+    if prefix:
+        return Path(prefix)
+    if platform.system() == "Windows":
+        appdata = os.getenv('APPDATA')
+        return Path(appdata) / "npm" if appdata else None
+    node_path = shutil.which("node")
+    if not node_path:
+        return None
+    # <prefix>/bin/node -> <prefix>, unless the install's global npmrc overrides it
+    default_prefix = Path(os.path.realpath(node_path)).parent.parent
+    prefix = _read_npmrc_prefix(default_prefix / "etc" / "npmrc")
+    return Path(prefix) if prefix else default_prefix
+
+def find_installed_taskmaster(install_globally, project_dir=Path("."), package=TASKMASTER_PACKAGE):
+    """Finds an installed task-master-ai (or another package) by reading its package.json from disk.
+
+    Local installs are looked up in node_modules of project_dir and its parents
+    (the same places node resolves from). Returns (version, package_json_path)
+    or (None, None) when it is not installed.
+    """
+    if install_globally:
+        prefix = get_npm_global_prefix()
+        if prefix is None:
+            return None, None
+        node_modules = prefix / "node_modules" if platform.system() == "Windows" else prefix / "lib" / "node_modules"
+        candidates = [node_modules / package / "package.json"]
+    else:
+        project_dir = Path(project_dir).resolve()
+        candidates = [d / "node_modules" / package / "package.json" for d in (project_dir, *project_dir.parents)]
+    for package_json in candidates:
+        data = read_json_file(package_json)
+        if isinstance(data, dict) and data.get("name") == package and isinstance(data.get("version"), str):
+            return data["version"], package_json
+    return None, None
+
+def resolve_mcp_launch(install_globally, project_dir=Path(".")):
+    """Finds node and the installed MCP server script, so Roo can start the server without npx.
+
+    The script is the task-master-mcp bin of task-master-ai, or of a standalone
+    task-master-mcp package in the same scope. Returns (command, args) with
+    absolute paths, or None when node or the script is not there.
+    """
+    node = shutil.which("node")
+    if not node:
+        return None
+    for package in (TASKMASTER_PACKAGE, MCP_BIN_NAME):
+        _, package_json = find_installed_taskmaster(install_globally, project_dir, package)
+        data = read_json_file(package_json) if package_json else None
+        bins = data.get("bin") if isinstance(data, dict) else None
+        if isinstance(bins, str):
+            bins = {package: bins} # A bare string is a bin named after the package
+        script = bins.get(MCP_BIN_NAME) if isinstance(bins, dict) else None
+        if isinstance(script, str) and (package_json.parent / script).is_file():
+            return os.path.realpath(node), [os.path.realpath(package_json.parent / script)]
+    return None
+
+# --- Rule Bundles ---
+
+RULES_MODES_FILE = ".roomodes"
+
+class RulesSourceError(Exception):
+    """Raised when modes and rules cannot be loaded from a source or fail verification."""
+
+def is_rule_path(rel_path):
+    """True for paths a rule bundle may install: .roomodes and files under .roo/rules-*/."""
+    parts = rel_path.split("/")
+    if "\\" in rel_path or any(part in ("", ".", "..") for part in parts):
+        return False
+    return rel_path == RULES_MODES_FILE or (len(parts) >= 3 and parts[0] == ".roo" and parts[1].startswith("rules-"))
+
+def collect_rule_files(root):
+    """Reads .roomodes and every file under <root>/.roo/rules-*/ into {relative posix path: bytes}."""
+    root = Path(root)
+    files = {}
+    if (root / RULES_MODES_FILE).is_file():
+        files[RULES_MODES_FILE] = (root / RULES_MODES_FILE).read_bytes()
+    for rules_dir in sorted((root / ".roo").glob("rules-*")):
+        if rules_dir.is_dir():
+            for path in sorted(rules_dir.rglob("*")):
+                if path.is_file():
+                    files[path.relative_to(root).as_posix()] = path.read_bytes()
+    return files
+
+def build_rules_manifest(files):
+    """Describes rule files as {"version": 1, "files": [{"path", "size", "sha256"}, ...]}."""
+    return {"version": 1, "files": [{"path": rel_path, "size": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+                                    for rel_path, data in sorted(files.items())]}
+
+def verify_rule_files(files, manifest):
+    """Checks files ({path: bytes}) against a manifest. Raises RulesSourceError on any mismatch."""
+    if not isinstance(manifest, dict) or manifest.get("version") != 1 or not isinstance(manifest.get("files"), list):
+        raise RulesSourceError("unsupported or malformed rules manifest")
+    expected = {}
+    for entry in manifest["files"]:
+        if not isinstance(entry, dict) or not is_rule_path(str(entry.get("path", ""))):
+            raise RulesSourceError(f"invalid manifest entry: {entry!r}")
+        expected[entry["path"]] = (entry.get("size"), entry.get("sha256"))
+    missing = sorted(set(expected) - set(files))
+    unexpected = sorted(set(files) - set(expected))
+    corrupt = sorted(rel_path for rel_path, (size, digest) in expected.items() if rel_path in files
+                     and (len(files[rel_path]) != size or hashlib.sha256(files[rel_path]).hexdigest() != digest))
+    problems = [f"{label}: {', '.join(paths)}" for label, paths in
+                (("missing", missing), ("not in manifest", unexpected), ("size or sha256 mismatch", corrupt)) if paths]
+    if problems:
+        raise RulesSourceError("rule files do not match the manifest (" + "; ".join(problems) + ")")
+
+def build_rules_bundle(files, fmt="tar.gz"):
+    """Packs rule files and their manifest into a tar.gz or zip archive and returns its bytes.
+
+    Timestamps, owners and member order are fixed, so the same files always
+    produce the same bundle.
+    """
+    manifest_data = (json.dumps(build_rules_manifest(files), indent=2) + "\n").encode('utf-8')
+    members = [(RULES_MANIFEST_NAME, manifest_data)] + sorted(files.items())
+    buffer = io.BytesIO()
+    if fmt == "zip":
+        with zipfile.ZipFile(buffer, "w") as archive:
+            for name, data in members:
+                info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.external_attr = 0o644 << 16
+                archive.writestr(info, data)
+    else:
+        with gzip.GzipFile(filename="", fileobj=buffer, mode="wb", mtime=0) as compressed:
+            with tarfile.open(fileobj=compressed, mode="w", format=tarfile.PAX_FORMAT) as archive:
+                for name, data in members:
+                    info = tarfile.TarInfo(name)
+                    info.size, info.mode, info.mtime = len(data), 0o644, 0
+                    archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+def read_rules_bundle(data, require_manifest=True):
+    """Unpacks a tar(.gz) or zip bundle into {path: bytes}, keeping only rule paths.
+
+    The files are verified against the manifest inside the bundle; without one
+    (allowed only when require_manifest is False) they are taken as they are.
+    """
+    members = {}
+    try:
+        if data[:4] == b"PK\x03\x04":
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir():
+                        members[info.filename] = archive.read(info)
+        else:
+            with tarfile.open(fileobj=io.BytesIO(data), mode="r:*") as archive:
+                for member in archive:
+                    if member.isfile(): # Links and devices are never installed
+                        members[member.name] = archive.extractfile(member).read()
+    except (tarfile.TarError, zipfile.BadZipFile, EOFError, OSError) as e:
+        raise RulesSourceError(f"unreadable rules bundle: {e}")
+    members = {name[2:] if name.startswith("./") else name: body for name, body in members.items()}
+    files = {name: body for name, body in members.items() if is_rule_path(name)}
+    if RULES_MANIFEST_NAME in members:
+        try:
+            manifest = json.loads(members[RULES_MANIFEST_NAME].decode('utf-8'))
+        except ValueError as e:
+            raise RulesSourceError(f"malformed {RULES_MANIFEST_NAME} in bundle: {e}")
+        verify_rule_files(files, manifest)
+    elif require_manifest:
+        raise RulesSourceError(f"bundle has no {RULES_MANIFEST_NAME}")
+    if not files:
+        raise RulesSourceError("bundle contains no modes or rules")
+    return files
+
+class URLRulesSource:
+    """Bundle published over HTTP(S), e.g. the GitHub repository or an internal mirror.
+
+    url is either a base URL (RULES_BUNDLE_NAME is appended) or the bundle itself.
+    If no bundle is published there (404), the manifest next to it is fetched and
+    the files it lists are downloaded individually and verified.
+    """
+
+    def __init__(self, url):
+        if urllib.parse.urlsplit(url).path.endswith(RULES_ARCHIVE_SUFFIXES):
+            self.bundle_url = url
+        else:
+            self.bundle_url = (url if url.endswith("/") else url + "/") + RULES_BUNDLE_NAME
+        self.base_url = self.bundle_url.rsplit("/", 1)[0] + "/"
+        self.description = self.bundle_url
+
+    def load(self, cache=None, offline=False):
+        body, status = fetch_url(self.bundle_url, cache=cache, offline=offline)
+        if body is not None:
+            return read_rules_bundle(body)
+        if status != 404 and not offline:
+            raise RulesSourceError(f"could not download {self.bundle_url}")
+        print_warning(f"No rules bundle at {self.bundle_url}; downloading the files listed in {RULES_MANIFEST_NAME}.")
+        return self._load_per_file(cache, offline)
+
+    def _load_per_file(self, cache, offline):
+        """Fallback for mirrors that only publish the manifest and the plain files."""
+        manifest_url = self.base_url + RULES_MANIFEST_NAME
+        body, _ = fetch_url(manifest_url, cache=cache, offline=offline)
+        if body is None:
+            raise RulesSourceError(f"could not download {manifest_url}")
+        try:
+            manifest = json.loads(body.decode('utf-8'))
+            paths = [entry["path"] for entry in manifest["files"]]
+        except (ValueError, KeyError, TypeError) as e:
+            raise RulesSourceError(f"malformed {manifest_url}: {e}")
+        if not all(isinstance(path, str) and is_rule_path(path) for path in paths):
+            raise RulesSourceError(f"{manifest_url} lists paths outside .roomodes and .roo/rules-*")
+        with tempfile.TemporaryDirectory(prefix="roo-taskmaster-rules-") as staging_dir:
+            jobs = [(self.base_url + urllib.parse.quote(path), Path(staging_dir) / path) for path in paths]
+            download_files(jobs, cache=cache, offline=offline)
+            files = {path: local_path.read_bytes() for path, (_, local_path) in zip(paths, jobs) if local_path.exists()}
+        verify_rule_files(files, manifest)
+        return files
+
+class DirectoryRulesSource:
+    """Local directory: a checkout with .roomodes and .roo/rules-*, or a mirror holding RULES_BUNDLE_NAME."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.description = str(self.path)
+
+    def load(self, cache=None, offline=False):
+        if (self.path / RULES_MODES_FILE).is_file() or (self.path / ".roo").is_dir():
+            files = collect_rule_files(self.path)
+            if not files:
+                raise RulesSourceError(f"no .roomodes or .roo/rules-* files in {self.path}")
+            return files
+        for bundle_name in (RULES_BUNDLE_NAME, RULES_ZIP_BUNDLE_NAME):
+            if (self.path / bundle_name).is_file():
+                return ArchiveRulesSource(self.path / bundle_name).load()
+        raise RulesSourceError(f"{self.path} has neither rule files nor a {RULES_BUNDLE_NAME}")
+
+class ArchiveRulesSource:
+    """Local tar, tar.gz or zip bundle (as written by the 'pack' command)."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.description = str(self.path)
+
+    def load(self, cache=None, offline=False):
+        try:
+            data = self.path.read_bytes()
+        except OSError as e:
+            raise RulesSourceError(f"could not read {self.path}: {e}")
+        return read_rules_bundle(data)
+
+class GitRulesSource:
+    """Committed rule files of a local git checkout at a given ref (working tree changes are ignored)."""
+
+    def __init__(self, repo, ref="HEAD"):
+        self.repo = Path(repo)
+        self.ref = ref
+        self.description = f"git checkout {self.repo} at {ref}"
+
+    def load(self, cache=None, offline=False):
+        command = ["git", "-C", str(self.repo), "archive", "--format=tar", self.ref, "--", RULES_MODES_FILE, ".roo"]
+        with profile_span("git archive", "subprocess", exit_code=None) as span_attrs:
+            try:
+                process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL)
+            except FileNotFoundError:
+                raise RulesSourceError("git is not installed or not in PATH")
+            span_attrs["exit_code"] = process.returncode
+        if process.returncode != 0:
+            raise RulesSourceError(f"git archive failed: {process.stderr.decode('utf-8', 'replace').strip()}")
+        return read_rules_bundle(process.stdout, require_manifest=False)
+
+def open_rules_source(spec):
+    """Returns the rules source for an --rules-source value.
+
+    Accepts an http(s) URL (base or bundle), 'git:PATH[#REF]' for a local checkout,
+    a tar/zip bundle file or a directory. Objects with a load() method pass through.
+    """
+    if hasattr(spec, "load"):
+        return spec
+    spec = str(spec)
+    if spec.startswith(("http://", "https://")):
+        return URLRulesSource(spec)
+    if spec.startswith("git:"):
+        repo, _, ref = spec[len("git:"):].partition("#")
+        if not Path(repo).expanduser().is_dir():
+            raise RulesSourceError(f"git checkout not found: {repo}")
+        return GitRulesSource(Path(repo).expanduser(), ref or "HEAD")
+    path = Path(spec).expanduser()
+    if path.is_dir():
+        return DirectoryRulesSource(path)
+    if path.is_file():
+        return ArchiveRulesSource(path)
+    raise RulesSourceError(f"rules source not found: {spec}")
+
+def pack_rules(source_dir, output_dir, fmt="tar.gz", check=False):
+    """Writes RULES_MANIFEST_NAME and the bundle for the rule files in source_dir.
+
+    With check=True nothing is written; returns 1 if the published files are out of date.
+    """
+    files = collect_rule_files(source_dir)
+    if not files:
+        print_error(f"No .roomodes or .roo/rules-* files found in {source_dir}.")
+        return 1
+    bundle_name = RULES_ZIP_BUNDLE_NAME if fmt == "zip" else RULES_BUNDLE_NAME
+    bundle = build_rules_bundle(files, fmt)
+    manifest = build_rules_manifest(files)
+    manifest["bundle"] = {"name": bundle_name, "size": len(bundle), "sha256": hashlib.sha256(bundle).hexdigest()}
+    outputs = {Path(output_dir) / bundle_name: bundle,
+               Path(output_dir) / RULES_MANIFEST_NAME: (json.dumps(manifest, indent=2) + "\n").encode('utf-8')}
+    if check:
+        stale = [str(path) for path, data in outputs.items() if not path.is_file() or path.read_bytes() != data]
+        if stale:
+            print_error(f"Out of date (run 'pack' again): {', '.join(stale)}")
+            return 1
+        print_info(f"{bundle_name} and {RULES_MANIFEST_NAME} are up to date ({len(files)} files).")
+        return 0
+    for path, data in outputs.items():
+        atomic_write_bytes(path, data)
+    print_info(f"Packed {len(files)} files ({sum(len(d) for d in files.values())} bytes) into "
+               f"{Path(output_dir) / bundle_name} ({len(bundle)} bytes) and wrote {RULES_MANIFEST_NAME}.")
+    return 0
+
+# --- Rule Compaction ---
+
+def _split_blocks(text):
+    """Splits Markdown into blocks separated by blank lines; a fenced code block stays whole and verbatim.
+
+    Outside fences, trailing whitespace is dropped.
+    """
+    blocks, current, fence = [], [], None
+    for line in text.replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+        stripped = line.strip()
+        if fence:
+            current.append(line)
+            if stripped.startswith(fence):
+                fence = None
+        elif not stripped:
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+        else:
+            if stripped.startswith(("```", "~~~")):
+                fence = stripped[:3]
+            current.append(line.rstrip())
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+def _block_key(block):
+    return " ".join(block.split())
+
+def _heading_level(block):
+    """Level of a block that is a single Markdown heading line, else 0."""
+    match = re.match(r"(#{1,6}) \S", block)
+    return len(match.group(1)) if match and "\n" not in block else 0
+
+def _drop_emptied_sections(entries):
+    """Marks a heading as dropped when every block of its section was dropped; entries are [block, kept]."""
+    for i in range(len(entries) - 1, -1, -1): # Innermost sections first
+        level = _heading_level(entries[i][0])
+        if not level or not entries[i][1]:
+            continue
+        section = []
+        for block, kept in entries[i + 1:]:
+            if 0 < _heading_level(block) <= level:
+                break
+            section.append(kept)
+        if section and not any(section):
+            entries[i][1] = False
+
+def _rules_by_mode(files):
+    """Groups rule paths by mode slug (the part after 'rules-'), in the order Roo reads them."""
+    modes = collections.defaultdict(list)
+    for rel_path in sorted(files):
+        if rel_path != RULES_MODES_FILE:
+            modes[rel_path.split("/")[1][len("rules-"):]].append(rel_path)
+    return modes
+
+def _mode_definitions(files):
+    """{slug: text Roo sends for the mode from .roomodes}; empty if there is no usable .roomodes."""
+    try:
+        modes = json.loads(files[RULES_MODES_FILE].decode('utf-8'))["customModes"]
+        return {mode["slug"]: "\n\n".join(str(mode[field]) for field in COMPACT_MODE_FIELDS if mode.get(field))
+                for mode in modes}
+    except (KeyError, ValueError, TypeError):
+        return {}
+
+def compact_rule_files(files):
+    """Returns (compacted files, shared) for {path: bytes} of .roomodes and .roo/rules-*.
+
+    Within each mode's context (its .roomodes entry, then its rule files in
+    order) a block already seen is dropped, along with a heading whose whole
+    section went; blank-line runs collapse and trailing whitespace goes.
+    Blocks shorter than COMPACT_MIN_BLOCK_CHARS (headings, separators) are
+    never dropped, and only UTF-8 files with COMPACT_RULE_EXTENSIONS are
+    rewritten. .roomodes is not rewritten: it is JSON that Roo parses and the
+    slug merge compares with the published copy, so its mode text only seeds
+    what each mode has already seen.
+
+    shared is (number, bytes) of distinct blocks that appear in more than one
+    mode. They cannot be removed, since each mode's requests only carry that
+    mode's context.
+    """
+    compacted = dict(files)
+    definitions = _mode_definitions(files)
+    modes_by_block = collections.defaultdict(set)
+    by_mode = _rules_by_mode(files)
+    for slug in sorted(set(definitions) | set(by_mode)):
+        seen = {_block_key(block) for block in _split_blocks(definitions.get(slug, ""))}
+        for block in seen:
+            modes_by_block[block].add(slug)
+        for rel_path in by_mode.get(slug, []):
+            if not rel_path.endswith(COMPACT_RULE_EXTENSIONS):
+                continue
+            try:
+                text = files[rel_path].decode('utf-8')
+            except UnicodeDecodeError:
+                continue
+            entries = []
+            for block in _split_blocks(text):
+                key = _block_key(block)
+                modes_by_block[key].add(slug)
+                entries.append([block, not (len(key) >= COMPACT_MIN_BLOCK_CHARS and key in seen)])
+                seen.add(key)
+            _drop_emptied_sections(entries)
+            kept = [block for block, keep in entries if keep]
+            compacted[rel_path] = ("\n\n".join(kept) + "\n").encode('utf-8') if kept else b""
+    shared = [key for key, slugs in modes_by_block.items() if len(slugs) > 1 and len(key) >= COMPACT_MIN_BLOCK_CHARS]
+    return compacted, (len(shared), sum(len(key.encode('utf-8')) for key in shared))
+
+def estimate_tokens(byte_count):
+    """Rough LLM token count for English text and Markdown (~4 bytes per token)."""
+    return -(-byte_count // BYTES_PER_TOKEN)
+
+def rules_context_report(before, after):
+    """Rows of (mode, bytes before, bytes after) for the context each mode adds to a request."""
+    definitions = _mode_definitions(before)
+    by_mode = _rules_by_mode(before)
+    rows = []
+    for slug in sorted(set(definitions) | set(by_mode)):
+        base = len(definitions.get(slug, "").encode('utf-8'))
+        rows.append((slug, base + sum(len(before[path]) for path in by_mode.get(slug, [])),
+                     base + sum(len(after[path]) for path in by_mode.get(slug, []))))
+    return rows
+
+def print_rules_context_report(rows, shared):
+    """Prints per-mode bytes and estimated tokens before and after compaction, plus totals."""
+    width = max([len("MODE"), len("TOTAL")] + [len(slug) for slug, _, _ in rows])
+    header = f"{'MODE':<{width}}  {'BYTES':>8}  {'COMPACT':>8}  {'TOKENS':>7}  {'COMPACT':>7}  {'SAVED':>6}"
+    print_plain(f"{COLOR_BOLD}{header}{COLOR_RESET}")
+    for slug, before, after in rows + [("TOTAL", sum(r[1] for r in rows), sum(r[2] for r in rows))]:
+        saved = f"{100 * (before - after) / before:.0f}%" if before else "-"
+        print_plain(f"{slug:<{width}}  {before:>8}  {after:>8}  {estimate_tokens(before):>7}  "
+                    f"{estimate_tokens(after):>7}  {saved:>6}")
+    count, size = shared
+    if count:
+        print_info(f"{count} blocks ({size} bytes) recur across modes; each mode keeps its own copy.")
+
+def report_rules_context(source_dir):
+    """The 'pack --report' command: prints the context report for the rule files in source_dir."""
+    files = collect_rule_files(source_dir)
+    if not files:
+        print_error(f"No .roomodes or .roo/rules-* files found in {source_dir}.")
+        return 1
+    compacted, shared = compact_rule_files(files)
+    print_rules_context_report(rules_context_report(files, compacted), shared)
+    return 0
+
+# --- Installation Steps ---
+
+def get_install_command(install_globally, constraint=DEFAULT_TASKMASTER_VERSION):
+    """Builds the npm command that installs task-master-ai (pinned to constraint unless it is '*')."""
+    package_spec = TASKMASTER_PACKAGE if constraint in ("", "*", "latest") else f"{TASKMASTER_PACKAGE}@{constraint}"
+    if install_globally:
+        return ["npm", "install", "-g", package_spec] + npm_install_options()
+    return ["npm", "install", package_spec] + npm_install_options()
+
+def install_taskmaster_package(install_globally, cwd=None, stdin=None, constraint=DEFAULT_TASKMASTER_VERSION, reinstall=False,
+                               echo=True):
+    """Installs task-master-ai with npm (capturing output). Returns True on success.
+
+    npm is skipped entirely when a version satisfying constraint is already on disk,
+    unless reinstall is set. echo is passed to run_command_capture.
+    """
+    print_step(f"Installing taskmaster-ai {'globally' if install_globally else 'locally'} 📦")
+    installed_version, package_json = find_installed_taskmaster(install_globally, cwd or Path("."))
+    if installed_version and not reinstall:
+        if version_satisfies(installed_version, constraint):
+            print_info(f"{TASKMASTER_PACKAGE} {installed_version} is already installed ({package_json.parent}) "
+                       f"and satisfies '{constraint}'. Skipping npm install. ✅")
+            return True
+        print_info(f"Installed {TASKMASTER_PACKAGE} {installed_version} does not satisfy '{constraint}'. Updating...")
+    # Use run_command_capture here as we don't need interaction, just success/fail and logs
+    success, _, _ = run_command_capture(get_install_command(install_globally, constraint),
+                                        shell=platform.system() == "Windows", cwd=cwd, stdin=stdin, echo=echo)
+    return success
+
+def check_mcp_configuration():
+    """Reads the Roo Code MCP settings and reports whether the Taskmaster server is configured.
+
+    Returns (mcp_config_path, mcp_config, taskmaster_mcp_exists, config_read_error).
+    mcp_config is None when the settings path cannot be determined.
+    """
+    print_step("Checking Roo Code MCP Configuration ⚙️")
+    mcp_config_path = get_mcp_settings_path()
+    mcp_config = None
+    taskmaster_mcp_exists = False
+    config_read_error = False
+
+    if mcp_config_path:
+        print_info(f"Checking MCP settings path: {mcp_config_path}")
+        if mcp_config_path.exists():
+            mcp_config = read_json_file(mcp_config_path)
+            if mcp_config is None:
+                # read_json_file already printed an error
+                config_read_error = True
+                mcp_config = {"mcpServers": {}} # Attempt recovery
+            # Check the structure carefully
+            elif isinstance(mcp_config.get("mcpServers"), dict) and MCP_SERVER_NAME in mcp_config["mcpServers"]:
+                taskmaster_mcp_exists = True
+                print_info(f"Found existing '{MCP_SERVER_NAME}' configuration.")
+            elif "mcpServers" not in mcp_config or not isinstance(mcp_config.get("mcpServers"), dict):
+                 print_warning("MCP config 'mcpServers' key is missing or not a dictionary. Ensuring key exists.")
+                 mcp_config["mcpServers"] = {} # Ensure the key exists as a dict
+                 # Taskmaster doesn't exist in this case
+            else:
+                 # mcpServers exists and is a dict, but taskmaster isn't in it
+                 print_info(f"'{MCP_SERVER_NAME}' configuration not found in mcpServers.")
+        else:
+            print_info(f"MCP settings file not found at expected location. Will offer to create/configure.")
+            mcp_config = {"mcpServers": {}} # Initialize structure for potential writing
+    else:
+        print_warning("Could not determine MCP settings path. Skipping MCP check and configuration.")
+        # Cannot proceed with MCP config if path is unknown
+        mcp_config = None # Ensure mcp_config is None if path is None
+
+    return mcp_config_path, mcp_config, taskmaster_mcp_exists, config_read_error
+
+def build_mcp_entry(anthropic_key="", perplexity_key="", temperature=0.2):
+    """Builds the taskmaster-ai MCP server entry, using placeholders for keys that were not provided."""
+    new_mcp_entry = {
+        "command": DEFAULT_MCP_COMMAND,
+        "args": DEFAULT_MCP_ARGS,
+        "env": DEFAULT_MCP_ENV.copy(), # Make a copy to modify
+        "alwaysAllow": DEFAULT_MCP_ALWAYS_ALLOW
+    }
+    if anthropic_key:
+        new_mcp_entry["env"]["ANTHROPIC_API_KEY"] = anthropic_key
+    else:
+        print_warning("Anthropic API Key not provided. Using placeholder.")
+    if perplexity_key:
+        new_mcp_entry["env"]["PERPLEXITY_API_KEY"] = perplexity_key
+    else:
+        print_warning("Perplexity API Key not provided. Using placeholder.")
+    new_mcp_entry["env"]["TEMPERATURE"] = str(temperature) # Store as string
+    return new_mcp_entry
+
+def mcp_server_env(env):
+    """The environment Roo gives a stdio MCP server: a few inherited variables plus the entry's env."""
+    inherited = MCP_INHERITED_ENV_WINDOWS if platform.system() == "Windows" else MCP_INHERITED_ENV_POSIX
+    server_env = {key: os.environ[key] for key in inherited if key in os.environ}
+    server_env.update({key: str(value) for key, value in (env or {}).items()})
+    return server_env
+
+def probe_mcp_server(command, args, env, cwd=None, timeout=MCP_COLD_START_TIMEOUT, list_tools=True):
+    """Starts an MCP server over stdio like Roo does and runs the 'initialize' and 'tools/list' exchange.
+
+    Returns {"initialize": seconds, "tools_list": seconds, "tools": [names], "error": message};
+    times are measured from the start of the process, and values that were not
+    reached are None. The server is stopped afterwards.
+    """
+    result = {"initialize": None, "tools_list": None, "tools": None, "error": None}
+    timeout = current_deadline().timeout(timeout)
+    lines = queue.Queue()
+    started = time.perf_counter()
+    try:
+        process = subprocess.Popen([command] + list(args), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL, env=mcp_server_env(env), cwd=cwd,
+                                   shell=platform.system() == "Windows", **_process_group_kwargs())
+    except OSError as e:
+        result["error"] = f"could not start {command}: {e}"
+        return result
+    track_process(process)
+
+    def read_lines():
+        for line in process.stdout:
+            lines.put(line)
+        lines.put(None) # The server exited
+
+    def send(message):
+        process.stdin.write((json.dumps({"jsonrpc": "2.0", **message}) + "\n").encode('utf-8'))
+        process.stdin.flush()
+
+    def response(request_id):
+        while True:
+            line = lines.get(timeout=max(0, timeout - (time.perf_counter() - started)))
+            if line is None:
+                raise EOFError
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue # Not a JSON-RPC message (e.g. a log line on stdout)
+            if isinstance(message, dict) and message.get("id") == request_id:
+                if "error" in message:
+                    raise ValueError(message["error"].get("message") if isinstance(message["error"], dict)
+                                     else message["error"])
+                return message.get("result") if isinstance(message.get("result"), dict) else {}
+
+    step = "initialize"
+    try:
+        threading.Thread(target=read_lines, daemon=True).start()
+        send({"id": 1, "method": "initialize",
+              "params": {"protocolVersion": MCP_PROTOCOL_VERSION, "capabilities": {},
+                         "clientInfo": {"name": "roo-taskmaster-installer", "version": "1"}}})
+        response(1)
+        result["initialize"] = time.perf_counter() - started
+        if not list_tools:
+            return result
+        step = "tools/list"
+        send({"method": "notifications/initialized"})
+        tools, cursor, request_id = [], None, 2
+        while True: # Follow nextCursor through every page
+            send({"id": request_id, "method": "tools/list", "params": {"cursor": cursor} if cursor else {}})
+            page = response(request_id)
+            tools += [tool.get("name") for tool in page.get("tools", []) if isinstance(tool, dict)]
+            cursor, request_id = page.get("nextCursor"), request_id + 1
+            if not cursor:
+                break
+        result["tools_list"] = time.perf_counter() - started
+        result["tools"] = tools
+    except queue.Empty:
+        result["error"] = f"no answer to '{step}' within {timeout:.0f}s"
+    except (EOFError, OSError):
+        result["error"] = f"the server exited before answering '{step}'"
+    except ValueError as e:
+        result["error"] = f"'{step}' failed: {e}"
+    finally:
+        stop_process_tree(process, grace=1)
+        untrack_process(process)
+    return result
+
+def measure_mcp_cold_start(command, args, env, timeout=MCP_COLD_START_TIMEOUT):
+    """Seconds from starting an MCP server over stdio until it answers 'initialize', or None."""
+    return probe_mcp_server(command, args, env, timeout=timeout, list_tools=False)["initialize"]
+
+def pin_mcp_launch(install_globally, mcp_config_path, project_dir=Path("."), echo=True):
+    """Points the taskmaster-ai MCP entry at node and the installed server script instead of npx.
+
+    Installs the standalone task-master-mcp package in the same scope if
+    task-master-ai does not ship the script, and keeps npx when neither can be
+    resolved. Prints the measured cold start of both commands. Returns True if
+    the entry now uses the resolved paths.
+    """
+    print_step("Resolving the MCP server launch command 🚀")
+    launch = resolve_mcp_launch(install_globally, project_dir)
+    if launch is None and shutil.which("node"):
+        print_info(f"{TASKMASTER_PACKAGE} does not include the {MCP_BIN_NAME} script; installing {MCP_BIN_NAME}...")
+        command = (["npm", "install", "-g", MCP_BIN_NAME] if install_globally else ["npm", "install", MCP_BIN_NAME]) \
+            + npm_install_options()
+        installed, _, _ = run_command_capture(command, shell=platform.system() == "Windows",
+                                              cwd=None if install_globally else project_dir,
+                                              stdin=subprocess.DEVNULL, echo=echo)
+        if installed:
+            launch = resolve_mcp_launch(install_globally, project_dir)
+    if launch is None:
+        print_warning(f"Could not resolve node and the {MCP_BIN_NAME} script; keeping '{DEFAULT_MCP_COMMAND} "
+                      f"{' '.join(DEFAULT_MCP_ARGS)}'.")
+        return False
+    command, args = launch
+    entry = {}
+
+    def pin(current):
+        entry.update(current or build_mcp_entry())
+        entry.update(command=command, args=args)
+        return dict(entry)
+
+    if not update_mcp_server_entry(mcp_config_path, MCP_SERVER_NAME, pin):
+        return False
+    print_info(f"'{MCP_SERVER_NAME}' now starts with: {command} {' '.join(args)}")
+    env = {key: str(value) for key, value in entry.get("env", {}).items()}
+    with profile_span("mcp_cold_start", "mcp") as span_attrs:
+        timings = {"node": measure_mcp_cold_start(command, args, env),
+                   "npx": measure_mcp_cold_start(DEFAULT_MCP_COMMAND, DEFAULT_MCP_ARGS, env)}
+        span_attrs.update(timings)
+    print_info("MCP cold start: " + " vs ".join(
+        f"{seconds:.2f}s with {name}" if seconds is not None else f"no answer within {MCP_COLD_START_TIMEOUT}s with {name}"
+        for name, seconds in timings.items()) + ".")
+    if timings["node"] is not None and timings["npx"] is not None and timings["npx"] > timings["node"]:
+        print_info(f"Starting the server directly saves {timings['npx'] - timings['node']:.2f}s per editor launch. ✅")
+    return True
+
+def read_mcp_server_entry(mcp_config_path):
+    """The taskmaster-ai entry of mcp_settings.json, or None if the file or entry is missing or malformed."""
+    config = read_json_file(mcp_config_path) if mcp_config_path and Path(mcp_config_path).is_file() else None
+    servers = config.get("mcpServers") if isinstance(config, dict) else None
+    entry = servers.get(MCP_SERVER_NAME) if isinstance(servers, dict) else None
+    return entry if isinstance(entry, dict) else None
+
+def run_mcp_probe(mcp_config_path, runs=1, timeout=MCP_COLD_START_TIMEOUT):
+    """Starts the configured taskmaster-ai server `runs` times and checks its tools against alwaysAllow.
+
+    Returns a report dict with p50/p95 times to the 'initialize' answer and to
+    the full tool list, the failed runs, and the always-allowed tools the server
+    does not offer. report["ok"] is True when every run completed and none is missing.
+    """
+    entry = read_mcp_server_entry(mcp_config_path)
+    if entry is None or not isinstance(entry.get("command"), str) or not isinstance(entry.get("args", []), list):
+        return {"ok": False, "runs": 0, "failed": 0, "error": f"no valid '{MCP_SERVER_NAME}' entry in {mcp_config_path}"}
+    env = entry.get("env") if isinstance(entry.get("env"), dict) else {}
+    expected = entry.get("alwaysAllow") if isinstance(entry.get("alwaysAllow"), list) else DEFAULT_MCP_ALWAYS_ALLOW
+    results = []
+    for run in range(runs):
+        with profile_span("mcp_probe", "mcp", run=run) as span_attrs:
+            result = probe_mcp_server(entry["command"], entry.get("args", []), env, cwd=entry.get("cwd"), timeout=timeout)
+            span_attrs.update(initialize=result["initialize"], tools_list=result["tools_list"], error=result["error"])
+        results.append(result)
+    completed = [result for result in results if result["error"] is None]
+    offered = set(completed[-1]["tools"]) if completed else set()
+    report = {
+        "command": entry["command"], "args": entry.get("args", []), "runs": runs,
+        "failed": runs - len(completed),
+        "error": next((result["error"] for result in results if result["error"]), None),
+        "initialize": {name: percentile([r["initialize"] for r in completed], pct) for name, pct in (("p50", 50), ("p95", 95))},
+        "tools_list": {name: percentile([r["tools_list"] for r in completed], pct) for name, pct in (("p50", 50), ("p95", 95))},
+        "tools": sorted(offered),
+        "missing": [name for name in expected if completed and name not in offered],
+    }
+    report["ok"] = bool(completed) and not report["failed"] and not report["missing"]
+    return report
+
+def print_mcp_probe_report(report):
+    """Prints the result of run_mcp_probe()."""
+    if not report["runs"] or report["failed"] == report["runs"]:
+        print_error(f"The MCP server did not complete the handshake: {report['error']}")
+        return
+    timings = {key: (f"{report[key]['p50']:.2f}s" if report["runs"] == 1
+                     else f"p50 {report[key]['p50']:.2f}s / p95 {report[key]['p95']:.2f}s")
+               for key in ("initialize", "tools_list")}
+    runs = "" if report["runs"] == 1 else f" over {report['runs']} runs"
+    print_info(f"MCP server '{report['command']}' answered 'initialize' in {timings['initialize']} and listed "
+               f"{len(report['tools'])} tools in {timings['tools_list']}{runs}.")
+    if report["failed"]:
+        print_warning(f"{report['failed']} of {report['runs']} runs failed: {report['error']}")
+    if report["missing"]:
+        print_warning(f"alwaysAllow lists tools the server does not offer: {', '.join(report['missing'])}")
+    elif not report["failed"]:
+        print_info("Every always-allowed tool is available. ✅")
+
+def merge_roomodes(local, upstream):
+    """Merges a published .roomodes into a project's copy by mode slug.
+
+    Upstream modes replace local ones with the same slug, in upstream order;
+    modes only the project has are kept after them, and other top-level keys
+    the project added are kept too. Returns (data, summary): data is local
+    itself when the merge changes nothing, upstream itself when the project has
+    nothing of its own, and summary lists the changed slugs for the log.
+    """
+    try:
+        upstream_doc = json.loads(upstream.decode('utf-8'))
+        upstream_modes = upstream_doc["customModes"]
+        upstream_slugs = {mode.get("slug") for mode in upstream_modes}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return upstream, "" # Nothing to merge by slug; install it as published
+    try:
+        local_doc = json.loads(local.decode('utf-8'))
+        local_modes = local_doc["customModes"]
+        if not isinstance(local_modes, list):
+            raise TypeError(f"customModes is a {type(local_modes).__name__}, not a list")
+    except (ValueError, KeyError, TypeError) as e:
+        return upstream, f"replaced; the project's copy was not a valid modes file: {e!r}"
+    # Modes without a slug cannot match an upstream one, so they are kept like local-only modes
+    local_slugs = [mode.get("slug") if isinstance(mode, dict) else None for mode in local_modes]
+    local_by_slug = {slug: mode for slug, mode in zip(local_slugs, local_modes) if slug is not None}
+    kept = [mode for slug, mode in zip(local_slugs, local_modes) if slug is None or slug not in upstream_slugs]
+    merged = {**local_doc, **upstream_doc, "customModes": upstream_modes + kept}
+    if merged == local_doc:
+        return local, ""
+    added = [mode.get("slug") for mode in upstream_modes if mode.get("slug") not in local_by_slug]
+    updated = [mode.get("slug") for mode in upstream_modes
+               if mode.get("slug") in local_by_slug and local_by_slug[mode.get("slug")] != mode]
+    summary = "; ".join(f"{label} {', '.join(slugs)}" for label, slugs in
+                        (("updated", updated), ("added", added),
+                         ("kept local", [str(m.get("slug", "(no slug)")) if isinstance(m, dict) else "(not a mode)"
+                                         for m in kept])) if slugs)
+    if merged == upstream_doc:
+        return upstream, summary
+    return (json.dumps(merged, indent=2) + "\n").encode('utf-8'), summary
+
+def _line_delta(old, new):
+    """'+A -R' line counts between two versions of a text file."""
+    added = removed = 0
+    for line in difflib.unified_diff(old.decode('utf-8', errors='replace').splitlines(),
+                                     new.decode('utf-8', errors='replace').splitlines(), n=0, lineterm=""):
+        if line.startswith("+") and not line.startswith("+++"):
+            added += 1
+        elif line.startswith("-") and not line.startswith("---"):
+            removed += 1
+    return f"+{added} -{removed}"
+
+def install_rule_files(project_dir, files, store=None):
+    """Puts {relative path: bytes} into a project, writing only files whose content changed.
+
+    .roomodes is merged with the project's copy (see merge_roomodes). With a
+    ContentStore the files are linked from the store instead of written.
+    Returns (paths in place, change lines for the log, counts by outcome).
+    """
+    written, changes = [], []
+    counts = collections.Counter()
+    for rel_path, data in sorted(files.items()):
+        target = Path(project_dir) / rel_path
+        try:
+            try:
+                current = target.read_bytes()
+            except FileNotFoundError:
+                current = None
+            detail = ""
+            if rel_path == RULES_MODES_FILE and current is not None:
+                data, detail = merge_roomodes(current, data)
+            if store:
+                # Links even unchanged content into the store once
+                if store.materialize(data, target, current) == "kept":
+                    counts["kept"] += 1
+                    changes.append(f"! {rel_path} (edited in place through a store hardlink; kept as the project's own file)")
+                    written.append(rel_path)
+                    continue
+            elif data != current:
+                break_link(target) # Else the new file would take the store object's read-only mode
+                atomic_write_bytes(target, data) # An interrupted run never leaves a truncated rule file
+            if current is None:
+                counts["added"] += 1
+                changes.append(f"+ {rel_path}")
+            elif data != current:
+                counts["updated"] += 1
+                changes.append(f"~ {rel_path} ({detail or _line_delta(current, data)})")
+            else:
+                counts["unchanged"] += 1
+            written.append(rel_path)
+        except OSError as e:
+            print_error(f"Error writing to {target}: {e}")
+    return written, changes, counts
+
+def sync_rules(project_dir=Path("."), source=GITHUB_BASE_URL, cache=None, offline=False, store=None,
+               show_changes=True, compact=False):
+    """Installs .roomodes and the .roo/rules-* files from a rules source into a project.
+
+    source is anything open_rules_source() accepts; see install_rule_files() for
+    how files are written. With compact=True the rule files are compacted first
+    (see compact_rule_files()). Returns the sorted relative paths in place, or
+    None if the source could not be loaded or verified.
+    """
+    print_step("Syncing custom Roo modes and rules 📄")
+    try:
+        rules_source = open_rules_source(source)
+        print_info(f"Loading modes and rules from {rules_source.description}...")
+        with profile_span("load_rules", "rules", source=rules_source.description) as span_attrs:
+            files = rules_source.load(cache=cache, offline=offline)
+            span_attrs["files"] = len(files)
+    except RulesSourceError as e:
+        print_error(f"Could not load modes and rules: {e}")
+        return None
+
+    if compact:
+        with profile_span("compact_rules", "rules"):
+            compacted, shared = compact_rule_files(files)
+        print_info("Compacted mode context (estimated tokens per request):")
+        print_rules_context_report(rules_context_report(files, compacted), shared)
+        files = compacted
+    written, changes, counts = install_rule_files(project_dir, files, store)
+    if show_changes:
+        for line in changes[:RULES_CHANGES_SHOWN]:
+            print_plain(f"  {line}")
+        if len(changes) > RULES_CHANGES_SHOWN:
+            print_plain(f"  ... and {len(changes) - RULES_CHANGES_SHOWN} more")
+    rule_dirs = {rel_path.split("/")[1] for rel_path in written if rel_path != RULES_MODES_FILE}
+    print_info(f"Installed {len(written)}/{len(files)} files into {project_dir} "
+               f"({len(rule_dirs)} rule directories: {', '.join(sorted(rule_dirs))}; "
+               + ", ".join(f"{counts[outcome]} {outcome}" for outcome in ("added", "updated", "unchanged")) + ").")
+    if store:
+        print_info(f"Shared store {store.root}: {store.summary()}.")
+        warn_kept_edits(counts)
+    return written
+
+def get_init_command(init_mode):
+    """Builds the 'task-master init' command for 'global' (installed CLI) or 'npx' mode."""
+    if init_mode == "global":
+        return ["task-master", "init"]
+    # Ensure correct npx command if package name differs from CLI command
+    return ["npx", "task-master", "init"] # Use 'task-master init' via npx
+
+# --- Fleet Mode ---
+
+FLEET_DEFAULTS = {
+    "install": "global", # global | local | skip
+    "configure_mcp": True,
+    "anthropic_api_key_env": "ANTHROPIC_API_KEY", # Names of env vars holding the keys, never the keys
+    "perplexity_api_key_env": "PERPLEXITY_API_KEY",
+    "temperature": 0.2,
+    "init": "npx", # global | npx | skip
+    "init_args": ["--yes"], # Passed to 'task-master init' so it does not prompt
+}
+FLEET_INSTALL_CHOICES = ("global", "local", "skip")
+FLEET_INIT_CHOICES = ("global", "npx", "skip")
+FLEET_PROJECT_KEYS = ("install", "init", "init_args") # Answers a project entry may override
+FLEET_STAGES = ("install", "rules", "init", "cursor", "windsurf")
+
+def load_fleet_manifest(manifest_path):
+    """Loads a fleet manifest and returns (answers, projects).
+
+    The manifest is JSON: {"defaults": {...answers...}, "projects": ["path", {"path": ..., "init": ...}]}.
+    Project paths are resolved relative to the manifest. Raises ValueError if it is malformed.
+    """
+    manifest_path = Path(manifest_path)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise ValueError(f"Could not read fleet manifest {manifest_path}: {e}")
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("projects"), list):
+        raise ValueError("Fleet manifest must be an object with a 'projects' list.")
+
+    answers = dict(FLEET_DEFAULTS)
+    answers.update(manifest.get("defaults") or {})
+    unknown = set(answers) - set(FLEET_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown fleet manifest defaults: {', '.join(sorted(unknown))}")
+    try:
+        answers["temperature"] = float(answers["temperature"])
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid temperature: {answers['temperature']!r}")
+    if not 0.0 <= answers["temperature"] <= 1.0:
+        raise ValueError(f"Temperature must be between 0.0 and 1.0, got {answers['temperature']}")
+
+    projects = []
+    for entry in manifest["projects"]:
+        spec = {"path": entry} if isinstance(entry, str) else dict(entry)
+        if not isinstance(spec.get("path"), str):
+            raise ValueError(f"Fleet project entry has no 'path': {entry!r}")
+        unknown = set(spec) - set(FLEET_PROJECT_KEYS) - {"path"}
+        if unknown:
+            raise ValueError(f"Unknown keys for project {spec['path']}: {', '.join(sorted(unknown))}")
+        for key in FLEET_PROJECT_KEYS:
+            spec.setdefault(key, answers[key])
+        if spec["install"] not in FLEET_INSTALL_CHOICES:
+            raise ValueError(f"Invalid install scope {spec['install']!r} for {spec['path']} (expected one of {', '.join(FLEET_INSTALL_CHOICES)})")
+        if spec["init"] not in FLEET_INIT_CHOICES:
+            raise ValueError(f"Invalid init mode {spec['init']!r} for {spec['path']} (expected one of {', '.join(FLEET_INIT_CHOICES)})")
+        spec["path"] = str((manifest_path.parent / spec["path"]).resolve())
+        projects.append(spec)
+    return answers, projects
+
+def configure_mcp_unattended(answers):
+    """Adds the taskmaster-ai MCP entry without prompting, reading API keys from the named env vars."""
+    mcp_config_path, mcp_config, taskmaster_mcp_exists, config_read_error = check_mcp_configuration()
+    if taskmaster_mcp_exists:
+        print_info("Taskmaster MCP configuration already exists. Skipping setup.")
+        return True
+    if mcp_config is None or config_read_error:
+        print_warning("Skipping MCP setup; the settings file could not be located or read.")
+        return False
+    new_mcp_entry = build_mcp_entry(
+        anthropic_key=os.getenv(answers["anthropic_api_key_env"] or "", ""),
+        perplexity_key=os.getenv(answers["perplexity_api_key_env"] or "", ""),
+        temperature=answers["temperature"],
+    )
+    return update_mcp_server_entry(mcp_config_path, MCP_SERVER_NAME, new_mcp_entry, replace=False)
+
+def provision_project(spec):
+    """Runs the per-project stages for one fleet entry. Executed in a worker process.
+
+    All output is captured and returned in the result's "log" so parallel
+    projects do not interleave on the terminal. With spec["profile"] the
+    project's spans are returned in "trace_events". spec["deadline"] is the time
+    left of the fleet's budget and spec["stage_timeouts"] limits each stage.
+    Command output goes to spec["command_log"] when set (--log-dir).
+    """
+    global _profiler
+    # Pool workers are forked or reused, so never inherit another run's spans
+    _profiler = Profiler() if spec.get("profile") else None
+    set_install_deadline(spec["deadline"])
+    set_command_log(spec.get("command_log"))
+    set_npm_offline_cache(spec.get("npm_offline_cache"))
+    project_dir = Path(spec["path"])
+    stages = dict.fromkeys(FLEET_STAGES, "skipped")
+    log = io.StringIO()
+    started = time.perf_counter()
+    shell = platform.system() == "Windows"
+    echo = not spec.get("command_log") # With a command log, keep npm's output out of the in-memory project log
+
+    @contextlib.contextmanager
+    def stage_span(name):
+        with profile_span(name, "stage", project=str(project_dir)) as span_attrs:
+            try:
+                with deadline_scope(spec["stage_timeouts"].get(name)):
+                    yield
+            finally:
+                span_attrs["status"] = stages[name]
+
+    with contextlib.redirect_stdout(log):
+        try:
+            if not project_dir.is_dir():
+                raise FileNotFoundError(f"Project directory not found: {project_dir}")
+
+            with stage_span("install"):
+                if spec["install"] == "local":
+                    ok = install_taskmaster_package(False, cwd=project_dir, stdin=subprocess.DEVNULL,
+                                                    constraint=spec["taskmaster_version"], reinstall=spec["reinstall"],
+                                                    echo=echo)
+                    stages["install"] = "ok" if ok else "failed"
+                elif spec["install"] == "global":
+                    stages["install"] = "shared"
+
+            with stage_span("rules"):
+                store = ContentStore(spec["store_dir"], spec["store_link"]) if spec["store_dir"] else None
+                staged = {name: (Path(spec["staging_dir"]) / name).read_bytes() for name in spec["staged_files"]}
+                installed, changes, counts = install_rule_files(project_dir, staged, store)
+                for line in changes:
+                    print_plain(f"  {line}")
+                print_info(f"Installed {len(installed)} staged mode/rule files into {project_dir} ("
+                           + ", ".join(f"{counts[outcome]} {outcome}" for outcome in ("added", "updated", "unchanged"))
+                           + (f"; shared store: {store.summary()})." if store else ")."))
+                warn_kept_edits(counts)
+                stages["rules"] = "ok" if installed else "failed" # Nothing staged means the source could not be loaded
+
+            with stage_span("init"):
+                if spec["init"] != "skip" and stages["install"] != "failed":
+                    init_command = get_init_command(spec["init"]) + list(spec["init_args"])
+                    ok, _, _ = run_command_capture(init_command, shell=shell, cwd=project_dir, stdin=subprocess.DEVNULL,
+                                                   echo=echo)
+                    stages["init"] = "ok" if ok else "failed"
+
+            with stage_span("cursor"):
+                had_cursor = (project_dir / ".cursor").is_dir()
+                process_cursor_files(project_dir / ".roo", workers=1, # Projects already run in parallel
+                                     use_index=not spec["rescan_migration"], mode=spec["migrate_mode"])
+                if had_cursor:
+                    stages["cursor"] = "failed" if (project_dir / ".cursor").exists() else "migrated"
+
+            with stage_span("windsurf"):
+                had_windsurf = (project_dir / ".windsurfrules").exists()
+                remove_windsurf_rules(project_dir)
+                if had_windsurf:
+                    stages["windsurf"] = "failed" if (project_dir / ".windsurfrules").exists() else "removed"
+        except Exception as e:
+            print_error(f"Provisioning {project_dir} failed: {e}")
+            stages = {name: ("failed" if status == "skipped" else status) for name, status in stages.items()}
+    failed = "failed" in stages.values()
+    profiler = stop_profiling()
+    return {
+        "path": str(project_dir),
+        "stages": stages,
+        "ok": not failed,
+        "seconds": time.perf_counter() - started,
+        "log": log.getvalue(),
+        "trace_events": profiler.trace_events() if profiler else [],
+    }
+
+def print_fleet_summary(results, elapsed):
+    """Prints one table row per project plus totals."""
+    name_width = min(60, max([len("PROJECT")] + [len(r["path"]) for r in results]))
+    header = f"{'PROJECT':<{name_width}}  " + "  ".join(f"{stage.upper():<9}" for stage in FLEET_STAGES) + "  TIME"
+    print(f"\n{COLOR_BOLD}{header}{COLOR_RESET}")
+    print("-" * len(header))
+    for result in results:
+        path = result["path"] if len(result["path"]) <= name_width else "…" + result["path"][-(name_width - 1):]
+        cells = []
+        for stage in FLEET_STAGES:
+            status = result["stages"][stage]
+            color = COLOR_RED if status == "failed" else (COLOR_GREEN if status not in ("skipped",) else "")
+            cells.append(f"{color}{status:<9}{COLOR_RESET if color else ''}")
+        print(f"{path:<{name_width}}  " + "  ".join(cells) + f"  {result['seconds']:.1f}s")
+    failed = sum(1 for r in results if not r["ok"])
+    summary = f"{len(results) - failed}/{len(results)} projects provisioned in {elapsed:.1f}s"
+    if failed:
+        print_warning(f"{summary}; {failed} failed.")
+    else:
+        print_info(f"{summary}. ✅")
+
+def _fleet_log_name(index, project_path):
+    """Base name of a project's files in --log-dir, e.g. '0003-web'."""
+    return f"{index:04d}-" + (re.sub(r"[^A-Za-z0-9._-]+", "_", Path(project_path).name) or "project")
+
+def _fleet_failure(path, reason):
+    """The result of a fleet project that did not report back."""
+    return {"path": path, "stages": dict.fromkeys(FLEET_STAGES, "failed"), "ok": False, "seconds": 0.0, "log": reason + "\n"}
+
+def _stop_fleet_worker(signum, frame):
+    stop_all_processes()
+    os._exit(1)
+
+def _note_fleet_command(commands, worker_pid, report):
+    """Records a ("start" | "stop", pid) command report from a fleet worker."""
+    event, pid = report
+    pids = commands.setdefault(worker_pid, set())
+    if event == "start":
+        pids.add(pid)
+    else:
+        pids.discard(pid)
+
+def _kill_command_groups(pids):
+    """Kills commands a fleet worker left behind (each leads its own process group)."""
+    for pid in pids:
+        if platform.system() == "Windows":
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(pid)], capture_output=True)
+            continue
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+def _fleet_worker(tasks, messages):
+    """Worker process of run_fleet: provisions (index, spec) tasks until it takes None.
+
+    Posts ("start", index, pid) before and ("done", index, result) after each
+    project, so the parent knows which project a crashed worker was running,
+    and ("command", pid, (event, command_pid)) as commands start and stop.
+    """
+    global _process_listener
+    # Terminated at the fleet deadline: stop this worker's npm and task-master commands too
+    signal.signal(signal.SIGTERM, _stop_fleet_worker)
+    # Killed outright, it cannot: the parent then stops them from this list
+    _process_listener = lambda event, pid: messages.put(("command", os.getpid(), (event, pid)))
+    for index, spec in iter(tasks.get, None):
+        messages.put(("start", index, os.getpid()))
+        try:
+            result = provision_project(spec)
+        except Exception as e:
+            result = _fleet_failure(spec["path"], f"Worker crashed: {e}")
+        messages.put(("done", index, result))
+
+def run_fleet(args):
+    """Provisions every project in a fleet manifest without prompting."""
+    print_step("Starting Task Master AI fleet provisioning 🚢")
+    try:
+        answers, projects = load_fleet_manifest(args.manifest)
+    except ValueError as e:
+        print_error(str(e))
+        return 1
+    if not projects:
+        print_warning("Fleet manifest lists no projects. Nothing to do.")
+        return 0
+    started = time.perf_counter()
+    print_info(f"Loaded {len(projects)} projects from {args.manifest} (concurrency: {args.jobs}).")
+
+    # Machine-wide work happens once, here, before fanning out
+    if any(spec["install"] == "global" for spec in projects):
+        with profile_span("global_install", "stage") as span_attrs, deadline_scope(args.stage_timeouts.get("global_install")):
+            installed = install_taskmaster_package(True, stdin=subprocess.DEVNULL, constraint=args.taskmaster_version,
+                                                   reinstall=args.reinstall)
+            span_attrs["status"] = "ok" if installed else "failed"
+        if not installed:
+            print_error("Global installation failed; projects will not be initialized with the global CLI.")
+            for spec in projects:
+                if spec["install"] == "global":
+                    spec["install"], spec["init"] = "skip", "skip"
+    if answers["configure_mcp"]:
+        with profile_span("configure_mcp", "stage") as span_attrs:
+            span_attrs["status"] = "ok" if configure_mcp_unattended(answers) else "failed"
+        if args.mcp_launch == "node":
+            # mcp_settings.json is shared by every project, so only a global install can be pinned
+            if any(spec["install"] == "global" for spec in projects):
+                with profile_span("pin_mcp_launch", "stage"), deadline_scope(args.stage_timeouts.get("pin_mcp_launch")):
+                    pin_mcp_launch(True, get_mcp_settings_path())
+            else:
+                print_warning("--mcp-launch node needs a global install in fleet mode; the MCP entry keeps using npx.")
+        if args.probe_mcp:
+            print_step("Probing the MCP server 🔌")
+            with profile_span("probe_mcp", "stage"), deadline_scope(args.stage_timeouts.get("probe_mcp")):
+                print_mcp_probe_report(run_mcp_probe(get_mcp_settings_path(), args.probe_mcp))
+
+    with tempfile.TemporaryDirectory(prefix="roo-taskmaster-fleet-") as staging_dir:
+        # Download modes and rules once; every project gets a local copy of the staged files
+        cache = None if args.no_cache else DownloadCache(args.cache_dir)
+        with profile_span("stage_rules", "stage") as span_attrs, deadline_scope(args.stage_timeouts.get("stage_rules")):
+            staged_files = sync_rules(staging_dir, args.rules_source, cache=cache, offline=args.offline,
+                                      show_changes=False, compact=args.compact_rules) or []
+            span_attrs["status"] = "ok" if staged_files else "failed"
+        print_info(f"Staged {len(staged_files)} mode/rule files for {len(projects)} projects.")
+        for index, spec in enumerate(projects, 1):
+            command_log = args.log_dir / f"{_fleet_log_name(index, spec['path'])}.commands.log" if args.log_dir else None
+            spec.update(staging_dir=staging_dir, command_log=command_log, staged_files=staged_files,
+                        store_dir=str(args.cache_dir) if args.shared_store else None, store_link=args.store_link,
+                        taskmaster_version=args.taskmaster_version, reinstall=args.reinstall,
+                        npm_offline_cache=_npm_offline_cache,
+                        rescan_migration=args.rescan_migration, migrate_mode=args.migrate_mode,
+                        profile=_profiler is not None, stage_timeouts=args.stage_timeouts,
+                        deadline=_install_deadline.remaining())
+
+        print_step(f"Provisioning {len(projects)} projects ({args.jobs} at a time) 🏗️")
+        results = {}
+        tasks, messages = multiprocessing.Queue(), multiprocessing.Queue()
+        for index, spec in enumerate(projects):
+            tasks.put((index, spec))
+        workers = [multiprocessing.Process(target=_fleet_worker, args=(tasks, messages), name=f"fleet-worker-{n}")
+                   for n in range(min(args.jobs, len(projects)))]
+        for worker in workers:
+            tasks.put(None) # One stop marker per worker, after every project
+        running = {} # Project index -> pid of the worker provisioning it
+        commands = {} # Worker pid -> pids of the commands it is running
+        unfinished = "Not finished before the fleet deadline."
+        # Workers stop their own commands at the deadline; the grace covers that cleanup
+        wait_limit = _install_deadline.timeout()
+        wait_until = None if wait_limit is None else time.monotonic() + wait_limit + SUBPROCESS_KILL_GRACE
+        try:
+            for worker in workers:
+                worker.start()
+            while len(results) < len(projects):
+                if wait_until is not None and time.monotonic() >= wait_until:
+                    print_error(f"Fleet deadline exceeded; {len(projects) - len(results)} projects were not provisioned.")
+                    break
+                wait = FLEET_POLL_INTERVAL if wait_until is None else min(FLEET_POLL_INTERVAL, max(0, wait_until - time.monotonic()))
+                try:
+                    kind, index, payload = messages.get(timeout=wait)
+                except queue.Empty:
+                    # A worker that died (killed, out of memory) fails the project it was provisioning
+                    for worker in workers:
+                        if worker.exitcode:
+                            _kill_command_groups(commands.pop(worker.pid, ()))
+                            for index in [i for i, pid in running.items() if pid == worker.pid]:
+                                del running[index]
+                                results[index] = _fleet_failure(projects[index]["path"],
+                                                                f"Worker crashed (exit code {worker.exitcode}).")
+                                print_info(f"[{len(results)}/{len(projects)}] FAILED: {projects[index]['path']}")
+                    if not any(worker.is_alive() for worker in workers):
+                        print_error(f"Fleet workers exited; {len(projects) - len(results)} projects were not provisioned.")
+                        unfinished = "No fleet worker was left to provision it."
+                        break
+                    continue
+                if kind == "command":
+                    _note_fleet_command(commands, index, payload)
+                    continue
+                if kind == "start":
+                    running[index] = payload
+                    continue
+                running.pop(index, None)
+                results[index] = payload
+                if _profiler is not None:
+                    _profiler.extend(payload.get("trace_events", []))
+                print_info(f"[{len(results)}/{len(projects)}] {'done' if payload['ok'] else 'FAILED'}: {payload['path']}")
+        finally:
+            # Normally every worker has already exited; at the deadline (or on Ctrl-C) they are stopped here
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+            for worker in workers:
+                worker.join(SUBPROCESS_KILL_GRACE)
+                if worker.is_alive():
+                    worker.kill() # Stuck (or stopped) past the grace: its commands are stopped below
+                    worker.join()
+            # Drain the command reports still queued, then stop what killed or crashed workers left running
+            while True:
+                try:
+                    kind, index, payload = messages.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == "command":
+                    _note_fleet_command(commands, index, payload)
+                elif kind == "done":
+                    results.setdefault(index, payload) # Reported just as the deadline hit
+            for worker in workers:
+                if worker.exitcode:
+                    _kill_command_groups(commands.get(worker.pid, ()))
+        for index, spec in enumerate(projects):
+            results.setdefault(index, _fleet_failure(spec["path"], unfinished))
+
+    ordered = [results[index] for index in range(len(projects))]
+    if args.log_dir:
+        args.log_dir.mkdir(parents=True, exist_ok=True)
+        for index, result in enumerate(ordered, 1):
+            (args.log_dir / f"{_fleet_log_name(index, result['path'])}.log").write_text(result["log"], encoding='utf-8')
+        print_info(f"Per-project logs written to {args.log_dir}")
+    else:
+        for result in ordered:
+            if not result["ok"]:
+                print_warning(f"Last lines of the log for {result['path']}:")
+                print("\n".join(result["log"].rstrip().splitlines()[-20:]))
+
+    print_fleet_summary(ordered, time.perf_counter() - started)
+    return 0 if all(r["ok"] for r in ordered) else 1
+
+# --- Offline Bundles ---
+
+class OfflineBundleError(Exception):
+    """An offline bundle is unreadable, incomplete or does not match its checksums."""
+
+_npm_offline_cache = None # npm cache of the unpacked --from-bundle archive; npm then never contacts the registry
+
+def set_npm_offline_cache(path):
+    """Makes every 'npm install' resolve packages from the npm cache at path only (None: use the registry)."""
+    global _npm_offline_cache
+    _npm_offline_cache = path
+
+def npm_install_options():
+    """Options added to 'npm install'; with --from-bundle it installs offline from the bundle's npm cache."""
+    if _npm_offline_cache is None:
+        return []
+    return ["--offline", "--cache", str(_npm_offline_cache), "--no-audit", "--no-fund"]
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _bundle_member_path(path):
+    """True for a relative path inside the rules or npm cache directory of an offline bundle."""
+    if not isinstance(path, str) or "\\" in path or ":" in path:
+        return False
+    parts = path.split("/")
+    return len(parts) > 1 and parts[0] in (OFFLINE_RULES_DIR, OFFLINE_NPM_CACHE_DIR) and "" not in parts \
+        and "." not in parts and ".." not in parts
+
+def build_offline_bundle(output, rules_source, constraint=DEFAULT_TASKMASTER_VERSION, cache=None, offline=False):
+    """Writes an archive from which 'install --from-bundle' provisions a project without network access.
+
+    It holds OFFLINE_MANIFEST_NAME (first), the mode and rule files under
+    OFFLINE_RULES_DIR and, under OFFLINE_NPM_CACHE_DIR, an npm cache filled by
+    installing task-master-ai into a throwaway project: the package and dependency
+    tarballs plus the registry metadata 'npm install --offline' resolves them from.
+    A sha256sum-style checksum file is written next to the archive. Returns 0 on
+    success, else 1.
+    """
+    output = Path(output)
+    print_step(f"Building offline bundle {output} 📦")
+    try:
+        rule_files = open_rules_source(rules_source).load(cache=cache, offline=offline)
+    except RulesSourceError as e:
+        print_error(f"Could not load modes and rules from {rules_source}: {e}")
+        return 1
+    with tempfile.TemporaryDirectory(prefix="roo-taskmaster-bundle-") as work_dir:
+        project_dir, npm_cache = Path(work_dir) / "project", Path(work_dir) / OFFLINE_NPM_CACHE_DIR
+        project_dir.mkdir()
+        # Install scripts are not needed to fill the cache; they run on the offline install
+        command = get_install_command(False, constraint) + ["--cache", str(npm_cache), "--ignore-scripts",
+                                                            "--no-audit", "--no-fund"]
+        installed, _, _ = run_command_capture(command, shell=platform.system() == "Windows", cwd=project_dir,
+                                              stdin=subprocess.DEVNULL)
+        version, _ = find_installed_taskmaster(False, project_dir)
+        if not installed or not version:
+            print_error(f"Could not install {TASKMASTER_PACKAGE} '{constraint}' to fill the bundle's npm cache.")
+            return 1
+        lock = read_json_file(project_dir / "package-lock.json")
+        packages = lock.get("packages") if isinstance(lock, dict) and isinstance(lock.get("packages"), dict) else {}
+
+        members = [(f"{OFFLINE_RULES_DIR}/{path}", data) for path, data in sorted(rule_files.items())]
+        # Only the content-addressed store; npm's logs and update-check stamp stay behind
+        cache_files = sorted((f"{OFFLINE_NPM_CACHE_DIR}/{path.relative_to(npm_cache).as_posix()}", path)
+                             for path in (npm_cache / "_cacache").rglob("*") if path.is_file())
+        manifest = {
+            "version": OFFLINE_BUNDLE_VERSION,
+            "package": {"name": TASKMASTER_PACKAGE, "version": version, "requested": constraint},
+            "dependencies": len([key for key in packages if key and key != f"node_modules/{TASKMASTER_PACKAGE}"]),
+            "rules": len(rule_files),
+            "files": [{"path": name, "size": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+                      for name, data in members]
+                     + [{"path": name, "size": path.stat().st_size, "sha256": _sha256_file(path)}
+                        for name, path in cache_files],
+        }
+        manifest_data = (json.dumps(manifest, indent=2) + "\n").encode('utf-8')
+        partial = output.with_name(output.name + ".tmp")
+        try:
+            with open(partial, "wb") as raw, gzip.GzipFile(filename="", fileobj=raw, mode="wb", mtime=0) as compressed, \
+                    tarfile.open(fileobj=compressed, mode="w", format=tarfile.PAX_FORMAT) as archive:
+                for name, data in [(OFFLINE_MANIFEST_NAME, manifest_data)] + members:
+                    info = tarfile.TarInfo(name)
+                    info.size, info.mode, info.mtime = len(data), 0o644, 0
+                    archive.addfile(info, io.BytesIO(data))
+                for name, path in cache_files:
+                    info = tarfile.TarInfo(name)
+                    info.size, info.mode, info.mtime = path.stat().st_size, 0o644, 0
+                    with open(path, "rb") as f:
+                        archive.addfile(info, f)
+            os.replace(partial, output)
+        except BaseException:
+            # Disk full, a cache file gone mid-walk or Ctrl-C: do not leave a large partial archive behind
+            with contextlib.suppress(OSError):
+                partial.unlink()
+            raise
+    digest = _sha256_file(output)
+    atomic_write_bytes(output.with_name(output.name + ".sha256"), f"{digest}  {output.name}\n".encode('utf-8'))
+    print_info(f"Bundled {TASKMASTER_PACKAGE} {version} with {manifest['dependencies']} dependencies and "
+               f"{len(rule_files)} mode/rule files: {output} ({output.stat().st_size / 1_000_000:.1f} MB, sha256 {digest[:12]}).")
+    return 0
+
+def _unpack_offline_bundle(bundle_path, dest):
+    """Extracts an offline bundle into dest, verifying each member against the manifest. Returns the manifest."""
+    expected, manifest, seen = None, None, set()
+    with tarfile.open(bundle_path, mode="r:*") as archive:
+        for member in archive:
+            name = member.name[2:] if member.name.startswith("./") else member.name
+            if expected is None:
+                if name != OFFLINE_MANIFEST_NAME or not member.isfile():
+                    raise OfflineBundleError(f"not an offline bundle ({OFFLINE_MANIFEST_NAME} is not its first member)")
+                try:
+                    manifest = json.loads(archive.extractfile(member).read().decode('utf-8'))
+                    expected = {entry["path"]: (entry["size"], entry["sha256"]) for entry in manifest["files"]}
+                    version = manifest["package"]["version"]
+                except (ValueError, KeyError, TypeError) as e:
+                    raise OfflineBundleError(f"malformed {OFFLINE_MANIFEST_NAME}: {e}")
+                if manifest.get("version") != OFFLINE_BUNDLE_VERSION or not isinstance(version, str):
+                    raise OfflineBundleError(f"unsupported bundle version {manifest.get('version')!r}")
+                unsafe = [path for path in expected if not _bundle_member_path(path)]
+                if unsafe:
+                    raise OfflineBundleError(f"manifest lists paths outside the bundle: {', '.join(unsafe[:3])}")
+                dest.mkdir(parents=True)
+                (dest / OFFLINE_MANIFEST_NAME).write_text(json.dumps(manifest, indent=2), encoding='utf-8')
+                continue
+            if member.isdir():
+                continue
+            if not member.isfile() or name not in expected or name in seen: # No links, devices or extra files
+                raise OfflineBundleError(f"unexpected member {name}")
+            path = dest / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            digest, size, source = hashlib.sha256(), 0, archive.extractfile(member)
+            with open(path, "wb") as f:
+                for chunk in iter(lambda: source.read(1 << 20), b""):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            if (size, digest.hexdigest()) != expected[name]:
+                raise OfflineBundleError(f"{name} does not match its size or sha256 in {OFFLINE_MANIFEST_NAME}")
+            seen.add(name)
+    if expected is None:
+        raise OfflineBundleError("the archive is empty")
+    missing = sorted(set(expected) - seen)
+    if missing:
+        raise OfflineBundleError(f"{len(missing)} files listed in {OFFLINE_MANIFEST_NAME} are missing: "
+                                 f"{', '.join(missing[:3])}{', ...' if len(missing) > 3 else ''}")
+    return manifest
+
+def open_offline_bundle(bundle_path, cache_dir):
+    """Verifies an offline bundle and unpacks it into the cache directory; returns (directory, manifest).
+
+    The archive must match the checksum file next to it, when there is one, and
+    every member the sha256 listed in its manifest. The unpacked copy is keyed by
+    the archive's sha256, so provisioning more projects from the same bundle
+    reuses it. Raises OfflineBundleError.
+    """
+    bundle_path = Path(bundle_path)
+    try:
+        digest = _sha256_file(bundle_path)
+    except OSError as e:
+        raise OfflineBundleError(f"could not read {bundle_path}: {e}")
+    checksum_path = bundle_path.with_name(bundle_path.name + ".sha256")
+    if checksum_path.is_file() and checksum_path.read_text(encoding='utf-8').split()[:1] != [digest]:
+        raise OfflineBundleError(f"{bundle_path.name} does not match {checksum_path.name} (corrupted or incomplete copy)")
+    target = Path(cache_dir) / OFFLINE_BUNDLES_DIR / digest[:32]
+    if (target / OFFLINE_VERIFIED_MARKER).is_file():
+        manifest = read_json_file(target / OFFLINE_MANIFEST_NAME)
+        if manifest is not None:
+            return target, manifest
+    staging = target.with_name(f"{target.name}.tmp-{os.getpid()}")
+    shutil.rmtree(staging, ignore_errors=True)
+    try:
+        with profile_span("unpack_bundle", "bundle", bytes=bundle_path.stat().st_size):
+            manifest = _unpack_offline_bundle(bundle_path, staging)
+        (staging / OFFLINE_VERIFIED_MARKER).touch()
+        shutil.rmtree(target, ignore_errors=True) # Left by an interrupted unpack
+        try:
+            os.replace(staging, target)
+        except OSError:
+            if not (target / OFFLINE_VERIFIED_MARKER).is_file(): # Otherwise a concurrent run unpacked it first
+                raise
+    except (tarfile.TarError, EOFError, OSError, zlib.error) as e:
+        raise OfflineBundleError(f"could not unpack {bundle_path}: {str(e).splitlines()[0].rstrip(':')}")
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return target, manifest
+
+def use_offline_bundle(args):
+    """Applies --from-bundle: rules come from the unpacked bundle and npm installs its pinned version from its cache.
+
+    Returns False, after printing why, when the bundle cannot be used.
+    """
+    print_step(f"Verifying offline bundle {args.from_bundle} 🔒")
+    try:
+        bundle_dir, manifest = open_offline_bundle(args.from_bundle, args.cache_dir)
+    except OfflineBundleError as e:
+        print_error(f"Offline bundle {args.from_bundle} cannot be used: {e}")
+        return False
+    version = manifest["package"]["version"]
+    if not version_satisfies(version, args.taskmaster_version):
+        print_error(f"The bundle holds {TASKMASTER_PACKAGE} {version}, which does not satisfy '{args.taskmaster_version}'.")
+        return False
+    args.taskmaster_version = version
+    args.rules_source = str(bundle_dir / OFFLINE_RULES_DIR)
+    set_npm_offline_cache(bundle_dir / OFFLINE_NPM_CACHE_DIR)
+    print_info(f"Verified {len(manifest['files'])} files: {TASKMASTER_PACKAGE} {version} with "
+               f"{manifest.get('dependencies', 0)} dependencies and {manifest.get('rules', 0)} mode/rule files. "
+               "npm and the rule sync will not use the network.")
+    if args.mcp_launch == "npx":
+        print_info("Add --mcp-launch node so Roo starts the MCP server without npx, which needs the registry.")
+    return True
+
+# --- Watch Mode ---
+
+def _watched_dir(rel_dir):
+    """True for the directories of a project or rules checkout that can hold mode and rule files."""
+    return rel_dir in ("", ".roo") or rel_dir.startswith(".roo/rules-")
+
+class WatchRoot:
+    """A directory 'watch' observes: the rule files of a tree, or only the given file names in it."""
+
+    def __init__(self, key, path, names=None):
+        self.key = key
+        self.path = Path(path)
+        self.names = names # None: .roomodes and .roo/rules-*; else only these files directly in path
+
+    def wants_dir(self, rel_dir):
+        return rel_dir == "" if self.names is not None else _watched_dir(rel_dir)
+
+    def wants_file(self, rel_path):
+        return rel_path in self.names if self.names is not None else is_rule_path(rel_path)
+
+    def scan(self, rel_dir=""):
+        """{relative path: (size, mtime_ns, inode)} of the wanted files under rel_dir."""
+        found = {}
+        try:
+            with os.scandir(self.path / rel_dir) as entries:
+                for entry in entries:
+                    rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        if self.wants_dir(rel_path):
+                            found.update(self.scan(rel_path))
+                    elif self.wants_file(rel_path):
+                        stat = entry.stat()
+                        found[rel_path] = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        except OSError:
+            pass # Not there (yet)
+        return found
+
+class PollingWatcher:
+    """Detects changes under WatchRoots by comparing scans every interval seconds."""
+
+    description = "polling"
+
+    def __init__(self, roots, interval=WATCH_POLL_INTERVAL):
+        self.roots = roots
+        self.interval = interval
+        self.snapshots = {root.key: root.scan() for root in roots}
+
+    def wait(self, timeout=None):
+        """Blocks until something changed or timeout passed; returns {(root key, relative path)}."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changes = set()
+            for root in self.roots:
+                snapshot = root.scan()
+                previous = self.snapshots[root.key]
+                changes.update((root.key, rel_path) for rel_path in set(snapshot) | set(previous)
+                               if snapshot.get(rel_path) != previous.get(rel_path))
+                self.snapshots[root.key] = snapshot
+            if changes:
+                return changes
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            time.sleep(self.interval if deadline is None else max(0, min(self.interval, deadline - time.monotonic())))
+
+    def close(self):
+        pass
+
+class InotifyWatcher:
+    """Linux inotify watches (through ctypes) on every wanted directory of the WatchRoots.
+
+    Directories created later are watched as they appear. If the kernel queue
+    overflows, every root is reported with path None, meaning 'rescan'.
+    """
+
+    description = "inotify"
+    IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE = 0x2, 0x4, 0x8
+    IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x40, 0x80, 0x100, 0x200
+    IN_DELETE_SELF, IN_MOVE_SELF, IN_Q_OVERFLOW, IN_IGNORED, IN_ISDIR = 0x400, 0x800, 0x4000, 0x8000, 0x40000000
+    IN_NONBLOCK, IN_CLOEXEC = 0o4000, 0o2000000
+    MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+    @classmethod
+    def available(cls):
+        return sys.platform.startswith("linux")
+
+    def __init__(self, roots):
+        self.libc = ctypes.CDLL(None, use_errno=True) # The process's own symbols include libc's inotify calls
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {} # wd -> (root, relative directory)
+        self.roots = roots
+        for root in roots:
+            self._add_tree(root, "")
+
+    def _add_tree(self, root, rel_dir):
+        """Watches rel_dir and its wanted subdirectories; returns the wanted files found in them."""
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root.path / rel_dir), self.MASK)
+        if wd < 0:
+            return set() # Gone already, or not there yet (the parent's IN_CREATE adds it)
+        self.watches[wd] = (root, rel_dir)
+        found = set()
+        try:
+            with os.scandir(root.path / rel_dir) as entries:
+                for entry in entries:
+                    rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        if root.wants_dir(rel_path):
+                            found |= self._add_tree(root, rel_path)
+                    elif root.wants_file(rel_path):
+                        found.add(rel_path)
+        except OSError:
+            pass
+        return found
+
+    def _read_events(self):
+        changes = set()
+        try:
+            buffer = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return changes
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, name_len = struct.unpack_from("iIII", buffer, offset)
+            name = buffer[offset + 16:offset + 16 + name_len].split(b"\0", 1)[0].decode('utf-8', 'replace')
+            offset += 16 + name_len
+            if mask & self.IN_Q_OVERFLOW:
+                changes.update((root.key, None) for root in self.roots)
+                continue
+            if mask & self.IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            if wd not in self.watches or not name:
+                continue # Events about a watched directory itself; its parent reports it too
+            root, rel_dir = self.watches[wd]
+            rel_path = f"{rel_dir}/{name}" if rel_dir else name
+            if mask & self.IN_ISDIR:
+                if not root.wants_dir(rel_path):
+                    continue
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    # Files may have been written before the watch was added
+                    changes.update((root.key, found) for found in self._add_tree(root, rel_path))
+                else:
+                    changes.add((root.key, None)) # A directory of rules left: rescan
+            elif root.wants_file(rel_path):
+                changes.add((root.key, rel_path))
+        return changes
+
+    def wait(self, timeout=None):
+        """Blocks until something changed or timeout passed; returns {(root key, relative path or None)}."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+            changes = self._read_events() if ready else set()
+            if changes or (deadline is not None and time.monotonic() >= deadline):
+                return changes
+
+    def close(self):
+        os.close(self.fd)
+
+def _rules_root_for(rules_source):
+    """The WatchRoot to observe for a local rules source, or None for sources that are polled (URL, git)."""
+    if isinstance(rules_source, DirectoryRulesSource):
+        if (rules_source.path / RULES_MODES_FILE).is_file() or (rules_source.path / ".roo").is_dir():
+            return WatchRoot("source", rules_source.path)
+        return WatchRoot("source", rules_source.path, {RULES_BUNDLE_NAME, RULES_ZIP_BUNDLE_NAME})
+    if isinstance(rules_source, ArchiveRulesSource):
+        return WatchRoot("source", rules_source.path.parent, {rules_source.path.name})
+    return None
+
+def _load_quietly(rules_source, cache, offline):
+    """rules_source.load() with its download log held back, and printed only if loading fails."""
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            return rules_source.load(cache=cache, offline=offline)
+    except RulesSourceError:
+        print(log.getvalue(), end="")
+        raise
+
+def _project_drift(project_dir, installed, rel_paths):
+    """The installed files among rel_paths whose project copy was changed or removed since it was synced."""
+    drifted = []
+    for rel_path in rel_paths:
+        if rel_path not in installed:
+            continue
+        try:
+            current = (Path(project_dir) / rel_path).read_bytes()
+        except OSError:
+            drifted.append(rel_path)
+            continue
+        if rel_path == RULES_MODES_FILE:
+            if merge_roomodes(current, installed[rel_path])[0] is not current: # Local modes are not drift
+                drifted.append(rel_path)
+        elif current != installed[rel_path]:
+            drifted.append(rel_path)
+    return drifted
+
+def watch_rules(project_dir, source, cache=None, offline=False, store=None, compact=False,
+                interval=WATCH_REMOTE_INTERVAL, debounce=WATCH_DEBOUNCE, poll=False):
+    """Keeps a project's .roomodes and .roo/rules-* in sync with a rules source until interrupted.
+
+    Local sources are watched with inotify (or by polling), and only the files
+    reported as changed are read again; URL and git sources are re-read every
+    interval seconds (URLs with conditional requests). Bursts of changes are
+    synced once they have been quiet for debounce seconds. Installed files that
+    are edited or deleted in the project are restored, files removed from the
+    source are removed from the project if they were not edited there, and
+    local modes in .roomodes are kept. Returns 0 when stopped with Ctrl-C, 1 if
+    the first sync fails.
+    """
+    project_dir = Path(project_dir)
+    try:
+        rules_source = open_rules_source(source)
+        source_files = rules_source.load(cache=cache, offline=offline)
+    except RulesSourceError as e:
+        print_error(f"Could not load modes and rules: {e}")
+        return 1
+    desired = compact_rule_files(source_files)[0] if compact else dict(source_files)
+    _, lines, _ = install_rule_files(project_dir, desired, store)
+    for line in lines[:RULES_CHANGES_SHOWN]:
+        print_plain(f"  {line}")
+    if len(lines) > RULES_CHANGES_SHOWN:
+        print_plain(f"  ... and {len(lines) - RULES_CHANGES_SHOWN} more")
+    installed = desired
+    source_root = _rules_root_for(rules_source)
+    roots = [WatchRoot("project", project_dir)] + ([source_root] if source_root else [])
+    watcher = None
+    if not poll and InotifyWatcher.available():
+        try:
+            watcher = InotifyWatcher(roots)
+        except OSError as e:
+            print_warning(f"inotify is not available ({e}); polling every {WATCH_POLL_INTERVAL}s instead.")
+    watcher = watcher or PollingWatcher(roots)
+    print_info(f"Watching {rules_source.description} ({'with ' + watcher.description if source_root else f'every {interval:g}s'}) "
+               f"and {project_dir.resolve()} ({watcher.description}); {len(installed)} files in sync. Press Ctrl-C to stop.")
+    next_poll = None if source_root else time.monotonic() + interval
+    try:
+        while True:
+            changes = watcher.wait(None if next_poll is None else max(0, next_poll - time.monotonic()))
+            burst_started = time.monotonic()
+            while changes and time.monotonic() - burst_started < WATCH_DEBOUNCE_MAX:
+                more = watcher.wait(debounce)
+                if not more:
+                    break
+                changes |= more
+            started = time.perf_counter()
+            source_changes = {rel_path for key, rel_path in changes if key == "source"}
+            project_changes = {rel_path for key, rel_path in changes if key == "project"}
+            try:
+                if next_poll is not None and time.monotonic() >= next_poll:
+                    next_poll = time.monotonic() + interval
+                    source_files = _load_quietly(rules_source, cache, offline) # Unchanged polls print nothing
+                elif source_changes and source_root.names is None and None not in source_changes:
+                    source_files = dict(source_files) # Read back only what changed
+                    for rel_path in source_changes:
+                        try:
+                            source_files[rel_path] = (source_root.path / rel_path).read_bytes()
+                        except FileNotFoundError:
+                            source_files.pop(rel_path, None)
+                elif source_changes:
+                    source_files = rules_source.load(cache=cache, offline=offline)
+            except (RulesSourceError, OSError) as e:
+                print_warning(f"Could not read the rules source ({e}); keeping the last synced files.")
+                continue
+            desired = compact_rule_files(source_files)[0] if compact else source_files
+            updates = {rel_path: data for rel_path, data in desired.items() if installed.get(rel_path) != data}
+            restored = _project_drift(project_dir, installed,
+                                      installed if None in project_changes else project_changes - set(updates))
+            updates.update((rel_path, desired[rel_path]) for rel_path in restored if rel_path in desired)
+            removed = []
+            for rel_path in set(installed) - set(desired) - {RULES_MODES_FILE}: # .roomodes may hold local modes
+                target = project_dir / rel_path
+                try:
+                    if target.read_bytes() == installed[rel_path]: # Keep copies edited in the project
+                        target.unlink()
+                        removed.append(rel_path)
+                        if target.parent.name.startswith("rules-") and not any(target.parent.iterdir()):
+                            target.parent.rmdir()
+                except OSError:
+                    pass
+            if not updates and not removed:
+                installed = desired
+                continue
+            _, lines, _ = install_rule_files(project_dir, updates, store)
+            lines += [f"- {rel_path}" for rel_path in sorted(removed)]
+            installed = desired
+            for line in lines:
+                print_plain(f"  {line}{' (restored)' if line[2:].split(' ')[0] in restored else ''}")
+            print_info(f"Synced {len(updates) + len(removed)} files in {(time.perf_counter() - started) * 1000:.0f} ms.")
+    except KeyboardInterrupt:
+        print_info("Stopped watching.")
+        return 0
+    finally:
+        watcher.close()
+
+# --- Status ---
+
+STATUS_STATES = ("ok", "warn", "fail")
+
+def known_rules(source, cache=None):
+    """The manifest and files of the modes and rules published by source, without using the network.
+
+    URL sources are answered from the download cache only (the bundle, else the
+    manifest fetched by the last install, in which case files is None); local
+    sources are read directly. Returns (None, None) when nothing is known.
+    """
+    rules_source = open_rules_source(source)
+    if not isinstance(rules_source, URLRulesSource):
+        files = rules_source.load()
+        return build_rules_manifest(files), files
+    if cache is None:
+        return None, None
+    cached = cache.lookup(rules_source.bundle_url)
+    if cached is not None:
+        files = read_rules_bundle(cached[1])
+        return build_rules_manifest(files), files
+    cached = cache.lookup(rules_source.base_url + RULES_MANIFEST_NAME)
+    if cached is not None:
+        try:
+            return json.loads(cached[1].decode('utf-8')), None
+        except ValueError:
+            return None, None
+    return None, None
+
+def manifest_digests(manifest):
+    """{path: sha256} of the files listed in a rules manifest."""
+    return {entry["path"]: entry["sha256"] for entry in manifest.get("files", [])
+            if isinstance(entry, dict) and isinstance(entry.get("path"), str) and isinstance(entry.get("sha256"), str)}
+
+def compacted_digests(published):
+    """{path: sha256} of the published files as --compact-rules installs them."""
+    return {path: hashlib.sha256(data).hexdigest() for path, data in compact_rule_files(published)[0].items()}
+
+def rules_drift(project_dir, local_digests, expected, published=None, compacted=None):
+    """Compares a project's rule files with a published set by sha256; returns sorted (missing, changed) paths.
+
+    With the published files at hand, a file installed with --compact-rules and a
+    .roomodes that only adds local modes by the slug merge are not counted as
+    changed. compacted (see compacted_digests) is computed when not given.
+    """
+    missing = sorted(path for path in expected if path not in local_digests)
+    changed = sorted(path for path in expected if path in local_digests and local_digests[path] != expected[path])
+    if changed and published:
+        if compacted is None:
+            compacted = compacted_digests(published)
+        changed = [path for path in changed if local_digests[path] != compacted.get(path)
+                   and not (path == RULES_MODES_FILE and path in published
+                            and _keeps_published_modes(Path(project_dir) / path, published[path]))]
+    return missing, changed
+
+def _keeps_published_modes(modes_path, published_modes):
+    """True if merging the published modes into the .roomodes at modes_path would leave it unchanged."""
+    try:
+        local = modes_path.read_bytes()
+    except OSError:
+        return False
+    return merge_roomodes(local, published_modes)[0] is local
+
+def _status_taskmaster(project_dir, constraint):
+    """Reports the installed task-master-ai (local install first, like node resolves it)."""
+    for install_globally, where in ((False, "local"), (True, "global")):
+        version, package_json = find_installed_taskmaster(install_globally, project_dir)
+        if version:
+            detail = f"{version} ({where}, {package_json.parent})"
+            if not version_satisfies(version, constraint):
+                return "warn", f"{detail} does not satisfy '{constraint}'"
+            return "ok", detail
+    return "fail", f"{TASKMASTER_PACKAGE} is not installed locally or globally"
+
+def _status_mcp():
+    """Reports whether mcp_settings.json has a usable taskmaster-ai entry."""
+    mcp_config_path = get_mcp_settings_path()
+    if mcp_config_path is None:
+        return "fail", "MCP settings path could not be determined"
+    if not mcp_config_path.is_file():
+        return "fail", f"{mcp_config_path} not found"
+    try:
+        with open(mcp_config_path, 'r', encoding='utf-8') as f:
+            mcp_config = json.load(f)
+    except (OSError, ValueError) as e:
+        return "fail", f"{mcp_config_path} is unreadable: {e}"
+    servers = mcp_config.get("mcpServers") if isinstance(mcp_config, dict) else None
+    entry = servers.get(MCP_SERVER_NAME) if isinstance(servers, dict) else None
+    if not isinstance(entry, dict):
+        return "fail", f"no '{MCP_SERVER_NAME}' entry in {mcp_config_path}"
+    if not isinstance(entry.get("command"), str) or not isinstance(entry.get("args", []), list):
+        return "fail", f"'{MCP_SERVER_NAME}' entry in {mcp_config_path} has no valid command/args"
+    if entry.get("disabled"):
+        return "warn", f"'{MCP_SERVER_NAME}' is disabled in {mcp_config_path}"
+    missing = [path for path in [entry["command"]] + entry.get("args", [])[:1]
+               if isinstance(path, str) and os.path.isabs(path) and not os.path.isfile(path)]
+    if missing:
+        return "fail", f"'{MCP_SERVER_NAME}' starts {missing[0]}, which no longer exists (re-run with --mcp-launch node)"
+    env = entry.get("env") if isinstance(entry.get("env"), dict) else {}
+    placeholders = [key for key in ("ANTHROPIC_API_KEY", "PERPLEXITY_API_KEY")
+                    if not env.get(key) or env.get(key) == DEFAULT_MCP_ENV[key]]
+    if placeholders:
+        return "warn", f"configured in {mcp_config_path}, but {', '.join(placeholders)} still a placeholder"
+    return "ok", f"configured in {mcp_config_path}"
+
+def _status_rules(project_dir, source, cache):
+    """Reports whether .roomodes and .roo/rules-* exist and match the last known published set."""
+    local_files = collect_rule_files(project_dir)
+    if not local_files:
+        return "fail", f"no {RULES_MODES_FILE} or .roo/rules-* files"
+    try:
+        manifest, published = known_rules(source, cache)
+    except RulesSourceError as e:
+        return "warn", f"{len(local_files)} files present; could not read the rules source: {e}"
+    if manifest is None:
+        return "warn", f"{len(local_files)} files present; nothing cached for the rules source to compare against"
+    expected = manifest_digests(manifest)
+    local_digests = {path: hashlib.sha256(data).hexdigest() for path, data in local_files.items()}
+    missing, changed = rules_drift(project_dir, local_digests, expected, published)
+    if missing or changed:
+        problems = [f"{len(paths)} {label}: {', '.join(paths[:3])}{', ...' if len(paths) > 3 else ''}"
+                    for label, paths in (("missing", missing), ("differ", changed)) if paths]
+        return "warn", f"out of date ({'; '.join(problems)})"
+    return "ok", f"{len(expected)} files match the published set"
+
+def _status_legacy(project_dir):
+    """Reports .cursor and .windsurfrules leftovers that install would migrate or remove."""
+    leftovers = legacy_leftovers(project_dir)
+    if leftovers:
+        return "warn", f"{' and '.join(leftovers)} still present (run install to migrate)"
+    return "ok", "no .cursor or .windsurfrules leftovers"
+
+def _status_install_state(project_dir):
+    """Reports an install that stopped part-way (see run_install)."""
+    state = InstallState(project_dir / ".roo" / INSTALL_STATE_NAME)
+    if state.stages:
+        return "warn", f"an earlier install stopped after {len(state.stages)} stages; run install again to resume"
+    return "ok", "no unfinished install"
+
+def collect_status(project_dir, args):
+    """Runs every read-only check and returns [(check, state, detail)]; state is one of STATUS_STATES."""
+    project_dir = Path(project_dir)
+    cache = None if args.no_cache else DownloadCache(args.cache_dir)
+    return [
+        (TASKMASTER_PACKAGE, *_status_taskmaster(project_dir, args.taskmaster_version)),
+        ("mcp", *_status_mcp()),
+        ("rules", *_status_rules(project_dir, args.rules_source, cache)),
+        ("legacy", *_status_legacy(project_dir)),
+        ("install", *_status_install_state(project_dir)),
+    ]
+
+def run_status(args):
+    """Prints whether the project is set up, without prompting, installing or using the network.
+
+    Returns 0 when no check failed (warnings allowed), else 1.
+    """
+    checks = collect_status(args.project_dir, args)
+    if args.json:
+        print(json.dumps({"project": str(Path(args.project_dir).resolve()),
+                          "checks": [{"check": name, "state": state, "detail": detail} for name, state, detail in checks]},
+                         indent=2))
+    else:
+        colors = {"ok": COLOR_GREEN, "warn": COLOR_YELLOW, "fail": COLOR_RED}
+        width = max(len(name) for name, _, _ in checks)
+        for name, state, detail in checks:
+            print_plain(f"{name:<{width}}  {colors[state]}{state:<4}{COLOR_RESET}  {detail}")
+    return 1 if any(state == "fail" for _, state, _ in checks) else 0
+
+def run_probe(args):
+    """Starts the configured taskmaster-ai server --runs times and reports its startup latency and tools.
+
+    Returns 0 when every run completed and every always-allowed tool is offered, else 1.
+    """
+    mcp_config_path = args.mcp_settings or get_mcp_settings_path()
+    report = run_mcp_probe(mcp_config_path, args.runs, args.timeout)
+    if args.json:
+        print(json.dumps({"mcp_settings": str(mcp_config_path), **report}, indent=2))
+    else:
+        print_info(f"Probing '{MCP_SERVER_NAME}' from {mcp_config_path}")
+        print_mcp_probe_report(report)
+    return 0 if report["ok"] else 1
+
+# --- Audit ---
+
+class AuditHashCache:
+    """sha256 of rule files by absolute path, reused while their size and mtime are unchanged.
+
+    Kept as JSON in the cache directory in the migration index's layout
+    ({"version", "written_at_ns", "files": {path: [size, mtime_ns, sha256]}});
+    entries modified too close to the audit that recorded them are re-hashed,
+    for the same racy-timestamp reason. Safe to use from several threads.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path) if path else None
+        self.started_ns = time.time_ns() # Recorded as written_at_ns: every stat of this audit comes later
+        self.known, self.known_ns = {}, 0
+        self.seen = {}
+        self.hashed = self.reused = 0
+        self.lock = threading.Lock()
+        try:
+            with open(self.path, "rb") as f:
+                data = json.loads(f.read().decode('utf-8'))
+            if isinstance(data, dict) and data.get("version") == 1 and isinstance(data.get("files"), dict):
+                self.known, self.known_ns = data["files"], int(data.get("written_at_ns", 0))
+        except (TypeError, OSError, ValueError):
+            pass # No cache yet (or unreadable): everything is hashed
+
+    def digest(self, path, size, mtime_ns):
+        """sha256 of the file at path, whose stat gave size and mtime_ns. Raises OSError if it cannot be read."""
+        key = str(path)
+        known = self.known.get(key)
+        racy_window = MIGRATION_INDEX_COARSE_RACY_NS if mtime_ns % 1_000_000_000 == 0 else MIGRATION_INDEX_RACY_NS
+        if isinstance(known, list) and len(known) == 3 and known[:2] == [size, mtime_ns] \
+                and mtime_ns < self.known_ns - racy_window:
+            digest, hashed = known[2], False
+        else:
+            digest, hashed = _sha256_file(path), True
+        with self.lock:
+            self.seen[key] = [size, mtime_ns, digest]
+            if hashed:
+                self.hashed += 1
+            else:
+                self.reused += 1
+        return digest
+
+    def save(self, root):
+        """Writes the entries of this audit, keeping those of other trees (anything outside root)."""
+        if self.path is None:
+            return
+        prefix = os.path.join(str(root), "")
+        files = {key: value for key, value in self.known.items() if not key.startswith(prefix)}
+        files.update(self.seen)
+        data = {"version": 1, "written_at_ns": self.started_ns, "files": files}
+        try:
+            atomic_write_bytes(self.path, json.dumps(data, separators=(",", ":")).encode('utf-8'))
+        except OSError as e:
+            print_warning(f"Could not save the audit hash cache {self.path}: {e}")
+
+def find_projects(root, pool, max_depth=AUDIT_MAX_DEPTH):
+    """Directories under root holding a .roomodes or .roo, searched level by level with pool's threads.
+
+    Symlinked directories, dot-directories and AUDIT_SKIP_DIRS are not entered;
+    projects are searched for nested projects too.
+    """
+    def scan(directory):
+        is_project, subdirs = False, []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name in (RULES_MODES_FILE, ".roo"):
+                        is_project = True
+                    elif not entry.name.startswith(".") and entry.name not in AUDIT_SKIP_DIRS \
+                            and entry.is_dir(follow_symlinks=False):
+                        subdirs.append(Path(entry.path))
+        except OSError:
+            pass # Unreadable or gone: nothing below it is audited
+        return is_project, subdirs
+
+    projects, level = [], [Path(root)]
+    for depth in range(max_depth + 1):
+        next_level = []
+        for directory, (is_project, subdirs) in zip(level, pool.map(scan, level)):
+            if is_project:
+                projects.append(directory)
+            if depth < max_depth:
+                next_level.extend(subdirs)
+        level = next_level
+    return sorted(projects)
 
-def print_warning(message):
-    """Prints a warning message with color."""
-    print(f"{COLOR_YELLOW}⚠️ [WARN] {message}{COLOR_RESET}") # Added color
+def _project_mcp_entry(project_dir):
+    """The taskmaster-ai entry of the project's .roo/mcp.json, read without printing errors."""
+    try:
+        with open(Path(project_dir) / PROJECT_MCP_SETTINGS, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        return None
+    servers = config.get("mcpServers") if isinstance(config, dict) else None
+    entry = servers.get(MCP_SERVER_NAME) if isinstance(servers, dict) else None
+    return entry if isinstance(entry, dict) else None
 
-def print_error(message):
-    """Prints an error message with color."""
-    print(f"{COLOR_RED}❌ [ERROR] {message}{COLOR_RESET}") # Added color
+def audit_project(project_dir, reference, hash_cache, global_mcp):
+    """Checks one project without changing it and returns its report dict.
 
-def print_question(message):
-    """Prints a question prompt with color."""
-    return input(f"{COLOR_BLUE}❓ {message}{COLOR_RESET} ") # Use input directly
+    reference holds "expected" ({path: sha256}), "published" (files or None) and
+    "compacted" (see compacted_digests). report["problems"] lists "rules",
+    "legacy" and "mcp" as they apply; extra rule files are reported but are not a problem.
+    """
+    local_digests, unreadable = {}, []
+    for rel_path, (size, mtime_ns, _) in sorted(WatchRoot("project", project_dir).scan().items()):
+        try:
+            local_digests[rel_path] = hash_cache.digest(project_dir / rel_path, size, mtime_ns)
+        except OSError:
+            unreadable.append(rel_path)
+    missing, changed = rules_drift(project_dir, local_digests, reference["expected"],
+                                   reference["published"], reference["compacted"])
+    extra = sorted(path for path in local_digests if path not in reference["expected"])
+    legacy = legacy_leftovers(project_dir)
+    mcp = "project" if _project_mcp_entry(project_dir) else "global" if global_mcp else "missing"
+    problems = [name for name, found in (("rules", missing or changed or unreadable), ("legacy", legacy),
+                                         ("mcp", mcp == "missing")) if found]
+    return {"project": str(project_dir), "problems": problems,
+            "rules": {"files": len(local_digests), "missing": missing, "changed": changed,
+                      "unreadable": unreadable, "extra": extra},
+            "legacy": legacy, "mcp": mcp}
 
-def print_code(code_str, language="json"):
-    """Prints a code block."""
-    print(f"```{language}")
-    print(code_str)
-    print("```")
+def _audit_reference(args, cache):
+    """The reference to audit against, from --manifest or the rules source; raises RulesSourceError."""
+    if args.manifest:
+        try:
+            with open(args.manifest, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            raise RulesSourceError(f"cannot read {args.manifest}: {e}")
+        if not isinstance(manifest, dict) or not isinstance(manifest.get("files"), list):
+            raise RulesSourceError(f"{args.manifest} is not a {RULES_MANIFEST_NAME}")
+        return {"source": str(args.manifest), "expected": manifest_digests(manifest), "published": None, "compacted": {}}
+    manifest, published = known_rules(args.rules_source, cache)
+    if manifest is None:
+        raise RulesSourceError(f"nothing cached for {args.rules_source}; run install with it once "
+                               "or pass --manifest")
+    return {"source": args.rules_source, "expected": manifest_digests(manifest), "published": published,
+            "compacted": compacted_digests(published) if published else {}}
 
-# This function runs commands interactively, showing live output (like npm init prompts)
-def run_command_interactive(command_list, check=False, shell=False, cwd=None):
-    """Runs a shell command interactively, showing live output."""
-    command_str = " ".join(command_list) if isinstance(command_list, list) else command_list
-    print_info(f"Running command interactively: {COLOR_BOLD}{command_str}{COLOR_RESET}" + (f" in {cwd}" if cwd else ""))
-    print_info("Output will appear below. The script will wait for this command to finish...")
-    try:
-        # Use Popen for more control if needed, but run should work for inheriting stdio
-        process = subprocess.run(
-            command_list,
-            check=check, # Often False for interactive setup commands that might exit 0 after prompts
-            shell=shell,
-            cwd=cwd,
-            # Let the subprocess inherit stdin, stdout, stderr from the script's process
-            # This allows user interaction and shows live output
-            stdin=None, # Inherit
-            stdout=None, # Inherit
-            stderr=None # Inherit
-        )
-        print_info(f"Interactive command '{command_str}' finished with exit code {process.returncode}.")
-        # Success determination might depend on the command. check=False means we don't raise error on non-zero exit.
-        # We might assume success if no exception occurred, or check returncode if needed.
-        return process.returncode == 0 # Return True if exit code is 0
-    except subprocess.CalledProcessError as e:
-        # This is only reached if check=True and it fails
-        print_error(f"Interactive command failed with exit code {e.returncode}: {command_str}")
-        return False
-    except FileNotFoundError:
-        print_error(f"Command not found: {command_list[0]}. Is it installed and in PATH?")
-        return False
-    except Exception as e:
-        print_error(f"An unexpected error occurred while running interactive command: {e}")
-        return False
+def run_audit(args):
+    """Reports the projects under args.root whose rules, legacy files or MCP entry need attention.
 
-# This function runs commands and captures their output (useful for checks)
-def run_command_capture(command_list, check=True, shell=False, cwd=None):
-    """Runs a shell command verbosely and captures output."""
-    command_str = " ".join(command_list) if isinstance(command_list, list) else command_list
-    print_info(f"Running command (capturing output): {COLOR_BOLD}{command_str}{COLOR_RESET}" + (f" in {cwd}" if cwd else ""))
+    Read-only and without network access (URL rules sources come from the
+    download cache). Returns 0 when no project drifted, 1 when some did, 2 when
+    there is no reference to compare against.
+    """
+    started = time.monotonic()
+    root = Path(args.root).resolve()
+    cache = None if args.no_cache else DownloadCache(args.cache_dir)
     try:
-        process = subprocess.run(
-            command_list,
-            check=check,
-            shell=shell,
-            text=True,
-            stdout=subprocess.PIPE, # Capture stdout
-            stderr=subprocess.PIPE, # Capture stderr
-            cwd=cwd
-        )
-        if process.stdout:
-            print(f"{COLOR_GREEN}[STDOUT]{COLOR_RESET}\n{process.stdout.strip()}")
-        if process.stderr:
-            print(f"{COLOR_YELLOW}[STDERR]{COLOR_RESET}\n{process.stderr.strip()}")
-        print_info(f"Command '{command_str}' executed successfully (captured).")
-        return True, process.stdout, process.stderr
-    except subprocess.CalledProcessError as e:
-        print_error(f"Command failed with exit code {e.returncode}: {command_str}")
-        if e.stdout:
-            print(f"{COLOR_RED}[STDOUT]{COLOR_RESET}\n{e.stdout.strip()}")
-        if e.stderr:
-            print(f"{COLOR_RED}[STDERR]{COLOR_RESET}\n{e.stderr.strip()}")
-        return False, e.stdout, e.stderr
-    except FileNotFoundError:
-        print_error(f"Command not found: {command_list[0]}. Is it installed and in PATH?")
-        return False, "", ""
-    except Exception as e:
-        print_error(f"An unexpected error occurred while running command: {e}")
-        return False, "", ""
+        reference = _audit_reference(args, cache)
+    except RulesSourceError as e:
+        print_error(f"No reference to audit against: {e}")
+        return 2
+    hash_cache = AuditHashCache(None if args.no_cache else Path(args.cache_dir) / AUDIT_HASH_CACHE_NAME)
+    mcp_config_path = get_mcp_settings_path()
+    global_mcp = mcp_config_path is not None and read_mcp_server_entry(mcp_config_path) is not None
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        projects = find_projects(root, pool, args.max_depth)
+        found_at = time.monotonic()
+        results = list(pool.map(lambda project: audit_project(project, reference, hash_cache, global_mcp), projects))
+    hash_cache.save(root)
+    drifted = [result for result in results if result["problems"]]
+    summary = {"projects": len(results), "drifted": len(drifted),
+               **{problem: sum(problem in result["problems"] for result in results) for problem in ("rules", "legacy", "mcp")},
+               "files_hashed": hash_cache.hashed, "files_cached": hash_cache.reused,
+               "search_seconds": round(found_at - started, 3), "seconds": round(time.monotonic() - started, 3)}
+    if args.json:
+        print(json.dumps({"root": str(root), "reference": reference["source"],
+                          "mcp_settings": str(mcp_config_path) if mcp_config_path else None,
+                          "summary": summary, "projects": results}, indent=2))
+        return 1 if drifted else 0
+    width = max([len(os.path.relpath(result["project"], root)) for result in drifted] + [len("PROJECT")])
+    if drifted:
+        print_plain(f"{'PROJECT':<{width}}  {'RULES':<24}  {'LEGACY':<22}  MCP")
+    for result in drifted:
+        rules = result["rules"]
+        counts = ", ".join(f"{len(rules[key])} {key}" for key in ("missing", "changed", "unreadable") if rules[key])
+        print_plain(f"{os.path.relpath(result['project'], root):<{width}}  {counts or 'ok':<24}  "
+                    f"{' '.join(result['legacy']) or 'ok':<22}  {result['mcp']}")
+    message = (f"Audited {summary['projects']} projects under {root} in {summary['seconds']:.2f}s "
+               f"({summary['files_hashed']} files hashed, {summary['files_cached']} from the hash cache).")
+    if drifted:
+        print_warning(f"{message} {len(drifted)} need attention: {summary['rules']} with stale rules, "
+                      f"{summary['legacy']} with legacy leftovers, {summary['mcp']} without a '{MCP_SERVER_NAME}' entry.")
+        return 1
+    print_info(f"{message} All match {reference['source']}. ✅")
+    return 0
 
+# --- Main Script Logic ---
 
-def ask_yes_no(prompt, default=None):
-    """Asks a yes/no question with color."""
-    while True:
-        options = "[y/n]"
-        if default == 'y':
-            options = f"[{COLOR_BOLD}Y{COLOR_RESET}/n]"
-        elif default == 'n':
-            # Corrected logic for default 'n'
-            options = f"[y/{COLOR_BOLD}N{COLOR_RESET}]"
-        # else: options remains "[y/n]"
+COMMANDS = ("install", "fleet", "pack", "bundle", "watch", "status", "probe", "audit")
 
-        # Use print_question for colored input prompt
-        response = print_question(f"{prompt} {options}:").lower().strip() # Pass options here
+def parse_args(argv=None):
+    """Parses command-line options. Without a command, 'install' is assumed."""
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ("-h", "--help")):
+        argv.insert(0, "install")
 
-        if not response and default is not None: # Check default is not None
-            return default == 'y'
-        elif response in ['y', 'yes']:
-            return True
-        elif response in ['n', 'no']:
-            return False
-        else:
-            print_warning("Please answer 'yes' or 'no'.")
+    # Only the requested command's parser is built (all of them for top-level --help), so quick commands
+    # like 'status' do not pay for the install and fleet options
+    building = set(COMMANDS) if argv[0] in ("-h", "--help") else {argv[0]}
+    if building & {"install", "fleet"}:
+        common_options = argparse.ArgumentParser(add_help=False)
+        common_options.add_argument("--offline", action="store_true",
+                                    help="Serve .roomodes and rule files from the download cache without network access.")
+        common_options.add_argument("--no-cache", action="store_true",
+                                    help="Always download modes and rules in full and do not update the cache.")
+        common_options.add_argument("--cache-dir", type=Path, default=None,
+                                    help=f"Download cache location (default: {get_cache_dir()}, or ${CACHE_DIR_ENV_VAR}).")
+        common_options.add_argument("--mcp-launch", choices=MCP_LAUNCH_MODES, default="npx",
+                                    help=f"How Roo starts the MCP server: 'npx -y {MCP_BIN_NAME}' (default), or node with "
+                                         "the absolute path of the installed server script, which skips npx's registry "
+                                         "check on every editor launch (falls back to npx if it cannot be resolved).")
+        common_options.add_argument("--probe-mcp", nargs="?", const=1, type=int, default=0, metavar="RUNS",
+                                    help="After configuring MCP, start the server as Roo would (RUNS times, default 1), "
+                                         "time the 'initialize' and 'tools/list' answers and check the alwaysAllow tools.")
+        common_options.add_argument("--compact-rules", action="store_true",
+                                    help="Drop blocks a mode's rule files repeat from its own context and normalize "
+                                         "whitespace; prints bytes and estimated tokens per mode.")
+        common_options.add_argument("--shared-store", action="store_true",
+                                    help="Keep one copy of each mode/rule file per machine, in the content-addressed "
+                                         "store under the cache directory, and link it into projects.")
+        common_options.add_argument("--store-link", choices=STORE_LINK_METHODS, default="reflink",
+                                    help="How --shared-store places files: reflinks (copy-on-write on btrfs/XFS; "
+                                         "default) or hardlinks (shared page cache, but an in-place edit reaches every "
+                                         "linked project until the next sync). Both copy across filesystems.")
+        common_options.add_argument("--rules-source", default=GITHUB_BASE_URL, metavar="SOURCE",
+                                    help="Where .roomodes and the rule files come from: an http(s) URL of a published "
+                                         "bundle, a directory, a tar/zip bundle, or git:PATH[#REF] "
+                                         "(default: the roo-taskmaster-patch repository on GitHub).")
+        common_options.add_argument("--taskmaster-version", default=DEFAULT_TASKMASTER_VERSION, metavar="RANGE",
+                                    help="npm version range an existing task-master-ai must satisfy to skip "
+                                         f"'npm install' (default: '{DEFAULT_TASKMASTER_VERSION}').")
+        common_options.add_argument("--from-bundle", type=Path, default=None, metavar="BUNDLE",
+                                    help="Install without network access from an archive written by the 'bundle' "
+                                         "command: its task-master-ai version, npm cache, modes and rules.")
+        common_options.add_argument("--reinstall", action="store_true",
+                                    help="Run 'npm install' even when a compatible task-master-ai is already installed.")
+        common_options.add_argument("--migrate-workers", type=int, default=None, metavar="N",
+                                    help="Processes used to rewrite migrated .cursor files (default: CPU count).")
+        common_options.add_argument("--migrate-mode", choices=MIGRATION_MODES, default="move",
+                                    help="Merge .cursor into .roo by renaming entries (default) or by copying the tree.")
+        common_options.add_argument("--rescan-migration", action="store_true",
+                                    help=f"Ignore .roo/{MIGRATION_INDEX_NAME} and re-check every migrated file.")
+        common_options.add_argument("--profile", nargs="?", const=Path(DEFAULT_PROFILE_PATH), type=Path, default=None,
+                                    metavar="TRACE",
+                                    help="Time every stage, subprocess, download and migration batch; write a "
+                                         f"Chrome/Perfetto trace (default: {DEFAULT_PROFILE_PATH}) and print a summary.")
+        common_options.add_argument("--command-log", type=Path, default=None, metavar="FILE",
+                                    help="Append the full output of npm and task-master commands to FILE "
+                                         "(the terminal shows it live; only the last lines are kept in memory).")
+        common_options.add_argument("--deadline", type=float, default=None, metavar="SECONDS",
+                                    help="Overall time budget; commands and downloads still running then are stopped.")
+        common_options.add_argument("--stage-timeout", action="append", default=[], metavar="STAGE=SECONDS",
+                                    help="Time limit for one stage (repeatable; 0 or 'none' removes the limit). "
+                                         "Defaults: " + ", ".join(f"{k}={v}" for k, v in DEFAULT_STAGE_TIMEOUTS.items()) + ".")
+        common_options.add_argument("--retries", type=int, default=DOWNLOAD_RETRIES, metavar="N",
+                                    help="Retries for downloads that fail with a transient error, with exponential "
+                                         f"backoff (default: {DOWNLOAD_RETRIES}).")
+        common_options.add_argument("--hedge", default="off", metavar="{off,pNN,SECONDS}",
+                                    help="Send a second request for a download still unanswered after SECONDS, or after "
+                                         "the NNth percentile of recent latencies to that host (e.g. p95). Default: off.")
 
-def get_mcp_settings_path():
-    """Determines the path to the Roo Code MCP settings file."""
-    system = platform.system()
-    home = Path.home()
-    # Assuming VSCodium paths, adjust if using standard VSCode
-    codium_app_support_name = "VSCodium" # Change to "Code" for standard VSCode if needed
+    parser = argparse.ArgumentParser(
+        description="Install Task Master AI and configure Roo Code modes and rules for this project."
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+    if "install" in building:
+        install_parser = subparsers.add_parser("install", parents=[common_options],
+                                               help="Interactively set up the current project (default).")
+        install_parser.add_argument("--force", action="append", default=[], metavar="STAGE",
+                                    choices=["all"] + [stage.name for stage in INSTALL_STAGES if stage.name in INSTALL_CHECKPOINTS],
+                                    help=f"Redo a stage recorded in .roo/{INSTALL_STATE_NAME} by an interrupted run "
+                                         "(repeatable; 'all' starts over).")
+    if "fleet" in building:
+        fleet_parser = subparsers.add_parser("fleet", parents=[common_options],
+                                             help="Provision many projects from a manifest without prompting.")
+        fleet_parser.add_argument("manifest", type=Path, help="JSON manifest listing project paths and answers.")
+        fleet_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 4,
+                                  help="Number of projects provisioned concurrently (default: CPU count).")
+        fleet_parser.add_argument("--log-dir", type=Path, default=None,
+                                  help="Write each project's full log to this directory.")
+    if "pack" in building:
+        pack_parser = subparsers.add_parser("pack", help=f"Build {RULES_MANIFEST_NAME} and the rules bundle for publishing.")
+        pack_parser.add_argument("source_dir", type=Path, nargs="?", default=Path("."),
+                                 help="Directory holding .roomodes and .roo/rules-* (default: current directory).")
+        pack_parser.add_argument("-o", "--output-dir", type=Path, default=None,
+                                 help="Where to write the manifest and bundle (default: the source directory).")
+        pack_parser.add_argument("--format", choices=("tar.gz", "zip"), default="tar.gz", help="Bundle format.")
+        pack_parser.add_argument("--check", action="store_true",
+                                 help="Write nothing; exit 1 if the published manifest or bundle is out of date.")
+        pack_parser.add_argument("--report", action="store_true",
+                                 help="Write nothing; print each mode's context size in bytes and estimated tokens, "
+                                      "before and after --compact-rules.")
 
-    if system == "Darwin": # macOS
-        path = home / "Library" / "Application Support" / codium_app_support_name / "User" / "globalStorage" / "rooveterinaryinc.roo-cline" / "settings" / "mcp_settings.json"
-    elif system == "Linux":
-        path = home / ".config" / codium_app_support_name / "User" / "globalStorage" / "rooveterinaryinc.roo-cline" / "settings" / "mcp_settings.json"
-    elif system == "Windows":
-        appdata = os.getenv('APPDATA')
-        if not appdata:
-            print_error("Could not determine APPDATA directory on Windows.")
-            return None
-        path = Path(appdata) / codium_app_support_name / "User" / "globalStorage" / "rooveterinaryinc.roo-cline" / "settings" / "mcp_settings.json"
-    else:
-        print_error(f"Unsupported operating system: {system}")
-        return None
+    if "bundle" in building:
+        bundle_parser = subparsers.add_parser("bundle", help="Pack task-master-ai with its dependencies, the modes and the "
+                                                             "rules into one archive for 'install --from-bundle'.")
+        bundle_parser.add_argument("output", type=Path, nargs="?", default=Path(OFFLINE_BUNDLE_NAME),
+                                   help=f"Archive to write (default: {OFFLINE_BUNDLE_NAME}); BUNDLE.sha256 is written next to it.")
+        bundle_parser.add_argument("--rules-source", default=GITHUB_BASE_URL, metavar="SOURCE",
+                                   help="Where .roomodes and the rule files come from (see install --rules-source).")
+        bundle_parser.add_argument("--taskmaster-version", default=DEFAULT_TASKMASTER_VERSION, metavar="RANGE",
+                                   help="npm version range of task-master-ai to bundle; the newest match is pinned.")
+        bundle_parser.add_argument("--cache-dir", type=Path, default=None, help="Download cache location.")
+        bundle_parser.add_argument("--no-cache", action="store_true", help="Download modes and rules in full.")
 
-    # Don't print path here, print it when actually used/checked later
-    # print_info(f"Detected MCP settings path: {path}")
-    return path
+    if "watch" in building:
+        watch_parser = subparsers.add_parser("watch", help="Keep the project's modes and rules in sync with the rules "
+                                                           "source as either changes (runs until Ctrl-C).")
+        watch_parser.add_argument("project_dir", type=Path, nargs="?", default=Path("."),
+                                  help="Project to keep in sync (default: current directory).")
+        watch_parser.add_argument("--rules-source", default=GITHUB_BASE_URL, metavar="SOURCE",
+                                  help="Where .roomodes and the rule files come from (see install --rules-source).")
+        watch_parser.add_argument("--interval", type=float, default=WATCH_REMOTE_INTERVAL, metavar="SECONDS",
+                                  help=f"How often URL and git sources are checked (default: {WATCH_REMOTE_INTERVAL}).")
+        watch_parser.add_argument("--debounce", type=float, default=WATCH_DEBOUNCE, metavar="SECONDS",
+                                  help=f"Quiet time before a burst of edits is synced (default: {WATCH_DEBOUNCE}).")
+        watch_parser.add_argument("--poll", action="store_true",
+                                  help=f"Scan for changes every {WATCH_POLL_INTERVAL}s instead of using inotify "
+                                       "(e.g. on network filesystems).")
+        watch_parser.add_argument("--compact-rules", action="store_true", help="Install rule files compacted.")
+        watch_parser.add_argument("--shared-store", action="store_true", help="Link files from the shared store.")
+        watch_parser.add_argument("--store-link", choices=STORE_LINK_METHODS, default="reflink")
+        watch_parser.add_argument("--offline", action="store_true", help="Read URL sources from the download cache only.")
+        watch_parser.add_argument("--cache-dir", type=Path, default=None, help="Download cache location.")
+        watch_parser.add_argument("--no-cache", action="store_true",
+                                  help="Download URL sources in full on every check, without conditional requests.")
 
-def read_json_file(path):
-    """Reads a JSON file."""
-    if not path or not path.exists():
-        # This is not necessarily a warning, could be expected
-        # print_warning(f"File not found: {path}")
-        return None
-    try:
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        print_error(f"Error decoding JSON from file: {path}")
-        return None
-    except IOError as e:
-        print_error(f"Error reading file {path}: {e}")
-        return None
+    if "status" in building:
+        status_parser = subparsers.add_parser("status", help="Report whether the project is set up (read-only, no network).")
+        status_parser.add_argument("project_dir", type=Path, nargs="?", default=Path("."),
+                                   help="Project to check (default: current directory).")
+        status_parser.add_argument("--json", action="store_true", help="Print the checks as JSON.")
+        status_parser.add_argument("--rules-source", default=GITHUB_BASE_URL, metavar="SOURCE",
+                                   help="Rules source to compare against (URL sources are read from the cache only).")
+        status_parser.add_argument("--taskmaster-version", default=DEFAULT_TASKMASTER_VERSION, metavar="RANGE",
+                                   help="npm version range the installed task-master-ai should satisfy.")
+        status_parser.add_argument("--cache-dir", type=Path, default=None, help="Download cache location.")
+        status_parser.add_argument("--no-cache", action="store_true", help="Do not consult the download cache.")
 
-def write_json_file(path, data):
-    """Writes data to a JSON file."""
-    if not path:
-        print_error("Invalid path provided for writing JSON.")
-        return False
+    if "probe" in building:
+        probe_parser = subparsers.add_parser("probe", help="Start the configured MCP server, time its handshake and "
+                                                           "check its tools (no install).")
+        probe_parser.add_argument("--runs", type=int, default=1, help="Times to start the server; p50/p95 are reported.")
+        probe_parser.add_argument("--timeout", type=float, default=MCP_COLD_START_TIMEOUT, metavar="SECONDS",
+                                  help=f"Time each run may take (default: {MCP_COLD_START_TIMEOUT}).")
+        probe_parser.add_argument("--mcp-settings", type=Path, default=None, metavar="PATH",
+                                  help="mcp_settings.json to read (default: Roo Code's settings file).")
+        probe_parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+
+    if "audit" in building:
+        audit_parser = subparsers.add_parser("audit", help="Report which projects under a directory have stale rules, "
+                                                           "legacy leftovers or no MCP entry (read-only, no network).")
+        audit_parser.add_argument("root", type=Path, nargs="?", default=Path("."),
+                                  help="Directory searched for projects with .roomodes or .roo (default: current directory).")
+        audit_parser.add_argument("--rules-source", default=GITHUB_BASE_URL, metavar="SOURCE",
+                                  help="Rules source to compare against (URL sources are read from the cache only).")
+        audit_parser.add_argument("--manifest", type=Path, default=None, metavar="FILE",
+                                  help=f"Compare against this {RULES_MANIFEST_NAME} instead of the rules source.")
+        audit_parser.add_argument("-j", "--jobs", type=int, default=AUDIT_WORKERS,
+                                  help=f"Threads scanning directories and hashing files (default: {AUDIT_WORKERS}).")
+        audit_parser.add_argument("--max-depth", type=int, default=AUDIT_MAX_DEPTH, metavar="N",
+                                  help=f"Directory levels below the root searched for projects (default: {AUDIT_MAX_DEPTH}).")
+        audit_parser.add_argument("--json", action="store_true", help="Print the drift report as JSON.")
+        audit_parser.add_argument("--cache-dir", type=Path, default=None,
+                                  help=f"Download cache location; also holds {AUDIT_HASH_CACHE_NAME}.")
+        audit_parser.add_argument("--no-cache", action="store_true",
+                                  help="Do not consult the download cache and hash every file again.")
+
+    args = parser.parse_args(argv)
+    if args.command == "pack":
+        return args
+    if args.command == "probe":
+        if args.runs < 1:
+            parser.error("--runs must be at least 1.")
+        return args
+    if args.command in ("status", "bundle", "watch", "audit"):
+        if args.cache_dir is None:
+            args.cache_dir = get_cache_dir()
+        if args.command == "watch" and (args.interval <= 0 or args.debounce < 0):
+            parser.error("--interval must be positive and --debounce cannot be negative.")
+        if args.command == "audit" and (args.jobs < 1 or args.max_depth < 0):
+            parser.error("--jobs must be at least 1 and --max-depth cannot be negative.")
+        return args
+    if args.offline and args.no_cache:
+        parser.error("--offline needs the cache; it cannot be combined with --no-cache.")
+    if args.from_bundle and args.rules_source != GITHUB_BASE_URL:
+        parser.error("--from-bundle provides the modes and rules; it cannot be combined with --rules-source.")
+    if args.cache_dir is None:
+        args.cache_dir = get_cache_dir()
     try:
-        path.parent.mkdir(parents=True, exist_ok=True)
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2) # Use indent=2 for readability
-        print_info(f"Successfully wrote JSON data to {path}")
-        return True
-    except IOError as e:
-        print_error(f"Error writing file {path}: {e}")
-        return False
-    except Exception as e:
-        print_error(f"An unexpected error occurred writing JSON to {path}: {e}")
-        return False
+        open_rules_source(args.rules_source)
+    except RulesSourceError as e:
+        parser.error(f"--rules-source: {e}")
+    if getattr(args, "jobs", 1) < 1:
+        parser.error("--jobs must be at least 1.")
+    try:
+        version_satisfies("0.0.0", args.taskmaster_version)
+    except ValueError as e:
+        parser.error(f"--taskmaster-version: {e}")
+    if args.probe_mcp < 0:
+        parser.error("--probe-mcp RUNS cannot be negative.")
+    if args.deadline is not None and args.deadline <= 0:
+        parser.error("--deadline must be positive.")
+    if args.retries < 0:
+        parser.error("--retries cannot be negative.")
+    try:
+        args.stage_timeouts = parse_stage_timeouts(args.stage_timeout)
+        args.hedge = parse_hedge(args.hedge)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
 
-def fetch_and_write(url, local_path):
-    """Fetches content from a URL using urllib and writes it to a local file."""
-    local_path = Path(local_path)
+def parse_stage_timeouts(values):
+    """Merges --stage-timeout STAGE=SECONDS values over DEFAULT_STAGE_TIMEOUTS; None means no limit."""
+    known = {stage.name for stage in INSTALL_STAGES} | set(FLEET_STAGES) | {"global_install", "stage_rules"}
+    timeouts = dict(DEFAULT_STAGE_TIMEOUTS)
+    for value in values:
+        name, sep, seconds = value.partition("=")
+        if not sep or name not in known:
+            raise ValueError(f"--stage-timeout: expected STAGE=SECONDS with STAGE one of {', '.join(sorted(known))}.")
+        try:
+            timeouts[name] = None if seconds.lower() == "none" or float(seconds) == 0 else float(seconds)
+        except ValueError:
+            raise ValueError(f"--stage-timeout: invalid number of seconds '{seconds}' for {name}.")
+        if timeouts[name] is not None and timeouts[name] < 0:
+            raise ValueError(f"--stage-timeout: {name} timeout cannot be negative.")
+    return timeouts
+
+def parse_hedge(value):
+    """Parses --hedge into RetryPolicy's hedge setting."""
+    value = value.strip().lower()
     try:
-        print_info(f"Fetching {url}...")
-        # Add a user-agent header to potentially avoid blocking
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        req = urllib.request.Request(url, headers=headers)
-
-        with urllib.request.urlopen(req, timeout=30) as response: # Added timeout
-            if response.getcode() == 200:
-                content = response.read().decode('utf-8')
-                print_info(f"Writing content to {local_path}...")
-                local_path.parent.mkdir(parents=True, exist_ok=True)
-                with open(local_path, "w", encoding='utf-8') as f:
-                    f.write(content)
-                print_info(f"Successfully wrote {local_path}")
-                return True
-            else:
-                print_error(f"Error fetching {url}: HTTP status code {response.getcode()}")
-                return False
-    except urllib.error.HTTPError as e:
-        print_error(f"HTTP Error fetching {url}: {e.code} {e.reason}")
-        return False
-    except urllib.error.URLError as e:
-        print_error(f"URL Error fetching {url}: {e.reason}")
-        return False
-    except IOError as e:
-        print_error(f"Error writing to {local_path}: {e}")
-        return False
-    except Exception as e:
-        print_error(f"An unexpected error occurred while processing {url}: {e}")
-        return False
+        if value == "off":
+            return None
+        if value.startswith("p"):
+            pct = float(value[1:])
+            if 0 < pct < 100:
+                return ("percentile", pct)
+        elif float(value) > 0:
+            return ("after", float(value))
+    except ValueError:
+        pass
+    raise ValueError(f"--hedge: expected 'off', a percentile like 'p95' or a number of seconds, not '{value}'.")
 
-def process_cursor_files(roo_dir_path):
-    """Copies .cursor contents into .roo, modifies files, and removes .cursor."""
-    print_step("Processing legacy .cursor directory (if exists)  legacy files 🧹")
-    cursor_dir = Path(".cursor")
-    roo_dir = roo_dir_path # Already a Path object
+# --- Stage Scheduler ---
 
-    if cursor_dir.exists() and cursor_dir.is_dir():
-        print_info(f"Found {cursor_dir}. Merging contents into {roo_dir}...")
-        # --- FIX: Use copytree with dirs_exist_ok=True to merge ---
-        try:
-            # Ensure the target directory exists
-            roo_dir.mkdir(parents=True, exist_ok=True)
-            # Copy contents, merging with existing directory (Requires Python 3.8+)
-            shutil.copytree(cursor_dir, roo_dir, dirs_exist_ok=True)
-            print_info(f"Merged contents of {cursor_dir} into {roo_dir}.")
-        except TypeError:
-            # Fallback for Python < 3.8 which doesn't support dirs_exist_ok
-            print_warning("Python version < 3.8 detected. Using manual file copy for merging.")
-            try:
-                for item in os.listdir(cursor_dir):
-                    s = cursor_dir / item
-                    d = roo_dir / item
-                    if s.is_dir():
-                        # For directories, try copytree again for sub-merging if possible
-                        # This might still fail on very old Python, but covers more cases
-                        try:
-                            shutil.copytree(s, d, dirs_exist_ok=True)
-                        except TypeError: # Inner copytree failed
-                             print_warning(f"Manual recursive copy needed for {s}. Skipping complex merge for older Python.")
-                             # Implement a full recursive manual copy if absolutely needed,
-                             # but for now, we'll just warn and skip deep merge for simplicity.
-                    elif s.is_file(): # Only copy if it's a file
-                        shutil.copy2(s, d) # copy2 preserves metadata
-                print_info(f"Manually merged contents of {cursor_dir} into {roo_dir}.")
-            except Exception as e_fallback:
-                 print_error(f"Error during manual merge of {cursor_dir} into {roo_dir}: {e_fallback}")
-                 # Don't return here, try to continue with modification/deletion
-        except Exception as e:
-            print_error(f"Error merging {cursor_dir} into {roo_dir}: {e}")
-            # Don't return here, try to continue with modification/deletion
+class InstallAborted(Exception):
+    """Raised by a stage to stop the whole installation (e.g. npm install failed)."""
 
-        # --- Modification Step (Runs even if merge had issues, on whatever is in .roo) ---
-        print_info(f"Modifying files within {roo_dir} (if merge occurred)...")
-        files_processed = 0
-        files_renamed = 0
-        if roo_dir.exists(): # Check if target dir exists before walking
-            for root, _, files in os.walk(roo_dir):
-                root_path = Path(root)
-                for file in files:
-                    # Skip files that should have been fetched from GitHub
-                    # Check relative path to avoid modifying fetched rules
-                    relative_path_parts = (root_path / file).relative_to(roo_dir).parts
-                    if len(relative_path_parts) > 1 and relative_path_parts[0].startswith("rules-"):
-                        # print_info(f"Skipping modification for potential rule file: {relative_path_parts}")
-                        continue
-                    if file == ".roomodes": # This should be fetched to root, not in .roo
-                         continue
+class Stage:
+    """A named unit of installer work.
 
-                    file_path = root_path / file
-                    try:
-                        # Read only if it's a text file (basic check)
-                        if file.endswith(('.md', '.txt', '.json', '.js', '.py', '.sh', '.yaml', '.yml')):
-                            with open(file_path, "r", encoding='utf-8', errors='ignore') as f:
-                                content = f.read()
-
-                            original_content = content
-                            content = re.sub(r"\.mdc", ".md", content)
-                            content = re.sub(r"cursor/", "roo/", content)
-                            content = re.sub(r"Cursor", "Roo Code", content)
-                            content = re.sub(r"cursor_", "roo_", content)
-                            content = re.sub(r"\[Cursor\]\(https://www.cursor.so/\)", "[Roo Code](https://www.roocode.com/)", content)
-
-                            if content != original_content:
-                                with open(file_path, "w", encoding='utf-8') as f:
-                                    f.write(content)
-                                files_processed += 1
-
-                        # Handle .mdc files and cursor_rules.mdc specifically
-                        if file.endswith(".mdc"):
-                            new_name = file[:-4] + ".md"
-                            new_path = root_path / new_name
-                            print_info(f"Renaming {file_path} to {new_path}")
-                            os.rename(file_path, new_path)
-                            files_renamed += 1
-                            if file == "cursor_rules.mdc":
-                                roo_rules_path = root_path / "roo_rules.md"
-                                print_info(f"Renaming {new_path} to {roo_rules_path}")
-                                os.rename(new_path, roo_rules_path) # Rename again
-
-                    except Exception as file_e:
-                        print_error(f"Error processing file {file_path}: {file_e}")
-            print_info(f"Finished modifying files. Processed: {files_processed}, Renamed: {files_renamed}")
-        else:
-             print_warning(f"{roo_dir} does not exist, skipping modification step.")
+    func(ctx) runs once every stage named in deps has finished successfully.
+    Interactive stages hold the terminal (see terminal_session) while they run and
+    are started one at a time, in declaration order. timeout (seconds) bounds the
+    commands and downloads the stage runs, and the stage itself (see run_stages).
+    """
 
+    def __init__(self, name, func, deps=(), interactive=False, timeout=None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.interactive = interactive
+        self.timeout = timeout
 
-        # --- Deletion Step ---
-        print_info(f"Removing original {cursor_dir} directory...")
-        try:
-            shutil.rmtree(cursor_dir)
-            print_info(f"Successfully removed {cursor_dir}.")
-        except OSError as e:
-            print_error(f"Error removing {cursor_dir}: {e}")
+    def with_timeout(self, timeout):
+        """Returns a copy of this stage with a different timeout."""
+        return Stage(self.name, self.func, self.deps, self.interactive, timeout)
 
-    else:
-        print_info(f"{cursor_dir} directory not found. Skipping merge, modification, and deletion of .cursor.")
-        # Ensure .roo directory exists anyway for fetched rules later
-        roo_dir.mkdir(parents=True, exist_ok=True)
+def run_stages(stages, ctx, max_parallel=4):
+    """Runs stages concurrently as their dependencies complete.
 
-def remove_windsurf_rules():
-    """Removes the .windsurfrules file if it exists."""
-    windsurf_file = Path(".windsurfrules")
-    if windsurf_file.exists():
-        print_step("Removing legacy .windsurfrules file 🧹")
-        print_info(f"Found {windsurf_file}. Removing...")
-        try:
-            os.remove(windsurf_file)
-            print_info(f"Successfully removed {windsurf_file}.")
-        except OSError as e:
-            print_error(f"Error removing {windsurf_file}: {e}")
-    else:
-        print_info(".windsurfrules file not found, skipping removal.")
+    Returns {stage name: (status, seconds)} where status is 'ok', 'failed' or
+    'skipped' (a dependency failed). Re-raises InstallAborted after in-flight
+    stages have finished.
 
+    A stage still running SUBPROCESS_KILL_GRACE seconds after its timeout (its
+    commands have been stopped by then) is abandoned and counted as failed. When
+    the install deadline passes, running stages are abandoned and
+    InstallAborted is raised straight away.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        missing = [dep for dep in stage.deps if dep not in by_name]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stage(s): {', '.join(missing)}")
 
-# --- Helper function to mask keys ---
-def mask_sensitive_mcp_data(mcp_entry):
-    """Creates a copy of an MCP server entry with sensitive env vars masked."""
-    if not isinstance(mcp_entry, dict):
-        return mcp_entry # Return as-is if not a dict
+    results = {}
+    pending = list(stages)
+    running = {}
+    finished = threading.Condition()
+    completed = [] # (stage, status, seconds, exception) appended by worker threads
+    started_at = {} # Running stage name -> monotonic start time
+    overrun_at = {} # Running stage name -> monotonic time after which it is abandoned
+    aborted = None
 
-    # Deep copy to avoid modifying the original config object in memory
-    masked_entry = json.loads(json.dumps(mcp_entry))
+    def worker(stage):
+        started = time.perf_counter()
+        status, error = "ok", None
+        with profile_span(stage.name, "stage", interactive=stage.interactive) as span_attrs:
+            try:
+                with deadline_scope(stage.timeout):
+                    if stage.interactive:
+                        with terminal_session():
+                            stage.func(ctx)
+                    else:
+                        stage.func(ctx)
+            except InstallAborted as e:
+                status, error = "failed", e
+            except Exception as e:
+                status = "failed"
+                print_error(f"Stage '{stage.name}' failed: {e}")
+            span_attrs["status"] = status
+        with finished:
+            completed.append((stage, status, time.perf_counter() - started, error))
+            finished.notify()
 
-    if "env" in masked_entry and isinstance(masked_entry["env"], dict):
-        for key in masked_entry["env"]:
-            # Mask keys commonly used for secrets
-            if "KEY" in key.upper() or "TOKEN" in key.upper() or "SECRET" in key.upper():
-                 value = masked_entry["env"].get(key) # Use .get for safety
-                 # Show first/last few chars for identification if key is long enough string
-                 if isinstance(value, str) and len(value) > 8:
-                     masked_entry["env"][key] = f"{value[:4]}****{value[-4:]} [MASKED]"
-                 elif isinstance(value, str) and value: # Mask non-empty short strings
-                     masked_entry["env"][key] = "[MASKED]"
-                 # Leave empty strings or non-strings alone, or mask them too? Masking seems safer.
-                 elif value: # Mask other non-empty values
-                     masked_entry["env"][key] = "[MASKED]"
-                 # else: leave empty/None as is
-    return masked_entry
+    while pending or running:
+        if _install_deadline.expired() and aborted is None:
+            print_error("Install deadline exceeded; stopping.")
+            aborted = InstallAborted("install deadline exceeded")
+            for name in list(running):
+                del running[name]
+                results[name] = ("failed", time.monotonic() - started_at[name])
+        # Start every stage whose dependencies are done, keeping interactive stages one at a time
+        for stage in list(pending):
+            if aborted is not None:
+                break
+            dep_status = [results.get(dep, (None,))[0] for dep in stage.deps]
+            if any(status in ("failed", "skipped") for status in dep_status):
+                pending.remove(stage)
+                results[stage.name] = ("skipped", 0.0)
+                continue
+            if any(status is None for status in dep_status):
+                continue
+            if len(running) >= max_parallel:
+                break
+            if stage.interactive and any(r.interactive for r in running.values()):
+                continue
+            pending.remove(stage)
+            # Daemon threads so a prompt blocked on input() cannot keep the process alive after Ctrl-C
+            thread = threading.Thread(target=worker, args=(stage,), name=f"stage-{stage.name}", daemon=True)
+            running[stage.name] = stage
+            started_at[stage.name] = time.monotonic()
+            if stage.timeout is not None:
+                overrun_at[stage.name] = started_at[stage.name] + stage.timeout + SUBPROCESS_KILL_GRACE
+            thread.start()
+        if aborted is not None:
+            for stage in pending:
+                results[stage.name] = ("skipped", 0.0)
+            pending = []
+        if not running:
+            if pending:
+                # Only reachable with a dependency cycle
+                raise ValueError(f"Stages cannot be scheduled (dependency cycle?): {', '.join(s.name for s in pending)}")
+            break
+        with finished:
+            while not completed:
+                limits = [overrun_at[name] for name in running if name in overrun_at]
+                if _install_deadline.expires_at is not None:
+                    limits.append(_install_deadline.expires_at)
+                wait_for = min(limits) - time.monotonic() if limits else None
+                if wait_for is not None and wait_for <= 0:
+                    break
+                finished.wait(timeout=wait_for)
+            done, completed[:] = list(completed), []
+        for stage, status, seconds, error in done:
+            if stage.name not in running:
+                continue # Abandoned earlier; its late result no longer counts
+            del running[stage.name]
+            results[stage.name] = (status, seconds)
+            if error is not None and aborted is None:
+                aborted = error
+        now = time.monotonic()
+        for name in [name for name in running if overrun_at.get(name, now + 1) <= now]:
+            stage = running.pop(name)
+            print_error(f"Stage '{name}' did not finish within its {stage.timeout:g}s timeout; giving up on it.")
+            results[name] = ("failed", now - started_at[name])
+    if aborted is not None:
+        raise aborted
+    return results
 
-# --- Main Script Logic ---
+# --- Interactive Install ---
 
-def main():
-    print_step("Starting Task Master AI Installation and Setup")
-    install_globally = None
-    install_command = []
+class InstallContext:
+    """State shared between the interactive install stages."""
+
+    def __init__(self, args):
+        self.args = args
+        self.project_dir = Path(".")
+        self.roo_dir = self.project_dir / ".roo"
+        self.install_globally = None
+        self.init_command = []
+        self.mcp_config_path = None
+        self.mcp_config = None
+        self.taskmaster_mcp_exists = False
+        self.config_read_error = False
+        self.rules_digests = None # {relative path: sha256} of the mode/rule files written
+        self.init_ok = False
 
+def stage_choose_install(ctx):
+    """Asks whether to install task-master-ai globally or locally."""
     # 1. Ask install type
-    while install_globally is None:
+    ctx.install_globally = None
+    while ctx.install_globally is None:
         # Use print_question for colored input
         choice = print_question("Install taskmaster-ai globally (-g) or locally (l)? [g/l]:").lower().strip()
         if choice == 'g':
-            install_globally = True
-            install_command = ["npm", "install", "-g", "task-master-ai"]
+            ctx.install_globally = True
         elif choice == 'l':
-            install_globally = False
-            install_command = ["npm", "install", "task-master-ai"]
+            ctx.install_globally = False
         else:
             print_warning("Invalid choice. Please enter 'g' or 'l'.")
 
+
+def stage_install_package(ctx):
+    """Installs task-master-ai; aborts the install if npm fails."""
     # 2. Execute installation (Capture output for npm install)
-    print_step(f"Installing taskmaster-ai {'globally' if install_globally else 'locally'} 📦")
-    # Use run_command_capture here as we don't need interaction, just success/fail and logs
-    success, _, _ = run_command_capture(install_command, shell=platform.system() == "Windows")
-    if not success:
+    if not install_taskmaster_package(ctx.install_globally, constraint=ctx.args.taskmaster_version, reinstall=ctx.args.reinstall):
         print_error("Installation failed. Please check the errors above and ensure npm is installed and configured correctly.")
-        sys.exit(1)
+        raise InstallAborted("npm install failed")
 
+def stage_check_mcp(ctx):
+    """Reads the current Roo Code MCP settings."""
     # 3. Check MCP Configuration
-    print_step("Checking Roo Code MCP Configuration ⚙️")
-    mcp_config_path = get_mcp_settings_path()
-    mcp_config = None
-    taskmaster_mcp_exists = False
-    config_read_error = False
-
-    if mcp_config_path:
-        print_info(f"Checking MCP settings path: {mcp_config_path}")
-        if mcp_config_path.exists():
-            mcp_config = read_json_file(mcp_config_path)
-            if mcp_config is None:
-                # read_json_file already printed an error
-                config_read_error = True
-                mcp_config = {"mcpServers": {}} # Attempt recovery
-            # Check the structure carefully
-            elif isinstance(mcp_config.get("mcpServers"), dict) and MCP_SERVER_NAME in mcp_config["mcpServers"]:
-                taskmaster_mcp_exists = True
-                print_info(f"Found existing '{MCP_SERVER_NAME}' configuration.")
-            elif "mcpServers" not in mcp_config or not isinstance(mcp_config.get("mcpServers"), dict):
-                 print_warning("MCP config 'mcpServers' key is missing or not a dictionary. Ensuring key exists.")
-                 mcp_config["mcpServers"] = {} # Ensure the key exists as a dict
-                 # Taskmaster doesn't exist in this case
-            else:
-                 # mcpServers exists and is a dict, but taskmaster isn't in it
-                 print_info(f"'{MCP_SERVER_NAME}' configuration not found in mcpServers.")
-        else:
-            print_info(f"MCP settings file not found at expected location. Will offer to create/configure.")
-            mcp_config = {"mcpServers": {}} # Initialize structure for potential writing
-    else:
-        print_warning("Could not determine MCP settings path. Skipping MCP check and configuration.")
-        # Cannot proceed with MCP config if path is unknown
-        mcp_config = None # Ensure mcp_config is None if path is None
+    ctx.mcp_config_path, ctx.mcp_config, ctx.taskmaster_mcp_exists, ctx.config_read_error = check_mcp_configuration()
 
+def stage_configure_mcp(ctx):
+    """Offers to add the taskmaster-ai server to the MCP settings."""
     # 4. Configure MCP (if needed and possible)
     # Only proceed if path is known, config read didn't fail critically, and taskmaster doesn't exist yet
-    if mcp_config is not None and mcp_config_path and not taskmaster_mcp_exists and not config_read_error:
+    if ctx.mcp_config is not None and ctx.mcp_config_path and not ctx.taskmaster_mcp_exists and not ctx.config_read_error:
         if ask_yes_no(f"Configure '{MCP_SERVER_NAME}' in Roo Code MCP settings now?", default='y'):
             print_info("Starting MCP configuration wizard...")
             # Use print_question for colored prompts
@@ -492,35 +4648,18 @@ def main():
                 if temp_str: # Only warn if they entered something invalid
                     print_warning("Invalid temperature format. Using default 0.2.")
 
-            new_mcp_entry = {
-                "command": DEFAULT_MCP_COMMAND,
-                "args": DEFAULT_MCP_ARGS,
-                "env": DEFAULT_MCP_ENV.copy(), # Make a copy to modify
-                "alwaysAllow": DEFAULT_MCP_ALWAYS_ALLOW
-            }
-            if anthropic_key:
-                new_mcp_entry["env"]["ANTHROPIC_API_KEY"] = anthropic_key
-            else:
-                print_warning("Anthropic API Key not provided. Using placeholder.")
-            if perplexity_key:
-                new_mcp_entry["env"]["PERPLEXITY_API_KEY"] = perplexity_key
-            else:
-                print_warning("Perplexity API Key not provided. Using placeholder.")
-            new_mcp_entry["env"]["TEMPERATURE"] = str(temperature) # Store as string
+            new_mcp_entry = build_mcp_entry(anthropic_key, perplexity_key, temperature)
 
             print_info("Generated MCP configuration snippet (Keys will be masked in final check):")
             # Print masked version even here for safety
             print_code(json.dumps({MCP_SERVER_NAME: mask_sensitive_mcp_data(new_mcp_entry)}, indent=2))
 
             if ask_yes_no("Add this configuration to your mcp_settings.json?", default='y'):
-                # Ensure mcpServers key exists before assignment
-                if "mcpServers" not in mcp_config or not isinstance(mcp_config.get("mcpServers"), dict):
-                    mcp_config["mcpServers"] = {}
-                mcp_config["mcpServers"][MCP_SERVER_NAME] = new_mcp_entry
-                if write_json_file(mcp_config_path, mcp_config):
+                # Locked read-merge-write that only touches our key
+                if update_mcp_server_entry(ctx.mcp_config_path, MCP_SERVER_NAME, new_mcp_entry):
                     print_info("MCP configuration updated successfully. ✅")
                     # Update flag to reflect change
-                    taskmaster_mcp_exists = True
+                    ctx.taskmaster_mcp_exists = True
                 else:
                     print_error("Failed to write updated MCP configuration.")
             else:
@@ -539,66 +4678,64 @@ def main():
             print_code(json.dumps(manual_config_display, indent=2))
             print_info("See Roo Code documentation for more details: https://docs.roocode.com/features/mcp/using-mcp-in-roo")
 
-    elif taskmaster_mcp_exists:
+    elif ctx.taskmaster_mcp_exists:
         print_info("Taskmaster MCP configuration already exists. Skipping setup.")
-    elif config_read_error:
+    elif ctx.config_read_error:
          print_warning("Skipping MCP setup due to error reading the config file.")
-    # Implicit else: mcp_config_path is None, warning already printed
+    # Implicit else: ctx.mcp_config_path is None, warning already printed
 
+def stage_pin_mcp_launch(ctx):
+    """With --mcp-launch node, makes the MCP entry start the installed server without npx."""
+    if ctx.args.mcp_launch == "node" and ctx.taskmaster_mcp_exists and ctx.mcp_config_path:
+        pin_mcp_launch(ctx.install_globally, ctx.mcp_config_path, ctx.project_dir)
 
-    # 5. Download Custom Modes/Rules
-    print_step("Downloading custom Roo modes and rules 📄")
-    roo_dir = Path(".roo")
-    # Ensure .roo exists *before* fetching rules into it
-    roo_dir.mkdir(parents=True, exist_ok=True)
-
-    # Fetch .roomodes to project root
-    roomodes_url = f"{GITHUB_BASE_URL}.roomodes"
-    local_roomodes_path = Path(".roomodes") # Place in project root
-    fetch_and_write(roomodes_url, local_roomodes_path)
-
-    # Fetch rules files into .roo/rules-{mode}/
-    rules_fetched = 0
-    for mode in ROO_MODES:
-        rule_file_name = f"{mode}-rules"
-        rule_url = f"{GITHUB_BASE_URL}rules-{mode}/{rule_file_name}"
-        local_rule_dir = roo_dir / f"rules-{mode}"
-        local_rule_path = local_rule_dir / rule_file_name
-        # Ensure the specific rule directory exists before writing
-        local_rule_dir.mkdir(parents=True, exist_ok=True)
-        if fetch_and_write(rule_url, local_rule_path):
-            rules_fetched += 1
-    print_info(f"Fetched {rules_fetched}/{len(ROO_MODES)} rule files into {roo_dir}.")
+def stage_probe_mcp(ctx):
+    """With --probe-mcp, starts the configured MCP server as Roo would and checks that its tools are there."""
+    if ctx.args.probe_mcp and ctx.taskmaster_mcp_exists and ctx.mcp_config_path:
+        print_step("Probing the MCP server 🔌")
+        print_mcp_probe_report(run_mcp_probe(ctx.mcp_config_path, ctx.args.probe_mcp))
 
+def stage_download_rules(ctx):
+    """Downloads .roomodes and the mode rule files."""
+    # 5. Download Custom Modes/Rules
+    written = sync_rules(ctx.project_dir, ctx.args.rules_source,
+                         cache=None if ctx.args.no_cache else DownloadCache(ctx.args.cache_dir), offline=ctx.args.offline,
+                         store=ContentStore(ctx.args.cache_dir, ctx.args.store_link) if ctx.args.shared_store else None,
+                         compact=ctx.args.compact_rules)
+    ctx.rules_digests = _file_digests(ctx.project_dir, written) if written else None
 
+def stage_choose_init(ctx):
+    """Decides how 'task-master init' will be run."""
     # 6. Choose Run Type for Init
-    init_command = []
-    if install_globally:
+    ctx.init_command = []
+    if ctx.install_globally:
         print_step("Choose how to run Task Master initialization 🤔")
-        while not init_command:
+        while not ctx.init_command:
             # Use print_question for colored input
             run_choice = print_question("Run 'task-master init' globally (g) or locally via npx (l)? [g/l]:").lower().strip()
             if run_choice == 'g':
-                init_command = ["task-master", "init"]
+                ctx.init_command = get_init_command("global")
             elif run_choice == 'l':
-                # Ensure correct npx command if package name differs from CLI command
-                init_command = ["npx", "task-master", "init"] # Use 'task-master init' via npx
+                ctx.init_command = get_init_command("npx")
             else:
                 print_warning("Invalid choice. Please enter 'g' or 'l'.")
     else:
         # If installed locally, must use npx
-        init_command = ["npx", "task-master", "init"] # Use 'task-master init' via npx
+        ctx.init_command = get_init_command("npx")
         print_info("Task Master installed locally, will use 'npx task-master init' for initialization.")
 
+def stage_init_project(ctx):
+    """Runs 'task-master init' interactively."""
     # 7. Initialize Task Master Project (Run interactively)
     print_step("Initializing Task Master project ✨")
     print_info("This will create project structure (like tasks/, scripts/) and configuration files.")
     print_info("You might be prompted for project details (name, description etc.).")
     print_info(f"The following command will run directly in your terminal:")
-    print(f"➡️  {COLOR_BOLD}{' '.join(init_command)}{COLOR_RESET}")
+    print(f"➡️  {COLOR_BOLD}{' '.join(ctx.init_command)}{COLOR_RESET}")
     # Use the interactive run command function
     # Set check=False because 'init' often exits successfully even after user prompts/interaction
-    success = run_command_interactive(init_command, check=False, shell=platform.system() == "Windows")
+    success = run_command_interactive(ctx.init_command, check=False, shell=platform.system() == "Windows")
+    ctx.init_ok = success
     # We rely on the user seeing the output and any errors directly
     if success:
          print_info("Task Master initialization command finished successfully (exit code 0).")
@@ -606,13 +4743,17 @@ def main():
          # This could be non-zero exit code, or failure to run the command itself
          print_warning("Task Master initialization command finished, possibly with errors or non-zero exit code. Please review the output above.")
 
-
+def stage_migrate_legacy(ctx):
+    """Migrates .cursor into .roo and removes .windsurfrules."""
     # 8. Process Cursor/Windsurf Files (Transformation and Deletion)
     # This part runs *after* init and *after* fetching rules
-    process_cursor_files(roo_dir) # Handles .cursor -> .roo merge, modify, delete .cursor
-    remove_windsurf_rules() # Handles deleting .windsurfrules
-
+    # Handles .cursor -> .roo merge, modify, delete .cursor
+    process_cursor_files(ctx.roo_dir, workers=ctx.args.migrate_workers, use_index=not ctx.args.rescan_migration,
+                         mode=ctx.args.migrate_mode)
+    remove_windsurf_rules(ctx.project_dir) # Handles deleting .windsurfrules
 
+def stage_finish(ctx):
+    """Verifies the final MCP configuration and prints reminders."""
     # 9. Final Message
     print_step("Setup Complete! 🎉")
     print_info("Task Master AI should be installed and the project initialized.")
@@ -664,11 +4805,232 @@ def main():
     print("- Ask your Roo Boomerang agent to use `taskmaster-ai` in this project.")
     print(f"\n{COLOR_GREEN}Enjoy!{COLOR_RESET}")
 
+# Stage graph for the interactive install. npm install, the MCP wizard and the rule
+# downloads do not depend on each other, so they overlap; prompts stay serialized.
+INSTALL_STAGES = [
+    Stage("choose_install", stage_choose_install, interactive=True),
+    Stage("install_package", stage_install_package, deps=["choose_install"]),
+    Stage("check_mcp", stage_check_mcp),
+    Stage("configure_mcp", stage_configure_mcp, deps=["check_mcp"], interactive=True),
+    Stage("pin_mcp_launch", stage_pin_mcp_launch, deps=["install_package", "configure_mcp"]),
+    Stage("probe_mcp", stage_probe_mcp, deps=["pin_mcp_launch"]),
+    Stage("download_rules", stage_download_rules),
+    Stage("choose_init", stage_choose_init, deps=["choose_install", "configure_mcp"], interactive=True), # Keeps prompt order
+    Stage("init_project", stage_init_project, deps=["choose_init", "install_package", "download_rules"], interactive=True),
+    Stage("migrate_legacy", stage_migrate_legacy, deps=["init_project"]),
+    Stage("finish", stage_finish, deps=["probe_mcp", "migrate_legacy"], interactive=True),
+]
+
+# --- Resumable Install ---
+
+def _file_digests(root, rel_paths):
+    """{relative path: sha256} for files under root; None for files that are missing."""
+    digests = {}
+    for rel_path in rel_paths:
+        try:
+            digests[rel_path] = hashlib.sha256((Path(root) / rel_path).read_bytes()).hexdigest()
+        except OSError:
+            digests[rel_path] = None
+    return digests
+
+class Checkpoint:
+    """How an install stage is recorded in the install state file, and when it may be skipped.
+
+    inputs(ctx) returns the JSON-serializable settings the stage's result depends
+    on; a recorded run with other inputs is redone. The ctx attributes named in
+    saves are recorded, and restored when the stage is skipped. valid(ctx, saved)
+    re-checks that the stage's effect is still in place.
+    """
+
+    def __init__(self, inputs=None, saves=(), valid=None):
+        self.inputs = inputs or (lambda ctx: {})
+        self.saves = tuple(saves)
+        self.valid = valid or (lambda ctx, saved: True)
+
+class InstallState:
+    """Completed install stages of one project, persisted after every stage (see INSTALL_STATE_NAME)."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        data = read_json_file(self.path)
+        valid = isinstance(data, dict) and data.get("version") == 1 and isinstance(data.get("stages"), dict)
+        self.stages = data["stages"] if valid else {}
+
+    def lookup(self, name, inputs):
+        """The values saved by a recorded run of stage name with the same inputs, or None."""
+        record = self.stages.get(name)
+        if not isinstance(record, dict) or record.get("inputs") != json.loads(json.dumps(inputs)):
+            return None
+        return record.get("saved", {})
+
+    def record(self, name, inputs, saved):
+        with self.lock:
+            self.stages[name] = {"inputs": inputs, "saved": saved, "completed_at": time.time()}
+            data = {"version": 1, "stages": self.stages}
+            try:
+                atomic_write_bytes(self.path, (json.dumps(data, indent=2) + "\n").encode('utf-8'))
+            except OSError as e:
+                print_warning(f"Could not record progress in {self.path}: {e}")
+
+    def clear(self):
+        with self.lock:
+            self.stages = {}
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print_warning(f"Could not remove {self.path}: {e}")
+
+def resumable(stage, checkpoint, state, forced, ran):
+    """Wraps a stage so a valid recorded run is skipped and a completed run is recorded.
+
+    A stage is redone if it is forced, its inputs changed, its effect is gone, or a
+    checkpointed stage it depends on was redone in this run (names collected in ran).
+    """
+    def run(ctx):
+        inputs = checkpoint.inputs(ctx)
+        saved = None if stage.name in forced or ran.intersection(stage.deps) else state.lookup(stage.name, inputs)
+        if saved is not None and checkpoint.valid(ctx, saved):
+            for attr in checkpoint.saves:
+                setattr(ctx, attr, saved.get(attr))
+            print_info(f"Skipping '{stage.name}': already done by an earlier run (use --force {stage.name} to redo).")
+            return
+        ran.add(stage.name)
+        stage.func(ctx)
+        state.record(stage.name, inputs, {attr: getattr(ctx, attr) for attr in checkpoint.saves})
+
+    return Stage(stage.name, run, stage.deps, stage.interactive, stage.timeout)
+
+def _mcp_launch_pinned(mcp_config_path):
+    """True if the MCP entry starts an existing script with an existing node, as pin_mcp_launch() sets it."""
+    entry = read_mcp_server_entry(mcp_config_path)
+    if entry is None or not isinstance(entry.get("args"), list):
+        return False
+    return all(isinstance(path, str) and os.path.isabs(path) and os.path.isfile(path)
+               for path in [entry.get("command")] + entry["args"][:1])
+
+def _taskmaster_still_installed(ctx, saved):
+    version, _ = find_installed_taskmaster(ctx.install_globally, ctx.project_dir)
+    return bool(version) and version_satisfies(version, ctx.args.taskmaster_version)
+
+# Stages recorded in the install state; the rest (reading MCP settings, the final
+# summary) are cheap and always run.
+INSTALL_CHECKPOINTS = {
+    "choose_install": Checkpoint(saves=["install_globally"]),
+    "install_package": Checkpoint(
+        inputs=lambda ctx: {"global": ctx.install_globally, "version": ctx.args.taskmaster_version},
+        valid=_taskmaster_still_installed),
+    "configure_mcp": Checkpoint(
+        inputs=lambda ctx: {"mcp_settings": str(ctx.mcp_config_path)},
+        saves=["taskmaster_mcp_exists"],
+        # A declined wizard stays declined; a written entry must still be there
+        valid=lambda ctx, saved: ctx.taskmaster_mcp_exists or not saved.get("taskmaster_mcp_exists")),
+    "pin_mcp_launch": Checkpoint(
+        inputs=lambda ctx: {"launch": ctx.args.mcp_launch, "global": ctx.install_globally},
+        valid=lambda ctx, saved: ctx.args.mcp_launch != "node" or _mcp_launch_pinned(ctx.mcp_config_path)),
+    "download_rules": Checkpoint(
+        inputs=lambda ctx: {"source": str(ctx.args.rules_source),
+                            "store": ctx.args.store_link if ctx.args.shared_store else None,
+                            "compact": ctx.args.compact_rules},
+        saves=["rules_digests"],
+        valid=lambda ctx, saved: bool(saved.get("rules_digests"))
+            and _file_digests(ctx.project_dir, saved["rules_digests"]) == saved["rules_digests"]),
+    "choose_init": Checkpoint(inputs=lambda ctx: {"global": ctx.install_globally}, saves=["init_command"]),
+    "init_project": Checkpoint(
+        inputs=lambda ctx: {"command": ctx.init_command},
+        saves=["init_ok"],
+        valid=lambda ctx, saved: bool(saved.get("init_ok"))),
+    "migrate_legacy": Checkpoint(
+        inputs=lambda ctx: {"mode": ctx.args.migrate_mode},
+        valid=lambda ctx, saved: not legacy_leftovers(ctx.project_dir)),
+}
+
+def run_install(args):
+    """Interactively installs and configures Taskmaster for the current project.
+
+    Completed stages are recorded in .roo/INSTALL_STATE_NAME; after a failure or
+    interruption the next run skips them. The file is removed once every stage
+    has succeeded, so the run after that starts from scratch.
+    """
+    print_step("Starting Task Master AI Installation and Setup")
+    ctx = InstallContext(args)
+    started = time.perf_counter()
+    state = InstallState(ctx.roo_dir / INSTALL_STATE_NAME)
+    forced = set(INSTALL_CHECKPOINTS) if "all" in args.force else set(args.force)
+    if set(state.stages) - forced:
+        print_info(f"Resuming the previous install recorded in {state.path} "
+                   f"({len(state.stages)} stages done).")
+    ran = set()
+    stages = []
+    for stage in INSTALL_STAGES:
+        stage = stage.with_timeout(args.stage_timeouts.get(stage.name))
+        if stage.name in INSTALL_CHECKPOINTS:
+            stage = resumable(stage, INSTALL_CHECKPOINTS[stage.name], state, forced, ran)
+        stages.append(stage)
+    try:
+        results = run_stages(stages, ctx)
+    except InstallAborted:
+        print_info(f"Completed stages are recorded in {state.path}; run the installer again to resume.")
+        return 1
+    elapsed = time.perf_counter() - started
+    stage_total = sum(seconds for _, seconds in results.values())
+    failed = [name for name, (status, _) in results.items() if status != "ok"]
+    print_info(f"Ran {len(results)} stages in {elapsed:.1f}s (sum of stage times: {stage_total:.1f}s).")
+    if failed:
+        print_warning(f"Stages that did not complete: {', '.join(failed)}")
+        print_info(f"Run the installer again to resume; completed stages are recorded in {state.path}.")
+    else:
+        state.clear()
+    return 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "pack":
+        if args.report:
+            return report_rules_context(args.source_dir)
+        return pack_rules(args.source_dir, args.output_dir or args.source_dir, fmt=args.format, check=args.check)
+    if args.command == "bundle":
+        cache = None if args.no_cache else DownloadCache(args.cache_dir)
+        return build_offline_bundle(args.output, args.rules_source, args.taskmaster_version, cache=cache)
+    if args.command == "watch":
+        cache = None if args.no_cache else DownloadCache(args.cache_dir)
+        store = ContentStore(args.cache_dir, args.store_link) if args.shared_store else None
+        return watch_rules(args.project_dir, args.rules_source, cache=cache, offline=args.offline, store=store,
+                           compact=args.compact_rules, interval=args.interval, debounce=args.debounce, poll=args.poll)
+    if args.command == "status":
+        return run_status(args)
+    if args.command == "probe":
+        return run_probe(args)
+    if args.command == "audit":
+        return run_audit(args)
+    profiler = start_profiling() if args.profile else None
+    set_install_deadline(args.deadline)
+    set_command_log(args.command_log)
+    set_retry_policy(RetryPolicy(args.retries, hedge=args.hedge))
+    try:
+        if args.from_bundle and not use_offline_bundle(args):
+            return 1
+        if args.command == "fleet":
+            return run_fleet(args)
+        return run_install(args)
+    finally:
+        if profiler:
+            stop_profiling()
+            profiler.print_summary()
+            try:
+                profiler.write(args.profile)
+                print_info(f"Profile trace written to {args.profile} (open it in https://ui.perfetto.dev or chrome://tracing).")
+            except OSError as e:
+                print_error(f"Could not write profile trace {args.profile}: {e}")
+
 
 if __name__ == "__main__":
     try:
-        main()
+        sys.exit(main())
     except KeyboardInterrupt:
+        stop_all_processes()
         print("\nOperation cancelled by user.")
         sys.exit(1)
     except Exception as e: